@@ -8,6 +8,13 @@ import logging
 import datetime
 from io import BytesIO
 
+from desc_normalizer import clean_checklist_desc, clean_invoice_desc
+from duty_snapshot import DutySnapshotStore
+from workbook_cache import ParsedWorkbookCache
+from excel_reader import engine_version, pop_engine_option, set_reader_engine
+from invoice_sheets import (DEFAULT_SHEET_WORKERS, InvoiceWorkbook, add_file_suffixes, map_invoice_workbooks,
+                            expand_invoice_paths, open_workbook, read_invoice_sheet)
+
 # Set up logging
 log_dir = "logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -109,7 +116,8 @@ with st.sidebar:
     checklist_file = st.file_uploader("上传核对清单 (processing_checklist.xlsx)", type=["xlsx"])
 
     # Upload invoices file
-    invoices_file = st.file_uploader("上传发票文件 (processing_invoices*.xlsx)", type=["xlsx"])
+    # Upload invoices files (several invoice workbooks can be processed in one run)
+    invoices_files = st.file_uploader("上传发票文件 (processing_invoices*.xlsx)", type=["xlsx"], accept_multiple_files=True)
 
     # Process button
     process_button = st.button("开始处理", type="primary")
@@ -133,8 +141,16 @@ tab1, tab2, tab3, tab4 = st.tabs(["文件上传", "数据预览", "处理结果"
 def get_duty_rates(file_path):
     logging.info(f"Reading duty rates from: {file_path}")
     try:
+        # 税率文件内容不变时直接读取二进制快照
+        snapshot_store = DutySnapshotStore()
+        snapshot_key = snapshot_store.snapshot_key(file_path, f"app:{engine_version()}")
+        snapshot = snapshot_store.load(snapshot_key)
+        if snapshot is not None:
+            duty_dict, df, _ = snapshot
+            return duty_dict, df
+
         # Read duty_rate.xlsx
-        df = pd.read_excel(file_path)
+        df = ParsedWorkbookCache().read_excel(file_path)
         logging.info(f"Duty rate file loaded. Shape: {df.shape}")
         logging.info(f"Duty rate columns: {df.columns.tolist()}")
 
@@ -163,6 +179,7 @@ def get_duty_rates(file_path):
             }
 
         logging.info(f"Created duty dictionary with {len(duty_dict)} items")
+        snapshot_store.save(snapshot_key, duty_dict, df)
         return duty_dict, df
     except Exception as e:
         error_msg = f"读取税率文件失败: {str(e)}"
@@ -170,32 +187,60 @@ def get_duty_rates(file_path):
         st.error(error_msg)
         return {}, None
 
-def process_invoice_file(file_path, duty_rates):
-    logging.info(f"Processing invoice file: {file_path}")
-    try:
-        # Get all sheet names
-        excel_file = pd.ExcelFile(file_path)
-        all_sheet_names = excel_file.sheet_names
-        logging.info(f"All sheet names in invoice file: {all_sheet_names}")
+def process_invoice_file(file_path, duty_rates, workers=DEFAULT_SHEET_WORKERS):
+    return process_invoice_files([file_path], duty_rates, workers)
 
-        # Store original sheet names for accessing sheets
-        original_sheet_names = excel_file.sheet_names[1:]  # Skip the first sheet
-        logging.info(f"Processing sheets (skipping first): {original_sheet_names}")
 
-        # Process sheet names for display and ID creation (remove CI- prefix)
-        processed_sheet_names = [name.replace('CI-', '') if name.startswith('CI-') else name
-                      for name in original_sheet_names]
-        logging.info(f"Processed sheet names: {processed_sheet_names}")
+def process_invoice_files(file_paths, duty_rates, workers=DEFAULT_SHEET_WORKERS, progress_callback=None):
+    logging.info(f"Processing invoice files: {file_paths}")
+    try:
+        # Open each workbook once; file_paths may also contain already open InvoiceWorkbook sessions
+        workbooks = [open_workbook(file_path) for file_path in file_paths]
+
+        original_sheet_names_per_file = []
+        processed_sheet_names_per_file = []
+        for workbook in workbooks:
+            # Get all sheet names
+            all_sheet_names = workbook.sheet_names
+            logging.info(f"All sheet names in invoice file {workbook}: {all_sheet_names}")
+
+            # Store original sheet names for accessing sheets
+            original_sheet_names = all_sheet_names[1:]  # Skip the first sheet
+            logging.info(f"Processing sheets (skipping first): {original_sheet_names}")
+            original_sheet_names_per_file.append(original_sheet_names)
+
+            # Process sheet names for display and ID creation (remove CI- prefix)
+            processed_sheet_names_per_file.append([name.replace('CI-', '') if name.startswith('CI-') else name
+                                                   for name in original_sheet_names])
+        # Sheets with the same name in different files get the file suffix, as in processing_invoices.py
+        processed_sheet_names_per_file = add_file_suffixes(processed_sheet_names_per_file,
+                                                           [workbook.name for workbook in workbooks])
+        logging.info(f"Processed sheet names: {processed_sheet_names_per_file}")
 
         # Initialize DataFrames for results
         all_invoices_df = pd.DataFrame()
         new_descriptions_df = pd.DataFrame()
+        sheet_frames = []
+        new_item_rows = []
+
+        # Read the sheets of all files on one worker pool, keeping the original file and sheet order
+        sheet_dfs_per_file = map_invoice_workbooks(
+            read_invoice_sheet,
+            [(workbook, [(sheet_name,) for sheet_name in original_sheet_names])
+             for workbook, original_sheet_names in zip(workbooks, original_sheet_names_per_file)],
+            workers, progress_callback
+        )
+        for workbook, file_path in zip(workbooks, file_paths):
+            if workbook is not file_path:
+                workbook.close()
+
+        original_sheet_names = [name for names in original_sheet_names_per_file for name in names]
+        processed_sheet_names = [name for names in processed_sheet_names_per_file for name in names]
+        sheet_dfs = [df for dfs in sheet_dfs_per_file for df in dfs]
 
         # Process each sheet
-        for i, (original_sheet_name, processed_sheet_name) in enumerate(zip(original_sheet_names, processed_sheet_names)):
+        for i, (original_sheet_name, processed_sheet_name, df) in enumerate(zip(original_sheet_names, processed_sheet_names, sheet_dfs)):
             logging.info(f"Processing sheet {i+1}/{len(original_sheet_names)}: {original_sheet_name}")
-            # Read the sheet
-            df = pd.read_excel(file_path, sheet_name=original_sheet_name)
             logging.info(f"Sheet data loaded. Shape: {df.shape}")
             if not df.empty:
                 logging.info(f"First few columns: {df.columns[:5].tolist() if len(df.columns) > 5 else df.columns.tolist()}")
@@ -226,7 +271,7 @@ def process_invoice_file(file_path, duty_rates):
                     sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: str(x).split('-')[0].strip() if pd.notna(x) and '-' in str(x) else x)
                 elif new_name == 'Desc':
                     # Clean the description text to only keep alphanumeric, dots, hyphens and parentheses
-                    sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: ''.join(char.upper() for char in str(x) if char.isalnum() or char in '.()').replace('Φ', '').replace('Ω', '').replace('-', '').replace('φ', '') if pd.notna(x) else x)
+                    sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: clean_invoice_desc(x) if pd.notna(x) else x)
                 else:
                     sheet_df[new_name] = df.iloc[:, idx]
 
@@ -260,22 +305,25 @@ def process_invoice_file(file_path, duty_rates):
                         if itemName not in unique_desc:
                             unique_desc.add(itemName)
                             new_items_count += 1
-                            # Add unmatched items to new_descriptions_df
-                            new_descriptions_df = pd.concat([new_descriptions_df, pd.DataFrame({
-                                '发票及项号': [row['ID']],
-                                'Item Name': [itemName],
-                                'Final BCD': [''],
-                                'Final SWS': [''],
-                                'Final IGST': [''],
-                                'HSN1': [''],
-                            })], ignore_index=True)
+                            # 先收集未匹配的项目，所有工作表处理完后一次生成new_descriptions_df
+                            new_item_rows.append({
+                                '发票及项号': row['ID'],
+                                'Item Name': itemName,
+                                'Final BCD': '',
+                                'Final SWS': '',
+                                'Final IGST': '',
+                                'HSN1': '',
+                            })
 
             logging.info(f"Found {new_items_count} new items in sheet {original_sheet_name}")
 
-            # Add this sheet's data to the combined DataFrame
-            all_invoices_df = pd.concat([all_invoices_df, sheet_df], ignore_index=True)
-            logging.info(f"Added sheet data to combined DataFrame. Current size: {all_invoices_df.shape}")
+            # 先收集各工作表的数据，最后一次拼接
+            sheet_frames.append(sheet_df)
 
+        if sheet_frames:
+            all_invoices_df = pd.concat(sheet_frames, ignore_index=True)
+        if new_item_rows:
+            new_descriptions_df = pd.DataFrame(new_item_rows)
         logging.info(f"Completed processing invoice file. Final DataFrame shape: {all_invoices_df.shape}")
         logging.info(f"New items found: {len(new_descriptions_df)}")
 
@@ -293,11 +341,14 @@ def process_invoice_file(file_path, duty_rates):
         st.error(error_msg)
         return pd.DataFrame(), pd.DataFrame()
 
+# 处理核对清单用到的列，只读取这些列
+CHECKLIST_COLUMNS = ['P/N', 'Item#', 'Desc', 'Qty', 'Price', 'HSN', 'Duty', 'Welfare', 'IGST']
+
 def process_checklist(file_path):
     logging.info(f"Processing checklist file: {file_path}")
     try:
         # 读取Excel文件
-        df = pd.read_excel(file_path, skiprows=3)
+        df = ParsedWorkbookCache().read_excel(file_path, skiprows=3, usecols=CHECKLIST_COLUMNS)
         logging.info(f"Checklist file loaded. Shape: {df.shape}")
         logging.info(f"Checklist columns: {df.columns.tolist()}")
 
@@ -339,17 +390,8 @@ def process_checklist(file_path):
                     item_name = str(row['Desc']).split('-')[0] if pd.notna(row['Desc']) else ''
                     item_count += 1
 
-                    # 修改item_name的处理逻辑
-                    desc = ''
-                    if pd.notna(row['Desc']):
-                        # 分割字符串，取"-PART NO"之前的部分
-                        desc_parts = str(row['Desc']).split('-PART NO')
-                        desc = desc_parts[0]
-                        # 只保留字母数字和点号，并转换为大写
-                        desc = desc.replace('+OR-', '')
-                        desc = desc.replace('DEG', '')
-                        desc = desc.replace('-', '')
-                        desc = ''.join(char for char in desc if char.isalnum() or char in '.()').upper()
+                    # 清理描述：取"-PART NO"之前的部分，只保留字母数字和 .() 并转为大写
+                    desc = clean_checklist_desc(row['Desc']) if pd.notna(row['Desc']) else ''
 
                     result_rows.append({
                         'Item#': row['Item#'],
@@ -593,11 +635,17 @@ with tab1:
     with col3:
         st.markdown("<div class='info-box'>", unsafe_allow_html=True)
         st.markdown("### 发票文件")
-        if invoices_file is not None:
-            st.success(f"已上传: {invoices_file.name}")
-            # Save the uploaded file
-            with open(os.path.join("input", "processing_invoices.xlsx"), "wb") as f:
-                f.write(invoices_file.getbuffer())
+        if invoices_files:
+            # Save the uploaded files as processing_invoices.xlsx, or processing_invoices1.xlsx,
+            # processing_invoices2.xlsx, ... when several files are uploaded
+            invoice_workbooks = []
+            for i, invoices_file in enumerate(invoices_files, start=1):
+                st.success(f"已上传: {invoices_file.name}")
+                invoices_path = os.path.join("input", f"processing_invoices{i if len(invoices_files) > 1 else ''}.xlsx")
+                with open(invoices_path, "wb") as f:
+                    f.write(invoices_file.getbuffer())
+                # The preview and the processing step share one workbook session per file
+                invoice_workbooks.append(InvoiceWorkbook(invoices_path, cache=ParsedWorkbookCache()))
         else:
             st.warning("请上传发票文件")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -611,7 +659,7 @@ with tab2:
     with preview_tabs[0]:
         if duty_rate_file is not None:
             try:
-                duty_df = pd.read_excel(duty_rate_file)
+                duty_df = ParsedWorkbookCache().read_excel(os.path.join("input", "duty_rate.xlsx"))
                 st.dataframe(duty_df, use_container_width=True)
             except Exception as e:
                 st.error(f"无法预览税率文件: {str(e)}")
@@ -621,7 +669,7 @@ with tab2:
     with preview_tabs[1]:
         if checklist_file is not None:
             try:
-                checklist_df = pd.read_excel(checklist_file, skiprows=3)
+                checklist_df = ParsedWorkbookCache().read_excel(os.path.join("input", "processing_checklist.xlsx"), skiprows=3)
                 st.dataframe(checklist_df, use_container_width=True)
             except Exception as e:
                 st.error(f"无法预览核对清单: {str(e)}")
@@ -629,14 +677,18 @@ with tab2:
             st.info("请先上传核对清单")
 
     with preview_tabs[2]:
-        if invoices_file is not None:
+        if invoices_files:
             try:
-                excel_file = pd.ExcelFile(invoices_file)
-                sheet_names = excel_file.sheet_names[1:]  # Skip the first sheet
+                if len(invoice_workbooks) > 1:
+                    invoice_workbook = st.selectbox("选择发票文件", invoice_workbooks,
+                                                    format_func=lambda workbook: os.path.basename(workbook.path))
+                else:
+                    invoice_workbook = invoice_workbooks[0]
+                sheet_names = invoice_workbook.sheet_names[1:]  # Skip the first sheet
 
                 if sheet_names:
                     selected_sheet = st.selectbox("选择发票工作表", sheet_names)
-                    invoices_df = pd.read_excel(invoices_file, sheet_name=selected_sheet)
+                    invoices_df = invoice_workbook.sheet(selected_sheet)
                     st.dataframe(invoices_df, use_container_width=True)
                 else:
                     st.warning("发票文件中没有找到工作表")
@@ -681,13 +733,13 @@ if process_button:
                 logging.info(f"Output file: {file}, Size: {file_size} bytes")
 
     # Check for required files
-    if duty_rate_file is None or checklist_file is None or invoices_file is None:
+    if duty_rate_file is None or checklist_file is None or not invoices_files:
         missing_files = []
         if duty_rate_file is None:
             missing_files.append("税率文件")
         if checklist_file is None:
             missing_files.append("核对清单")
-        if invoices_file is None:
+        if not invoices_files:
             missing_files.append("发票文件")
         error_msg = f"请先上传所有必要的文件: {', '.join(missing_files)}"
         logging.error(error_msg)
@@ -696,17 +748,18 @@ if process_button:
         # Log uploaded file information
         logging.info(f"Duty rate file: {duty_rate_file.name}, Size: {len(duty_rate_file.getvalue())} bytes")
         logging.info(f"Checklist file: {checklist_file.name}, Size: {len(checklist_file.getvalue())} bytes")
-        logging.info(f"Invoices file: {invoices_file.name}, Size: {len(invoices_file.getvalue())} bytes")
+        for invoices_file in invoices_files:
+            logging.info(f"Invoices file: {invoices_file.name}, Size: {len(invoices_file.getvalue())} bytes")
 
         logging.info("Starting data processing workflow")
         with st.spinner("正在处理数据..."):
             try:
                 # Log input file paths
                 duty_rate_path = os.path.join("input", "duty_rate.xlsx")
-                invoices_path = os.path.join("input", "processing_invoices.xlsx")
+                invoices_paths = [workbook.path for workbook in invoice_workbooks]
                 checklist_path = os.path.join("input", "processing_checklist.xlsx")
 
-                logging.info(f"Input files: duty_rate={duty_rate_path}, invoices={invoices_path}, checklist={checklist_path}")
+                logging.info(f"Input files: duty_rate={duty_rate_path}, invoices={invoices_paths}, checklist={checklist_path}")
 
                 # Process duty rates
                 logging.info("Step 1: Processing duty rates")
@@ -714,7 +767,13 @@ if process_button:
 
                 # Process invoices
                 logging.info("Step 2: Processing invoices")
-                processed_invoices, new_items = process_invoice_file(invoices_path, duty_rates)
+                invoice_progress = st.progress(0.0, text=f"正在处理发票文件 0/{len(invoice_workbooks)}")
+
+                def show_invoice_progress(done, total, workbook):
+                    invoice_progress.progress(done / total, text=f"已处理发票文件 {done}/{total}: {os.path.basename(workbook.path)}")
+
+                processed_invoices, new_items = process_invoice_files(invoice_workbooks, duty_rates,
+                                                                      progress_callback=show_invoice_progress)
 
                 # Process checklist
                 logging.info("Step 3: Processing checklist")
@@ -796,7 +855,7 @@ with tab3:
         processed_invoices_path = os.path.join("output", "processed_invoices.xlsx")
         if os.path.exists(processed_invoices_path):
             try:
-                processed_invoices_df = pd.read_excel(processed_invoices_path)
+                processed_invoices_df = ParsedWorkbookCache().read_excel(processed_invoices_path)
                 st.dataframe(processed_invoices_df, use_container_width=True)
 
                 # Download button
@@ -816,7 +875,7 @@ with tab3:
         processed_checklist_path = os.path.join("output", "processed_checklist.xlsx")
         if os.path.exists(processed_checklist_path):
             try:
-                processed_checklist_df = pd.read_excel(processed_checklist_path)
+                processed_checklist_df = ParsedWorkbookCache().read_excel(processed_checklist_path)
                 st.dataframe(processed_checklist_df, use_container_width=True)
 
                 # Download button
@@ -836,11 +895,11 @@ with tab3:
         new_items_path = os.path.join("output", "added_new_items.xlsx")
         if os.path.exists(new_items_path):
             try:
-                excel_file = pd.ExcelFile(new_items_path)
-                sheet_names = excel_file.sheet_names
+                new_items_workbook = InvoiceWorkbook(new_items_path, cache=ParsedWorkbookCache())
+                sheet_names = new_items_workbook.sheet_names
 
                 if 'newDutyRate' in sheet_names:
-                    new_items_df = pd.read_excel(new_items_path, sheet_name='newDutyRate')
+                    new_items_df = new_items_workbook.sheet('newDutyRate')
                     if not new_items_df.empty:
                         st.dataframe(new_items_df, use_container_width=True)
 
@@ -868,7 +927,7 @@ with tab4:
     diff_report_path = os.path.join("output", "processed_report.xlsx")
     if os.path.exists(diff_report_path):
         try:
-            diff_report_df = pd.read_excel(diff_report_path)
+            diff_report_df = ParsedWorkbookCache().read_excel(diff_report_path)
             if not diff_report_df.empty:
                 st.dataframe(diff_report_df, use_container_width=True)
 
@@ -897,13 +956,24 @@ if __name__ == "__main__":
     logging.info("APP RUNNING IN DIRECT MODE (NOT THROUGH STREAMLIT)")
     logging.info("="*50)
 
+    # Optional --engine=auto|calamine|openpyxl selects the Excel reader backend
+    reader_engine, remaining_args = pop_engine_option(sys.argv[1:])
+    if reader_engine is not None:
+        try:
+            set_reader_engine(reader_engine)
+        except ValueError as e:
+            print(str(e))
+            sys.exit(1)
+        sys.argv = sys.argv[:1] + remaining_args
+
     # Check if command line arguments were provided
     if len(sys.argv) > 1:
         logging.info(f"Command line arguments detected: {sys.argv[1:]}")
 
         # If arguments are provided, use them directly
         if len(sys.argv) >= 7:
-            invoices_file = sys.argv[1]
+            # Several invoice files can be given separated by commas or as a wildcard pattern
+            invoices_files = expand_invoice_paths(sys.argv[1])
             checklist_file = sys.argv[2]
             duty_rate_file = sys.argv[3]
             output_invoices = sys.argv[4]
@@ -911,7 +981,7 @@ if __name__ == "__main__":
             output_report = sys.argv[6]
 
             logging.info(f"Using provided arguments:")
-            logging.info(f"  Invoices file: {invoices_file}")
+            logging.info(f"  Invoices files: {invoices_files}")
             logging.info(f"  Checklist file: {checklist_file}")
             logging.info(f"  Duty rate file: {duty_rate_file}")
             logging.info(f"  Output invoices: {output_invoices}")
@@ -925,7 +995,19 @@ if __name__ == "__main__":
 
                 # Process invoices
                 logging.info("Step 2: Processing invoices")
-                processed_invoices, new_items = process_invoice_file(invoices_file, duty_rates)
+                workers = DEFAULT_SHEET_WORKERS
+                if len(sys.argv) > 8:
+                    try:
+                        workers = max(1, int(sys.argv[8]))
+                        logging.info(f"Using {workers} worker processes for sheet parsing")
+                    except ValueError:
+                        logging.warning(f"Invalid worker count provided: {sys.argv[8]}, using default: {workers}")
+
+                def print_invoice_progress(done, total, workbook):
+                    print(f"已处理发票文件 {done}/{total}: {workbook.path}")
+
+                processed_invoices, new_items = process_invoice_files(invoices_files, duty_rates, workers,
+                                                                      print_invoice_progress)
 
                 # Process checklist
                 logging.info("Step 3: Processing checklist")
@@ -970,11 +1052,11 @@ if __name__ == "__main__":
                 sys.exit(1)
         else:
             logging.error(f"Insufficient arguments provided. Expected at least 6, got {len(sys.argv)-1}")
-            print("Usage: python app.py <invoices_file> <checklist_file> <duty_rate_file> <output_invoices> <output_checklist> <output_report> [price_tolerance]")
+            print("Usage: python app.py <invoices_file[,invoices_file...]|pattern> <checklist_file> <duty_rate_file> <output_invoices> <output_checklist> <output_report> [price_tolerance] [workers] [--engine=auto|calamine|openpyxl]")
             sys.exit(1)
     else:
         logging.warning("No command line arguments provided when running directly")
         print("This script is designed to be run through Streamlit or with command line arguments.")
-        print("Usage: python app.py <invoices_file> <checklist_file> <duty_rate_file> <output_invoices> <output_checklist> <output_report> [price_tolerance]")
+        print("Usage: python app.py <invoices_file[,invoices_file...]|pattern> <checklist_file> <duty_rate_file> <output_invoices> <output_checklist> <output_report> [price_tolerance] [workers] [--engine=auto|calamine|openpyxl]")
         print("Or: streamlit run app.py")
         sys.exit(1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+核对清单读取的峰值内存对比：pd.read_excel 一次性读取 vs 流式分块读取
+
+用法: python benchmark_checklist_memory.py [行数] [每块行数]   (默认20000行，每块5000行)
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from openpyxl import Workbook
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from checklist_reader import CHECKLIST_READ_KWARGS, ChecklistStream, DEFAULT_CHECKLIST_CHUNK_ROWS
+
+COLUMNS = ['P/N', 'Desc', 'HSN', 'Duty', 'BCD', 'SWS', 'Cus AIDC', 'Hlth Cess', 'PCS', 'Edu Cess',
+           'Sec Higher Edu Cess', 'Cus Edu Cess', 'Cus Sec Higher Edu Cess', 'GST Cess', 'Qty', 'Price',
+           'Category', 'Item#', 'TxtLine', 'Cus Notn', 'Value Amt']
+
+
+def write_checklist(file_path, rows, seed=7):
+    """生成与真实核对清单结构相同的文件：每30行一个发票行"""
+    rng = random.Random(seed)
+    words = ['RESISTOR', 'CAPACITOR', 'IC', 'SENSOR', 'LENS', 'PCBA', 'CABLE', 'ADAPTER']
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Import CheckList'])
+    sheet.append([])
+    sheet.append(['Generated by benchmark'])
+    sheet.append(COLUMNS)
+    item_num = 0
+    for row_number in range(rows):
+        if row_number % 30 == 0:
+            sheet.append([f"Invoice: 24HC{row_number // 30:05d}-1S dt. 27-Dec-2024   Invoice 1 / 30"])
+            item_num = 0
+            continue
+        item_num += 1
+        part_no = f"1.2.{rng.randint(0, 99):02d}.{rng.randint(0, 99):02d}.{rng.randint(0, 9999):04d}"
+        sheet.append([
+            part_no, f"{rng.choice(words)}-{rng.randint(1, 999)}R-+OR-5%-PART NO.{part_no} MODEL NO.IPC-DK2",
+            rng.randint(84000000, 85999999), 11, rng.choice([0, 10, 22]), 18, None, None, None, None,
+            None, None, None, None, rng.randint(1, 20000), rng.random(), 'IPC-DK2-3H1W', item_num,
+            item_num * 8 + 7, '024/2005 24', rng.random() * 1000,
+        ])
+    workbook.save(file_path)
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, elapsed
+
+
+def read_whole(file_path):
+    pd.read_excel(file_path, **CHECKLIST_READ_KWARGS)
+
+
+def read_streamed(file_path, chunk_rows):
+    for _ in ChecklistStream(file_path, chunk_rows=chunk_rows).iter_chunks():
+        pass
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chunk_rows = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CHECKLIST_CHUNK_ROWS
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'checklist.xlsx')
+        write_checklist(file_path, rows)
+        print(f"核对清单: {rows} 行, {os.path.getsize(file_path) / 1024 / 1024:.1f} MB")
+
+        whole_peak, whole_time = peak_memory(read_whole, file_path)
+        stream_peak, stream_time = peak_memory(read_streamed, file_path, chunk_rows)
+        print(f"pd.read_excel 一次性读取: 峰值 {whole_peak:.1f} MB, {whole_time:.1f}s")
+        print(f"流式读取 (每块{chunk_rows}行): 峰值 {stream_peak:.1f} MB, {stream_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
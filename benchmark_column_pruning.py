@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读取需要的列（usecols）的内存对比：核对清单和发票工作簿，读取所有列 vs 只读处理用到的列
+
+用法: python benchmark_column_pruning.py [核对清单] [发票文件]   (默认使用526input/中最大的两个文件)
+"""
+
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from checklist_reader import CHECKLIST_SKIPROWS, checklist_usecols, map_checklist_columns
+from excel_reader import read_excel, resolve_engine
+from invoice_layout import LayoutDetector
+from invoice_sheets import InvoiceWorkbook, parse_invoice_sheet
+
+CHECKLIST_PATH = "526input/Test1-Import_CheckList(SI_M_10911_24-25).CheckList.Data.xlsx"
+# 文件名中是不间断空格
+INVOICE_PATH = "526input/Test1-24HC01723,33\u00a0-\u00a0ALL.xlsx"
+
+
+def peak_memory(func, *args):
+    """
+    返回 (峰值内存MB, 耗时秒, 读取结果占用的内存MB)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    frames = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sum(df.memory_usage(deep=True).sum() for df in frames)
+    return peak / 1024 / 1024, elapsed, retained / 1024 / 1024
+
+
+def read_checklist_full(file_path):
+    return [read_excel(file_path, skiprows=CHECKLIST_SKIPROWS)]
+
+
+def read_checklist_pruned(file_path):
+    columns = read_excel(file_path, skiprows=CHECKLIST_SKIPROWS, nrows=0).columns
+    usecols = checklist_usecols(columns, map_checklist_columns(columns))
+    return [read_excel(file_path, skiprows=CHECKLIST_SKIPROWS, usecols=usecols)]
+
+
+def read_invoices(file_path, full):
+    """
+    解析发票文件的所有工作表，返回会话中保留的工作表DataFrame
+    """
+    detector = LayoutDetector()
+    with InvoiceWorkbook(file_path) as workbook:
+        for sheet_name in workbook.sheet_names[1:]:
+            if full:
+                workbook.sheet(sheet_name)
+            parse_invoice_sheet(workbook, sheet_name, sheet_name, layout_detector=detector)
+        return list(workbook._sheets.values())
+
+
+def report(label, full, pruned):
+    print(f"{label}:")
+    print(f"  读取所有列: 峰值 {full[0]:.1f} MB, 结果 {full[2]:.2f} MB, {full[1]:.2f}s")
+    print(f"  只读需要的列: 峰值 {pruned[0]:.1f} MB, 结果 {pruned[2]:.2f} MB, {pruned[1]:.2f}s")
+    print(f"  峰值变化 {pruned[0] / full[0] - 1:+.0%}, 结果变化 {pruned[2] / full[2] - 1:+.0%}")
+
+
+def main():
+    checklist_path = sys.argv[1] if len(sys.argv) > 1 else CHECKLIST_PATH
+    invoice_path = sys.argv[2] if len(sys.argv) > 2 else INVOICE_PATH
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+    print(f"读取引擎: {resolve_engine()}")
+
+    if os.path.exists(checklist_path):
+        report(f"核对清单 {checklist_path}",
+               peak_memory(read_checklist_full, checklist_path),
+               peak_memory(read_checklist_pruned, checklist_path))
+    else:
+        print(f"⚠️ 核对清单不存在: {checklist_path}")
+
+    if os.path.exists(invoice_path):
+        report(f"发票文件 {invoice_path}",
+               peak_memory(read_invoices, invoice_path, True),
+               peak_memory(read_invoices, invoice_path, False))
+    else:
+        print(f"⚠️ 发票文件不存在: {invoice_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+税率表汇总的性能对比：逐行(lambda/iterrows)实现 vs 向量化实现
+
+用法: python benchmark_duty_rates.py [行数]   (默认50000行)
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_duty_table(rows=50000, seed=5):
+    """构造税率表：重复的Item Name、各种空白字符、缺失的HSN1/HSN2"""
+    rng = random.Random(seed)
+    words = ['CAMERA', 'IPC', 'DOME', 'LENS', 'PCBA', 'CABLE', 'POWER', 'ADAPTER', 'BRACKET', 'IC', 'LED', 'MODULE']
+    spaces = [' ', '  ', '\xa0', '\t', ' \n', '　', '\x1c']
+    names = []
+    for _ in range(rows // 3):
+        names.append(rng.choice(spaces).join(rng.choice(words) for _ in range(rng.randint(1, 4))) +
+                     str(rng.randint(0, 999)))
+
+    item_names = []
+    for _ in range(rows):
+        name = rng.choice(names)
+        roll = rng.random()
+        if roll < 0.1:
+            name = rng.choice(spaces) + name + rng.choice(spaces)
+        elif roll < 0.12:
+            name = rng.choice([None, '', ' \xa0 '])
+        item_names.append(name)
+
+    hsn1 = [np.nan if rng.random() < 0.15 else rng.randint(84000000, 85999999) for _ in range(rows)]
+    hsn2 = [rng.randint(84000000, 85999999) if rng.random() < 0.3 else np.nan for _ in range(rows)]
+    return pd.DataFrame({
+        'Item Name': item_names,
+        'HSN1': hsn1,
+        'HSN2': hsn2,
+        'Final BCD': [rng.choice([0.0, 7.5, 10.0, 15.0, 20.0]) for _ in range(rows)],
+        'Final SWS': [rng.choice([0, 10]) for _ in range(rows)],
+        'Final IGST': [rng.choice([5, 12, 18, 28]) for _ in range(rows)],
+    })
+
+
+def legacy_clean_item_names(item_names):
+    """原来的逐行清理"""
+    cleaned = item_names.apply(lambda x:
+        str(x).strip()
+        .replace('\xa0', ' ')
+        .replace('\t', ' ')
+        .replace('\n', ' ')
+        .replace('\r', ' ')
+        if pd.notna(x) else ''
+    )
+    return cleaned.apply(lambda x: ' '.join(x.split()) if x else '')
+
+
+def legacy_aggregate_duty_rates(df):
+    """原来的 lambda 聚合 + iterrows 构建字典"""
+    agg_dict = {
+        'HSN1': lambda x: ' '.join(str(i) for i in x if pd.notna(i)),
+        'Final BCD': 'min',
+        'Final SWS': 'min',
+        'Final IGST': 'min'
+    }
+    if 'HSN2' in df.columns:
+        agg_dict['HSN2'] = lambda x: ' '.join(str(i) for i in x if pd.notna(i))
+
+    grouped_df = df.groupby('Item Name').agg(agg_dict).reset_index()
+
+    duty_dict = {}
+    for _, row in grouped_df.iterrows():
+        hsn_value = row['HSN1']
+        if 'HSN2' in grouped_df.columns and (pd.isna(hsn_value) or str(hsn_value).strip() == ''):
+            hsn_value = row['HSN2']
+        item_name = row['Item Name']
+        if item_name and item_name.strip():
+            duty_dict[item_name] = {
+                'hsn': hsn_value,
+                'bcd': row['Final BCD'],
+                'sws': row['Final SWS'],
+                'igst': row['Final IGST']
+            }
+    return duty_dict
+
+
+def legacy_pipeline(df):
+    df = df.copy()
+    df['Item Name'] = legacy_clean_item_names(df['Item Name'])
+    df = df[df['Item Name'].str.strip() != '']
+    return legacy_aggregate_duty_rates(df)
+
+
+def vectorized_pipeline(df):
+    from streamlit_app import clean_item_names
+    from duty_rates import aggregate_duty_rates
+
+    df = df.copy()
+    df['Item Name'] = clean_item_names(df['Item Name'])
+    df = df[df['Item Name'].str.strip() != '']
+    return aggregate_duty_rates(df)
+
+
+def best_time(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    logging.disable(logging.INFO)
+
+    df = build_duty_table(rows)
+    print(f"税率表: {len(df)} 行")
+
+    # 导入streamlit_app（首次导入会执行页面代码）后再计时
+    vectorized_pipeline(df.head(10))
+
+    legacy_time, legacy_dict = best_time(legacy_pipeline, df)
+    vector_time, vector_dict = best_time(vectorized_pipeline, df)
+    assert vector_dict == legacy_dict, "向量化结果与原实现不一致"
+    print(f"streamlit_app.get_duty_rates 清理+汇总 ({len(vector_dict)} 个Item): "
+          f"原实现 {legacy_time:.3f}s, 向量化 {vector_time:.3f}s, 提速 {legacy_time / vector_time:.1f}x")
+
+    # processing_invoices.get_duty_rates 不清理Item Name，直接汇总
+    import processing_invoices
+    raw_df = df[df['Item Name'].notna() & (df['Item Name'].str.strip() != '')]
+    with mock.patch('pandas.read_excel', return_value=raw_df):
+        vector_time, vector_dict = best_time(processing_invoices.get_duty_rates)
+    legacy_time, legacy_dict = best_time(legacy_aggregate_duty_rates, raw_df)
+    assert vector_dict == legacy_dict, "processing_invoices 结果与原实现不一致"
+    print(f"processing_invoices.get_duty_rates 汇总 ({len(vector_dict)} 个Item): "
+          f"原实现 {legacy_time:.3f}s, 向量化 {vector_time:.3f}s, 提速 {legacy_time / vector_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
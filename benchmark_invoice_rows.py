@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发票工作表解析的耗时随行数的变化：按列收集结果后一次生成DataFrame（线性） vs 逐行 pd.concat（平方）
+
+用法: python benchmark_invoice_rows.py [行数,...]   (默认1000,2000,10000,100000行；逐行concat只测到2000行)
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from invoice_layout import LayoutDetector
+from invoice_sheets import InvoiceWorkbook, parse_invoice_sheet
+
+HEADER = ['Item No.', 'Model', 'P/N', 'Description', 'Origin', 'Qty (PCS)', 'Unit Price', 'Amount']
+DEFAULT_SIZES = [1000, 2000, 10000, 100000]
+# 逐行concat在更多行时耗时过长，只测到这个行数
+CONCAT_MAX_ROWS = 2000
+
+
+def write_invoice(file_path, rows, seed=7):
+    """生成与真实发票文件结构相同的文件：第一个工作表为汇总，第二个工作表有rows行发票明细"""
+    rng = random.Random(seed)
+    words = ['RESISTOR', 'CAPACITOR', 'IC', 'SENSOR', 'LENS', 'PCBA', 'CABLE', 'ADAPTER']
+    workbook = Workbook(write_only=True)
+    workbook.create_sheet('Summary').append(['Summary'])
+    sheet = workbook.create_sheet('CI-24HC00001')
+    sheet.append(['Invoice No. 24HC00001'])
+    sheet.append([])
+    sheet.append([])
+    sheet.append(HEADER)
+    sheet.append(['Sl', None, None, 'Goods', None, None, 'USD', 'USD'])
+    for item_num in range(1, rows + 1):
+        qty = rng.randint(1, 20000)
+        price = round(rng.random(), 4)
+        sheet.append([
+            item_num, 'IPC-K7CP-3H1WE',
+            f"1.2.{rng.randint(0, 99):02d}.{rng.randint(0, 99):02d}.{rng.randint(0, 9999):04d}",
+            f"{rng.choice(words)}-{rng.randint(1, 999)}R-+OR-5%", 'CN', qty, price, qty * price,
+        ])
+    workbook.save(file_path)
+
+
+def concat_rows(sheet_df):
+    """按原来的方式逐行 pd.concat 累积同样的结果行"""
+    result = pd.DataFrame()
+    for row_data in sheet_df.to_dict('records'):
+        result = pd.concat([result, pd.DataFrame([row_data])], ignore_index=True)
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else DEFAULT_SIZES
+    logging.disable(logging.WARNING)
+
+    print(f"{'行数':>8} {'读取':>8} {'按列收集':>10} {'每千行':>8} {'逐行concat':>12} {'每千行':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in sizes:
+            file_path = os.path.join(tmp_dir, f'invoice_{rows}.xlsx')
+            write_invoice(file_path, rows)
+            with InvoiceWorkbook(file_path) as workbook:
+                sheet_name = workbook.sheet_names[1]
+                # 先读取整个工作表，只比较解析的耗时
+                _, read_seconds = timed(workbook.sheet, sheet_name)
+                sheet_df, parse_seconds = timed(parse_invoice_sheet, workbook, sheet_name, sheet_name,
+                                                LayoutDetector())
+            assert len(sheet_df) == rows
+
+            line = f"{rows:>8} {read_seconds:>7.2f}s {parse_seconds:>9.2f}s {parse_seconds / rows * 1000:>7.3f}s"
+            if rows <= CONCAT_MAX_ROWS:
+                concat_df, concat_seconds = timed(concat_rows, sheet_df)
+                pd.testing.assert_frame_equal(concat_df, sheet_df)
+                line += f" {concat_seconds:>11.2f}s {concat_seconds / rows * 1000:>7.3f}s"
+            else:
+                line += f" {'-':>12} {'-':>8}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import itertools
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from desc_normalizer import clean_checklist_descs
+from excel_reader import excel_source, read_excel, source_name
+
+# 核对清单前3行是标题信息，第4行是表头
+CHECKLIST_SKIPROWS = 3
+# 流式读取时每块的行数，峰值内存由块大小而不是文件大小决定
+DEFAULT_CHECKLIST_CHUNK_ROWS = 5000
+# 处理核对清单用到的列，其余列（税费明细、备注等）不需要读取
+CHECKLIST_REQUIRED_COLUMNS = ['P/N', 'Item#', 'Desc', 'Qty', 'Price', 'HSN', 'BCD', 'SWS', 'IGST']
+# 核对清单处理结果的列（按输出顺序）
+CHECKLIST_RESULT_COLUMNS = ['Item#', 'ID', 'P/N', 'Desc', 'Qty', 'Price', 'Item_Name', 'HSN', 'BCD', 'SWS', 'IGST']
+# 发票行的P/N列以"Invoice:"开头，发票号在"Invoice:"和"dt."之间
+INVOICE_MARKER = 'Invoice:'
+INVOICE_NO_PATTERN = re.compile(r'Invoice:(.*?)(?:dt\.|Invoice:|\Z)', re.DOTALL)
+
+# 核对清单按原始单元格值读取：不推断列类型，也不把"NA"等文本当作缺失值（空单元格为''），
+# 用到的列由 parse_checklist_rows 逐列转换。一次性读取和流式读取的单元格值相同
+CHECKLIST_READ_KWARGS = {'skiprows': CHECKLIST_SKIPROWS, 'dtype': object, 'keep_default_na': False}
+
+
+def convert_cell(cell):
+    """
+    与pandas openpyxl读取器相同的单元格转换：空单元格为''，错误值为NaN，整数值的数字为int
+    """
+    if cell.value is None:
+        return ''
+    elif cell.data_type == 'e':
+        return float('nan')
+    elif cell.data_type == 'n':
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def blank_cells(values):
+    """
+    空单元格：''、NaN或None
+    """
+    return values.isna() | values.astype(object).eq('')
+
+
+def cell_value_text(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def column_texts(values):
+    """
+    一列单元格值的文本：空单元格为''，整数值的数字不带小数点（1.0 -> '1'），其余为 str() 文本
+
+    原始单元格值（整数为int）和按列推断过类型的值（有空单元格的整数列为float）得到相同的文本
+    """
+    values = values.astype(object)
+    return values.map(cell_value_text).astype(object).where(~blank_cells(values), '')
+
+
+def map_checklist_columns(columns):
+    """
+    把需要的列映射到核对清单的列名，没有对应的列时为None
+    """
+    column_mapping = {}
+
+    for req_col in CHECKLIST_REQUIRED_COLUMNS:
+        if req_col in columns:
+            column_mapping[req_col] = req_col
+        else:
+            # 特殊处理IGST列，可能对应Duty列
+            if req_col == 'IGST' and 'Duty' in columns:
+                column_mapping[req_col] = 'Duty'
+                logging.info(f"Mapped column '{req_col}' to 'Duty'")
+                continue
+
+            # 尝试找到相似的列名（不区分大小写，忽略空格和特殊字符）
+            found = False
+            for col in columns:
+                col_clean = str(col).strip().replace(' ', '').replace('/', '').replace('-', '').upper()
+                req_col_clean = req_col.replace('/', '').replace('-', '').upper()
+                if col_clean == req_col_clean or req_col_clean in col_clean:
+                    column_mapping[req_col] = col
+                    logging.info(f"Mapped column '{req_col}' to '{col}'")
+                    found = True
+                    break
+
+            if not found:
+                logging.warning(f"Column '{req_col}' not found in checklist file")
+                column_mapping[req_col] = None
+
+    return column_mapping
+
+
+def checklist_usecols(columns, column_mapping):
+    """
+    只读取映射到的列时使用的列位置（usecols），需要读取所有列时返回None
+
+    没有P/N列时要在每一列中查找发票行，只能读取所有列。pandas生成的列名（空表头的
+    Unnamed: n、重复列名的 name.1）与读取哪些列有关，映射到这样的列时也读取所有列。
+    """
+    if not column_mapping.get('P/N'):
+        return None
+    columns = list(columns)
+    mapped = {col for col in column_mapping.values() if col is not None}
+    for col in mapped:
+        if not isinstance(col, str) or col.startswith('Unnamed:'):
+            return None
+        base, dot, suffix = col.rpartition('.')
+        if dot and suffix.isdigit() and base in columns:
+            return None
+    return [position for position, col in enumerate(columns) if col in mapped]
+
+
+def item_key(value):
+    """
+    ID中的Item#：数字去掉小数部分，不是数字时去掉空格
+    """
+    try:
+        return str(int(float(value)))
+    except (ValueError, TypeError):
+        return str(value).strip().replace(' ', '')
+
+
+def item_keys(values):
+    """
+    item_key 的Series版本，数值列整列取整
+    """
+    if is_numeric_dtype(values):
+        numbers = values.astype('float64')
+        if np.isfinite(numbers).all() and (numbers.abs() < 2 ** 63).all():
+            return pd.Series(np.trunc(numbers).astype('int64'), index=values.index).astype(str).astype(object)
+    return values.astype(object).map(item_key).astype(object)
+
+
+def hsn_texts(values):
+    """
+    HSN列的文本：整数文本（可能带小数点的数字字符串）转为整数，其余保持原文本，空值为''
+    """
+    texts = column_texts(values)
+    is_digits = texts.str.strip().str.isdigit()
+    return texts.where(~is_digits, texts[is_digits].map(lambda text: str(int(float(text)))))
+
+
+def parse_checklist_rows(df, column_mapping, current_invoice=None):
+    """
+    按列处理核对清单的一块数据，返回 (结果DataFrame, 这一块结束时的发票号)
+
+    P/N列中含有"Invoice:"的是发票行，原样保留（Item#为该单元格的文本，其余列为空）；
+    之后Item#不为空的行是这张发票的明细行，ID为"发票号_Item#"，其余列为文本。
+    没有P/N列时每行取第一个含有"Invoice:"的单元格。current_invoice为上一块结束时的发票号，
+    发票号为空时明细行不保留。结果的行索引与df相同。
+    df一般为原始单元格值（CHECKLIST_READ_KWARGS读取的结果或 ChecklistStream 的块），用到的列
+    逐列转为文本（column_texts），与各列是否推断过类型无关。
+    """
+    def mapped_column(name):
+        col = column_mapping.get(name)
+        return col if col and col in df.columns else None
+
+    # 标记发票行
+    pn_col = mapped_column('P/N')
+    if pn_col is not None:
+        pn = column_texts(df[pn_col])
+    else:
+        pn = pd.Series('', index=df.index, dtype=object)
+        found = pd.Series(False, index=df.index)
+        for position in range(df.shape[1]):
+            cells = column_texts(df.iloc[:, position])
+            is_found = ~found & cells.str.contains(INVOICE_MARKER, regex=False)
+            pn = pn.where(~is_found, cells)
+            found |= is_found
+    is_invoice = pn.str.contains(INVOICE_MARKER, regex=False).astype(bool)
+
+    # 提取发票号并向下填充到之后的明细行
+    invoice = pd.Series(None, index=df.index, dtype=object)
+    invoice[is_invoice] = (pn[is_invoice].str.extract(INVOICE_NO_PATTERN, expand=False)
+                           .str.strip().str.replace(' ', '', regex=False))
+    invoice = invoice.ffill()
+    if current_invoice is not None:
+        invoice = invoice.where(invoice.notna(), current_invoice)
+    last_invoice = invoice.iloc[-1] if len(invoice) else current_invoice
+    if pd.isna(last_invoice):
+        last_invoice = None
+
+    # 明细行：不是发票行、Item#不为空且发票号不为空
+    item_col = mapped_column('Item#')
+    if item_col is not None:
+        has_invoice = invoice.map(bool, na_action='ignore').eq(True)
+        is_item = ~is_invoice & ~blank_cells(df[item_col]) & has_invoice
+    else:
+        is_item = pd.Series(False, index=df.index)
+    items = df[is_item]
+
+    def item_text(name):
+        col = mapped_column(name)
+        if col is None:
+            return pd.Series('', index=items.index, dtype=object)
+        return column_texts(items[col])
+
+    desc_col = mapped_column('Desc')
+    if desc_col is not None:
+        has_desc = ~blank_cells(items[desc_col])
+        desc = item_text('Desc')
+        item_name = desc.str.split('-', n=1).str[0].where(has_desc, '')
+        clean_desc = clean_checklist_descs(desc).where(has_desc, '')
+    else:
+        item_name = clean_desc = item_text('Desc')
+    hsn_col = mapped_column('HSN')
+
+    item_rows = pd.DataFrame({
+        'Item#': item_text('Item#'),
+        'ID': invoice[is_item] + '_' + item_keys(items[item_col]) if item_col is not None else item_text('ID'),
+        'P/N': pn[is_item],
+        'Desc': clean_desc,
+        'Qty': item_text('Qty'),
+        'Price': item_text('Price'),
+        'Item_Name': item_name,
+        'HSN': hsn_texts(items[hsn_col]) if hsn_col is not None else item_text('HSN'),
+        'BCD': item_text('BCD'),
+        'SWS': item_text('SWS'),
+        'IGST': item_text('IGST'),
+    }, index=items.index, dtype=object)
+    invoice_rows = pd.DataFrame({'Item#': pn[is_invoice]}, index=pn.index[is_invoice],
+                                columns=CHECKLIST_RESULT_COLUMNS, dtype=object)
+    rows = pd.concat([invoice_rows, item_rows]).sort_index(kind='stable')
+    return rows, last_invoice
+
+
+class ChecklistStream:
+    """
+    用openpyxl只读模式逐行读取核对清单，按块返回原始单元格值的DataFrame
+
+    每块各列为object列，单元格值与 pd.read_excel(file_path, **CHECKLIST_READ_KWARGS) 的对应行相同，
+    不推断列类型，由 parse_checklist_rows 逐列转换用到的列。列名为columns（只读表头得到的列名，
+    为空时在这里读取表头），表头之外的列不读取。只读一遍文件，内存占用与文件行数无关。
+
+    usecols（列位置列表）不为空时每块只保留这些列，与 pd.read_excel(..., usecols=usecols) 相同。
+    file_path也可以是内存中的文件内容（bytes）。
+    """
+
+    def __init__(self, file_path, columns=None, skiprows=CHECKLIST_SKIPROWS,
+                 chunk_rows=DEFAULT_CHECKLIST_CHUNK_ROWS, usecols=None):
+        self.file_path = file_path
+        self.skiprows = skiprows
+        self.chunk_rows = max(1, int(chunk_rows))
+        if columns is None:
+            columns = read_excel(file_path, engine='openpyxl', skiprows=skiprows, nrows=0).columns
+        self.positions = sorted(usecols) if usecols is not None else list(range(len(columns)))
+        self.columns = [columns[i] for i in self.positions]
+
+    def _iter_data_rows(self):
+        """
+        依次返回表头之后的数据行（只保留需要的列），文件末尾的空行不返回
+        """
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(excel_source(self.file_path), read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet = workbook.worksheets[0]
+            sheet.reset_dimensions()
+            # 空行先暂存，之后还有非空行时才返回（与pandas相同，只去掉末尾的空行）
+            blank_rows = []
+            for row in itertools.islice(sheet.rows, self.skiprows + 1, None):
+                converted_row = [convert_cell(cell) for cell in row]
+                data_row = [converted_row[i] if i < len(converted_row) else '' for i in self.positions]
+                if any(value != '' for value in converted_row):
+                    yield from blank_rows
+                    blank_rows = []
+                    yield data_row
+                else:
+                    blank_rows.append(data_row)
+        finally:
+            workbook.close()
+
+    def _frame(self, rows, offset):
+        index = pd.RangeIndex(offset, offset + len(rows))
+        return pd.DataFrame(rows, index=index, columns=pd.Index(self.columns), dtype=object)
+
+    def iter_chunks(self):
+        """
+        逐块返回核对清单的数据行，没有数据行时返回一个只有列名的空DataFrame
+        """
+        rows = []
+        offset = 0
+        for row in self._iter_data_rows():
+            rows.append(row)
+            if len(rows) >= self.chunk_rows:
+                yield self._frame(rows, offset)
+                offset += len(rows)
+                rows = []
+
+        if rows or offset == 0:
+            yield self._frame(rows, offset)
+        logging.info(f"Streamed checklist {source_name(self.file_path)}: {offset + len(rows)} rows")
@@ -0,0 +1,68 @@
+# 描述清理时保留的标点，其余非字母数字的字符都删除
+KEEP_PUNCTUATION = '.()'
+# 发票描述转为大写后还要删除的字符
+INVOICE_DELETE_CHARS = 'ΦΩφ-'
+# 核对清单描述只取这个标记之前的部分，并依次删除其中的片段
+CHECKLIST_DESC_SEPARATOR = '-PART NO'
+CHECKLIST_DELETE_PARTS = ['+OR-', 'DEG']
+# 预先计算转换结果的字符范围（ASCII、拉丁字母和希腊字母），其余字符第一次遇到时再计算
+PRECOMPUTED_CHARS = 0x400
+
+
+class CharTable(dict):
+    """
+    str.translate 使用的逐字符转换表：字母数字和 .() 转为大写，其余字符删除，
+    转为大写后的结果中再删除delete_chars中的字符
+
+    与逐个字符 ''.join(char.upper() for char in text if char.isalnum() or char in '.()') 后再 replace 的结果相同。
+    常用字符用 str.maketrans 预先算好，其它字符在 __missing__ 中计算并记住。
+    """
+
+    def __init__(self, delete_chars=''):
+        self.delete_chars = delete_chars
+        super().__init__(str.maketrans({chr(code): self.convert(chr(code)) for code in range(PRECOMPUTED_CHARS)}))
+
+    def convert(self, char):
+        # 删除的字符用None表示，全是ASCII的文本可以走 str.translate 的快速路径
+        if not (char.isalnum() or char in KEEP_PUNCTUATION):
+            return None
+        return ''.join(upper for upper in char.upper() if upper not in self.delete_chars) or None
+
+    def __missing__(self, code):
+        converted = self[code] = self.convert(chr(code))
+        return converted
+
+
+INVOICE_DESC_TABLE = CharTable(INVOICE_DELETE_CHARS)
+CHECKLIST_DESC_TABLE = CharTable()
+
+
+def clean_invoice_desc(desc):
+    """
+    清理发票描述：只保留字母数字和 .()，转为大写，删除Φ、Ω、φ
+    """
+    return str(desc).translate(INVOICE_DESC_TABLE)
+
+
+def clean_checklist_desc(desc):
+    """
+    清理核对清单描述：取"-PART NO"之前的部分，删除"+OR-"和"DEG"，再只保留字母数字和 .() 并转为大写
+    """
+    desc = str(desc).split(CHECKLIST_DESC_SEPARATOR)[0]
+    for part in CHECKLIST_DELETE_PARTS:
+        desc = desc.replace(part, '')
+    return desc.translate(CHECKLIST_DESC_TABLE)
+
+
+def clean_invoice_descs(descs):
+    """
+    clean_invoice_desc 的Series版本：descs为字符串Series，返回object类型的Series，空值保持为空
+    """
+    return descs.astype(object).str.translate(INVOICE_DESC_TABLE)
+
+
+def clean_checklist_descs(descs):
+    """
+    clean_checklist_desc 的Series版本：descs为字符串Series，返回object类型的Series，空值保持为空
+    """
+    return descs.astype(object).map(clean_checklist_desc, na_action='ignore').astype(object)
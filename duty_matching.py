@@ -0,0 +1,380 @@
+import hashlib
+import logging
+from collections import defaultdict
+
+import pandas as pd
+
+
+def is_matchable_name(item_name):
+    """
+    需要匹配税率的Item Name：空值和空字符串不匹配
+    """
+    return not (pd.isna(item_name) or item_name == '')
+
+
+def normalize_item_name(item_name):
+    """
+    标准化Item Name，用于更好的匹配
+    保留更多原始信息以避免过度匹配
+    """
+    if pd.isna(item_name) or item_name == '':
+        return ''
+
+    # 转换为字符串并转为大写
+    normalized = str(item_name).upper().strip()
+
+    # 只移除多余的空格，保留单个空格作为分隔符
+    normalized = ' '.join(normalized.split())
+
+    # 标准化常见的分隔符为空格
+    normalized = normalized.replace('-', ' ').replace('_', ' ')
+    normalized = normalized.replace(',', ' ').replace(';', ' ')
+
+    # 再次清理多余空格
+    normalized = ' '.join(normalized.split())
+
+    return normalized
+
+
+# 匹配规则变化时修改此版本号，使持久化缓存中的旧结果失效
+MATCHER_VERSION = "1"
+
+
+class MatchTrace:
+    """
+    匹配过程记录（审计用），默认不开启
+
+    每个item的候选项及得分保存在内存中，处理完成后可导出为Excel或CSV
+    """
+
+    COLUMNS = ['Item Name', 'Normalized', 'Candidate', 'Strategy', 'Score', 'Selected']
+
+    def __init__(self):
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def record(self, item_name, normalized_item, candidate, strategy, score, selected):
+        self.rows.append((item_name, normalized_item, candidate, strategy, score, selected))
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows, columns=self.COLUMNS)
+
+    def export(self, path):
+        """
+        按扩展名导出为 .csv 或 .xlsx
+        """
+        trace_df = self.to_dataframe()
+        if path.lower().endswith('.csv'):
+            trace_df.to_csv(path, index=False, encoding='utf-8-sig')
+        else:
+            trace_df.to_excel(path, index=False, sheet_name='match_trace')
+        logging.info(f"Saved match trace with {len(trace_df)} rows to {path}")
+
+
+class DutyRateIndex:
+    """
+    税率表的预建索引，在get_duty_rates之后构建一次
+
+    - normalized_keys: 标准化名称 -> 第一个原始键（保持字典顺序）
+    - token_tuples: 每个键预先拆分好的单词元组
+    - token_sets: 每个键的单词集合
+    - postings: 单词 -> 包含该单词的键序号列表（升序）
+    - length_buckets: 单词数 -> 键序号集合
+
+    打分规则与逐个扫描完全一致，只是只对共享单词的候选项打分。
+    normalized_names为每个键预先标准化好的名称（例如从税率快照读取），
+    传入时不再逐个标准化。
+    传入match_cache时，模糊匹配的结果按税率表指纹持久化缓存。
+    设置trace为MatchTrace时记录每个候选项的得分（此时不读取缓存）。
+    resolved记录match_items匹配过的所有名称及结果，税率表更新时用于只重新匹配受影响的名称。
+    """
+
+    def __init__(self, duty_rates_dict, match_cache=None, trace=None, normalized_names=None):
+        self.keys = list(duty_rates_dict.keys())
+        self.match_cache = match_cache
+        self.trace = trace
+        self.resolved = {}
+        self.key_set = set(self.keys)
+        self.normalized_names = []
+        self.normalized_keys = {}
+        self.token_tuples = []
+        self.token_sets = []
+        self.postings = defaultdict(list)
+        self.length_buckets = defaultdict(set)
+
+        for key_id, duty_item in enumerate(self.keys):
+            if normalized_names is not None:
+                normalized_duty = normalized_names[key_id]
+            else:
+                normalized_duty = normalize_item_name(duty_item)
+            self.normalized_names.append(normalized_duty)
+            self.normalized_keys.setdefault(normalized_duty, duty_item)
+
+            duty_words = tuple(normalized_duty.split())
+            token_set = frozenset(duty_words)
+            self.token_tuples.append(duty_words)
+            self.token_sets.append(token_set)
+            self.length_buckets[len(duty_words)].add(key_id)
+            for word in token_set:
+                self.postings[word].append(key_id)
+
+        # 税率表指纹：由匹配规则版本和所有键（按顺序）决定
+        fingerprint = hashlib.sha256(MATCHER_VERSION.encode('utf-8'))
+        for duty_item in self.keys:
+            fingerprint.update(str(duty_item).encode('utf-8') + b'\x00')
+        self.fingerprint = fingerprint.hexdigest()
+
+        logging.info(f"Built duty rate index: {len(self.keys)} keys, {len(self.postings)} tokens")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, item_words):
+        """
+        返回可能得分的键序号（升序）
+
+        - 策略1（单词数相同）要求至少一个位置上的单词相同
+        - 策略2（单词数更多）要求item的每个单词都出现在duty中
+        其余键的得分必然为0，无需打分。
+        """
+        distinct_words = set(item_words)
+        postings = [self.postings.get(word, ()) for word in distinct_words]
+
+        # 策略1候选：单词数相同且共享至少一个单词
+        same_length = self.length_buckets.get(len(item_words), set())
+        candidates = set()
+        for posting in postings:
+            candidates.update(key_id for key_id in posting if key_id in same_length)
+
+        # 策略2候选：单词数更多且包含所有单词（只有至少2个单词时才可能得分）
+        if len(item_words) >= 2 and all(postings):
+            shortest, *others = sorted(postings, key=len)
+            common = set(shortest)
+            for posting in others:
+                common.intersection_update(posting)
+            candidates.update(key_id for key_id in common if len(self.token_tuples[key_id]) > len(item_words))
+
+        return sorted(candidates)
+
+    def find_best_match(self, item_name):
+        """
+        为给定的item_name找到最佳匹配，结果与逐个扫描税率表相同
+        """
+        if not item_name or pd.isna(item_name):
+            return None
+
+        # 首先尝试精确匹配（原始值和标准化后）
+        normalized_item = normalize_item_name(item_name)
+        found, exact_match = self._exact_match(item_name, normalized_item)
+        if found:
+            return exact_match
+
+        # 模糊匹配只取决于标准化后的名称，先查持久化缓存
+        if self.match_cache is not None and self.trace is None:
+            hit, cached_match = self.match_cache.get(self.fingerprint, normalized_item)
+            if hit and (cached_match is None or cached_match in self.key_set):
+                return cached_match
+
+        best_match = self._fuzzy_match(item_name, normalized_item)
+
+        if self.match_cache is not None:
+            self.match_cache.put(self.fingerprint, normalized_item, best_match)
+
+        return best_match
+
+    def _exact_match(self, item_name, normalized_item):
+        """
+        精确匹配，返回 (是否命中, 税率键)
+        """
+        # 首先尝试精确匹配（原始值）
+        if item_name in self.key_set:
+            if self.trace is not None:
+                self.trace.record(item_name, normalized_item, item_name, 'exact', 1.0, True)
+            return True, item_name
+
+        # 尝试标准化后的精确匹配
+        if normalized_item in self.normalized_keys:
+            if self.trace is not None:
+                self.trace.record(item_name, normalized_item, self.normalized_keys[normalized_item], 'normalized', 1.0, True)
+            return True, self.normalized_keys[normalized_item]
+
+        return False, None
+
+    def _fuzzy_match(self, item_name, normalized_item):
+        """
+        按单词打分的部分匹配
+        """
+        # 更严格的部分匹配策略
+        best_match = None
+        best_score = 0
+
+        # 将标准化后的item_name分割成单词
+        item_words = normalized_item.split()
+
+        # 单个单词（如型号SKU）不可能得分：策略1要求所有单词相同（已由精确匹配处理），
+        # 策略2要求至少2个单词，而策略3在elif链中排在"单词数相同"分支之后，
+        # 单词数都为1时总是进入策略1分支，因此子串匹配从不生效。直接跳过候选打分。
+        if len(item_words) < 2:
+            if self.trace is not None:
+                self.trace.record(item_name, normalized_item, '', 'single_token', 0, False)
+            return None
+
+        # 审计模式下记录每个候选项的得分
+        scored = [] if self.trace is not None else None
+
+        for key_id in self._candidates(item_words):
+            duty_item = self.keys[key_id]
+            duty_words = self.token_tuples[key_id]
+
+            # 计算匹配分数 - 使用更严格的策略
+            score = 0
+            strategy = ''
+
+            # 策略1: 完全相同的单词匹配
+            if len(item_words) == len(duty_words):
+                strategy = 'same_words'
+                matching_words = sum(1 for w1, w2 in zip(item_words, duty_words) if w1 == w2)
+                if matching_words == len(item_words):
+                    # 完全匹配，直接返回
+                    if scored is not None:
+                        self._record_scores(item_name, normalized_item, scored + [(duty_item, strategy, 1.0)], duty_item)
+                    return duty_item
+                elif matching_words >= len(item_words) * 0.8:  # 至少80%的单词匹配
+                    score = matching_words / len(item_words)
+
+            # 策略2: 检查是否所有关键词都存在（适用于不同长度的情况）
+            elif len(item_words) <= len(duty_words):
+                strategy = 'all_words'
+                # 检查item的所有单词是否都在duty中出现
+                duty_token_set = self.token_sets[key_id]
+                matching_words = sum(1 for word in item_words if word in duty_token_set)
+                if matching_words == len(item_words) and len(item_words) >= 2:
+                    # 所有单词都匹配，且至少有2个单词
+                    score = 0.9  # 给一个较高但不是最高的分数
+
+            # 策略3: 对于单个长单词，使用更严格的子串匹配
+            elif len(item_words) == 1 and len(duty_words) == 1:
+                strategy = 'substring'
+                item_word = item_words[0]
+                duty_word = duty_words[0]
+
+                # 只有当一个词完全包含另一个词，且长度差异不大时才匹配
+                if item_word in duty_word or duty_word in item_word:
+                    shorter_len = min(len(item_word), len(duty_word))
+                    longer_len = max(len(item_word), len(duty_word))
+
+                    # 长度差异不能超过30%，且较短的词至少要有6个字符
+                    if shorter_len >= 6 and (longer_len - shorter_len) / longer_len <= 0.3:
+                        score = shorter_len / longer_len
+
+            if scored is not None:
+                scored.append((duty_item, strategy, score))
+
+            # 更新最佳匹配 - 提高阈值到0.85
+            if score > best_score and score >= 0.85:
+                best_score = score
+                best_match = duty_item
+
+        if scored is not None:
+            self._record_scores(item_name, normalized_item, scored, best_match)
+
+        return best_match
+
+    def _record_scores(self, item_name, normalized_item, scored, best_match):
+        """
+        把一个item的所有候选项得分写入trace
+        """
+        if not scored:
+            self.trace.record(item_name, normalized_item, '', 'no_candidates', 0, False)
+        for duty_item, strategy, score in scored:
+            self.trace.record(item_name, normalized_item, duty_item, strategy, score, duty_item == best_match)
+
+    def match_items(self, names):
+        """
+        批量匹配：对所有名称去重后每个唯一名称只匹配一次
+
+        返回 {item_name: 匹配到的税率键或None}，保持名称首次出现的顺序；
+        空名称不需要匹配，不包含在结果中
+        """
+        matches = {}
+        pending = {}
+        for item_name in names:
+            if not is_matchable_name(item_name) or item_name in matches:
+                continue
+
+            normalized_item = normalize_item_name(item_name)
+            found, exact_match = self._exact_match(item_name, normalized_item)
+            matches[item_name] = exact_match
+            if not found:
+                pending[item_name] = normalized_item
+
+        # 需要模糊匹配的名称先批量查询持久化缓存
+        cached = {}
+        if self.match_cache is not None and self.trace is None and pending:
+            cached = self.match_cache.get_many(self.fingerprint, pending.values())
+
+        computed = {}
+        cache_hits = 0
+        for item_name, normalized_item in pending.items():
+            if normalized_item in cached and (cached[normalized_item] is None or cached[normalized_item] in self.key_set):
+                matches[item_name] = cached[normalized_item]
+                cache_hits += 1
+            elif normalized_item in computed:
+                matches[item_name] = computed[normalized_item]
+            else:
+                computed[normalized_item] = self._fuzzy_match(item_name, normalized_item)
+                matches[item_name] = computed[normalized_item]
+
+        if self.match_cache is not None and computed:
+            self.match_cache.put_many(self.fingerprint, computed)
+        self.resolved.update(matches)
+
+        logging.info(f"Batch matched {len(matches)} unique item names "
+                     f"({len(pending)} fuzzy, {cache_hits} from cache), "
+                     f"{sum(1 for match in matches.values() if match is None)} without a match")
+        return matches
+
+
+def find_best_match(item_name, duty_rates_dict, duty_index=None):
+    """
+    为给定的item_name在duty_rates字典中找到最佳匹配
+    使用更严格的匹配策略避免错误匹配
+
+    传入预建的duty_index可避免每次调用都重新标准化整个税率表
+    """
+    if duty_index is None:
+        duty_index = DutyRateIndex(duty_rates_dict)
+    return duty_index.find_best_match(item_name)
+
+
+def diff_duty_rates(old_rates, new_rates):
+    """
+    按 Item Name 比较新旧税率表，返回 (新增的键, 删除的键, 税率变化的键)
+    """
+    added = [duty_item for duty_item in new_rates if duty_item not in old_rates]
+    removed = [duty_item for duty_item in old_rates if duty_item not in new_rates]
+    changed = [duty_item for duty_item in new_rates
+               if duty_item in old_rates and new_rates[duty_item] != old_rates[duty_item]]
+    return added, removed, changed
+
+
+def affected_item_names(old_matches, added_keys, removed_keys):
+    """
+    税率表更新后匹配结果可能改变的名称（保持old_matches的顺序）
+
+    - 原来匹配到的键被删除
+    - 单独用新增的键就能匹配到该名称；否则新增的键不可能成为最佳匹配
+    删除其他键不影响结果：精确匹配、标准化匹配和最高分都只由被选中的键决定
+    （保留下来的键相对顺序不变，税率表分组后按名称排序）
+    """
+    removed_keys = set(removed_keys)
+    added_index = DutyRateIndex(dict.fromkeys(added_keys)) if added_keys else None
+
+    affected = []
+    for item_name, matched_duty_item in old_matches.items():
+        if matched_duty_item in removed_keys or \
+                (added_index is not None and added_index.find_best_match(item_name) is not None):
+            affected.append(item_name)
+    return affected
@@ -0,0 +1,47 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+def join_grouped_values(values, keys, index):
+    """
+    按keys分组，用空格拼接每组中非空的值（保持原始行顺序），
+    结果按index排列，没有值的组为空字符串
+
+    不对每个组调用Python函数：按"组内第几个值"逐轮拼接，
+    循环次数只等于单个Item Name的最大重复行数
+    """
+    values = values[values.notna() & keys.notna()]
+    codes, group_names = pd.factorize(keys.loc[values.index])
+    strings = values.astype(str).to_numpy(dtype=object)
+    position = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+
+    joined = np.empty(len(group_names), dtype=object)
+    for k in range(position.max() + 1 if len(position) else 0):
+        at = position == k
+        joined[codes[at]] = strings[at] if k == 0 else joined[codes[at]] + ' ' + strings[at]
+    return pd.Series(joined, index=group_names).reindex(index, fill_value='')
+
+
+def aggregate_duty_rates(df):
+    """
+    按 Item Name 分组汇总税率，返回 duty_dict
+    HSN1/HSN2 用空格拼接，税率取最小值；HSN1 为空且存在 HSN2 时使用 HSN2
+    """
+    grouped_df = df.groupby('Item Name')[['Final BCD', 'Final SWS', 'Final IGST']].min()
+    logging.info(f"Grouped duty rates. Shape: {grouped_df.shape}")
+
+    hsn = join_grouped_values(df['HSN1'], df['Item Name'], grouped_df.index)
+    # 只有在HSN2列存在时才使用它
+    if 'HSN2' in df.columns:
+        hsn2 = join_grouped_values(df['HSN2'], df['Item Name'], grouped_df.index)
+        hsn = hsn.where(hsn.str.strip() != '', hsn2)
+
+    rates_df = pd.DataFrame({
+        'hsn': hsn,
+        'bcd': grouped_df['Final BCD'],
+        'sws': grouped_df['Final SWS'],
+        'igst': grouped_df['Final IGST'],
+    })
+    return rates_df.to_dict('index')
@@ -0,0 +1,175 @@
+import glob
+import hashlib
+import logging
+import os
+
+from duty_matching import MATCHER_VERSION, normalize_item_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow随streamlit一起安装，缺失时只是不使用快照
+    pa = None
+    feather = None
+
+# 快照文件默认位置及保留数量
+DEFAULT_SNAPSHOT_DIR = os.path.join("cache", "duty_snapshots")
+DEFAULT_MAX_SNAPSHOTS = 8
+
+# 快照内容或解析规则变化时修改此版本号，使旧快照失效
+SNAPSHOT_VERSION = "1"
+
+RATE_COLUMNS = ['hsn', 'bcd', 'sws', 'igst']
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    """
+    文件内容的sha256（分块读取）
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_sha256(source):
+    """
+    文件内容的sha256，source可以是文件路径或内存中的文件内容（bytes/memoryview）
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    return file_sha256(source)
+
+
+class DutySnapshotStore:
+    """
+    税率表的二进制快照（Arrow IPC / Feather，不压缩）
+
+    每个快照由两个文件组成：
+    - <key>.rates.arrow: 分组后的税率（Item Name、标准化名称及 hsn/bcd/sws/igst），按字典顺序
+    - <key>.table.arrow: 清理后的原始税率表（用于输出CCTV sheet）
+
+    key 由税率文件内容的sha256、解析器名称及版本号决定，文件内容不变时直接读取快照，
+    不再解析Excel；超过保留数量时删除最久未使用的快照。
+
+    快照只保存分组结果和标准化名称，不保存匹配索引：读取时各列都要转为Python对象
+    （duty_dict、DataFrame），DutyRateIndex 的倒排表等也由标准化名称重新构建
+    （只是按单词分桶，几百项的税率表不到1毫秒）。
+    """
+
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR, max_snapshots=DEFAULT_MAX_SNAPSHOTS):
+        self.snapshot_dir = snapshot_dir
+        self.max_snapshots = max_snapshots
+        self.enabled = pa is not None
+        if not self.enabled:
+            logging.warning("pyarrow not available, duty rate snapshots disabled")
+
+    def snapshot_key(self, file_path, parser, content_digest=None):
+        """
+        根据税率文件内容计算快照key，文件无法读取时返回None
+        file_path也可以是内存中的文件内容；content_digest为内容的sha256，已知时不再重复计算
+        """
+        if not self.enabled:
+            return None
+
+        if content_digest is None:
+            try:
+                content_digest = content_sha256(file_path)
+            except OSError as e:
+                logging.warning(f"Could not hash duty rate file {file_path}: {str(e)}")
+                return None
+        return hashlib.sha256(
+            f"{SNAPSHOT_VERSION}:{MATCHER_VERSION}:{parser}:{content_digest}".encode('utf-8')
+        ).hexdigest()
+
+    def _paths(self, key):
+        return (os.path.join(self.snapshot_dir, f"{key}.rates.arrow"),
+                os.path.join(self.snapshot_dir, f"{key}.table.arrow"))
+
+    def load(self, key):
+        """
+        读取快照，返回 (duty_dict, 原始DataFrame, 标准化名称列表)；没有快照时返回None
+        """
+        if key is None:
+            return None
+
+        rates_path, table_path = self._paths(key)
+        if not (os.path.exists(rates_path) and os.path.exists(table_path)):
+            return None
+
+        try:
+            rates = feather.read_table(rates_path)
+            df = feather.read_table(table_path).to_pandas()
+
+            item_names = rates.column('Item Name').to_pylist()
+            normalized_names = rates.column('Normalized').to_pylist()
+            rate_values = [rates.column(name).to_pylist() for name in RATE_COLUMNS]
+            duty_dict = {
+                item_name: dict(zip(RATE_COLUMNS, values))
+                for item_name, *values in zip(item_names, *rate_values)
+            }
+
+            # 记录使用时间，淘汰时保留最近使用的快照
+            for path in (rates_path, table_path):
+                os.utime(path)
+        except (OSError, pa.ArrowException, KeyError) as e:
+            logging.warning(f"Could not load duty rate snapshot {key}: {str(e)}")
+            return None
+
+        logging.info(f"Loaded duty rate snapshot {rates_path}: {len(duty_dict)} items")
+        return duty_dict, df, normalized_names
+
+    def save(self, key, duty_dict, df, normalized_names=None):
+        """
+        写入快照；包含无法转换为Arrow的混合类型列时跳过，不影响处理
+        """
+        if key is None:
+            return
+
+        if normalized_names is None:
+            normalized_names = [normalize_item_name(item_name) for item_name in duty_dict]
+
+        rates_path, table_path = self._paths(key)
+        try:
+            columns = {
+                'Item Name': pa.array(list(duty_dict.keys())),
+                'Normalized': pa.array(list(normalized_names), type=pa.string()),
+            }
+            for name in RATE_COLUMNS:
+                values = [rates[name] for rates in duty_dict.values()]
+                # 同一列混有不同类型时（例如整数和小数），读回后类型会改变
+                if len({type(value) for value in values}) > 1:
+                    raise ValueError(f"column '{name}' has mixed value types")
+                columns[name] = pa.array(values)
+            rates = pa.table(columns)
+            table = pa.Table.from_pandas(df)
+
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            # 先写临时文件再替换，避免读到写了一半的快照
+            for path, data in ((table_path, table), (rates_path, rates)):
+                feather.write_feather(data, path + '.tmp', compression='uncompressed')
+                os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError, pa.ArrowException) as e:
+            logging.warning(f"Duty rate snapshot not saved: {str(e)}")
+            return
+
+        logging.info(f"Saved duty rate snapshot {rates_path}: {len(duty_dict)} items")
+        self._evict()
+
+    def _evict(self):
+        rates_files = glob.glob(os.path.join(self.snapshot_dir, "*.rates.arrow"))
+        if len(rates_files) <= self.max_snapshots:
+            return
+
+        rates_files.sort(key=os.path.getmtime, reverse=True)
+        for rates_path in rates_files[self.max_snapshots:]:
+            key = os.path.basename(rates_path)[:-len(".rates.arrow")]
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            logging.info(f"Removed least recently used duty rate snapshot {key}")
@@ -0,0 +1,152 @@
+import importlib.util
+import io
+import logging
+import os
+
+import pandas as pd
+
+# Excel读取引擎：auto 在安装了 python-calamine 时使用calamine（编译实现，比openpyxl快数倍），否则使用openpyxl
+READER_ENGINES = ('auto', 'calamine', 'openpyxl')
+DEFAULT_READER_ENGINE = 'auto'
+# 也可以通过环境变量指定，例如 EXCEL_READER_ENGINE=openpyxl
+READER_ENGINE_ENV = 'EXCEL_READER_ENGINE'
+
+_reader_engine = os.environ.get(READER_ENGINE_ENV, DEFAULT_READER_ENGINE)
+_warned_missing_calamine = False
+
+
+def calamine_available():
+    return importlib.util.find_spec('python_calamine') is not None
+
+
+def set_reader_engine(engine):
+    """
+    设置默认的Excel读取引擎（auto / calamine / openpyxl）
+    """
+    global _reader_engine
+    if engine not in READER_ENGINES:
+        raise ValueError(f"未知的Excel读取引擎: {engine}，可选: {', '.join(READER_ENGINES)}")
+    _reader_engine = engine
+    logging.info(f"Excel reader engine set to {engine} (using {resolve_engine()})")
+
+
+def get_reader_engine():
+    return _reader_engine
+
+
+def resolve_engine(engine=None):
+    """
+    返回实际使用的pandas engine：calamine 或 openpyxl
+    """
+    global _warned_missing_calamine
+    engine = engine or _reader_engine
+    if engine not in READER_ENGINES:
+        logging.warning(f"Unknown Excel reader engine {engine!r}, using {DEFAULT_READER_ENGINE}")
+        engine = DEFAULT_READER_ENGINE
+
+    if engine == 'openpyxl':
+        return 'openpyxl'
+    if calamine_available():
+        return 'calamine'
+    if engine == 'calamine' and not _warned_missing_calamine:
+        logging.warning("python-calamine is not installed, falling back to openpyxl")
+        _warned_missing_calamine = True
+    return 'openpyxl'
+
+
+def engine_version(engine=None):
+    """
+    实际使用的引擎及其版本，用作解析缓存key的一部分
+    """
+    engine = resolve_engine(engine)
+    module = importlib.import_module('python_calamine' if engine == 'calamine' else 'openpyxl')
+    return f"{engine}-{getattr(module, '__version__', 'unknown')}"
+
+
+def is_buffer(source):
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def excel_source(source):
+    """
+    pandas/openpyxl可以读取的source：内存中的文件内容（bytes/memoryview）包装为BytesIO，其它原样返回
+
+    BytesIO(bytes) 与bytes共用同一块内存，不复制
+    """
+    if is_buffer(source):
+        return io.BytesIO(source)
+    return source
+
+
+def source_name(source):
+    """
+    日志中显示的文件名，内存中的文件内容只显示大小
+    """
+    if is_buffer(source):
+        return f"<{memoryview(source).nbytes} bytes in memory>"
+    return getattr(source, 'name', source)
+
+
+def read_excel(source, engine=None, **kwargs):
+    """
+    用选定的引擎调用 pd.read_excel；calamine读取失败时自动改用openpyxl
+
+    source可以是文件路径、文件对象或内存中的文件内容（bytes/memoryview）
+    """
+    engine = resolve_engine(engine)
+    if engine == 'calamine':
+        try:
+            return pd.read_excel(excel_source(source), engine='calamine', **kwargs)
+        except Exception as e:
+            logging.warning(f"calamine could not read {source_name(source)}, falling back to openpyxl: {str(e)}")
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    return pd.read_excel(excel_source(source), engine='openpyxl', **kwargs)
+
+
+def open_excel_file(source, engine=None):
+    """
+    用选定的引擎打开 pd.ExcelFile；calamine打开失败时自动改用openpyxl
+    """
+    engine = resolve_engine(engine)
+    if engine == 'calamine':
+        try:
+            return pd.ExcelFile(excel_source(source), engine='calamine')
+        except Exception as e:
+            logging.warning(f"calamine could not open {source_name(source)}, falling back to openpyxl: {str(e)}")
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    return pd.ExcelFile(excel_source(source), engine='openpyxl')
+
+
+def cell_text(df, col_idx):
+    """
+    第col_idx列各单元格的 str() 文本，空单元格和不存在的列为''
+
+    返回object类型的Series，.str 方法按Python的str处理（strip、isdigit等与逐个单元格处理相同）
+    """
+    if col_idx >= df.shape[1]:
+        return pd.Series('', index=df.index, dtype=object)
+    column = df.iloc[:, col_idx]
+    if isinstance(column.dtype, pd.StringDtype):
+        # 字符串列的值已经是str
+        return column.astype(object).where(column.notna(), '')
+    column = column.astype(object)
+    return column.map(str).astype(object).where(column.notna(), '')
+
+
+def pop_engine_option(argv):
+    """
+    从命令行参数中取出 --engine=<引擎> 或 --engine <引擎>，返回 (引擎或None, 其余参数)
+    """
+    engine = None
+    remaining = []
+    args = iter(argv)
+    for arg in args:
+        if arg.startswith('--engine='):
+            engine = arg.split('=', 1)[1]
+        elif arg == '--engine':
+            engine = next(args, None)
+        else:
+            remaining.append(arg)
+    return engine, remaining
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import pandas as pd
+
+# 表头只在前15行中查找，数据起始行在表头之后的20行内查找
+HEADER_SCAN_ROWS = 15
+DATA_START_SCAN_ROWS = 20
+# 识别布局需要的行数：最后一个可能的表头行之后再加上数据起始行的查找范围
+LAYOUT_HEAD_ROWS = HEADER_SCAN_ROWS + DATA_START_SCAN_ROWS
+
+HEADER_KEYWORDS = ['QTY', 'QUANTITY', 'PRICE', 'AMOUNT', 'DESC', 'DESCRIPTION']
+REQUIRED_COLUMNS = ['Item#', 'Model_No', 'P/N', 'Desc', 'Qty', 'Price']
+
+# 没有找到表头或表头缺少必要的列时使用的默认列位置
+DEFAULT_COLUMN_INDICES = {
+    'Item#': 0,      # Item number (1, 2, 3...)
+    'Model_No': 1,   # Model number (IPC-K7CP-3H1WE)
+    'P/N': 2,        # Part number (1.2.03.01.0002)
+    'Desc': 3,       # Description
+    'Country': 4,    # Country
+    'Qty': 5,        # Quantity
+    'Price': 6,      # Unit price
+    'Amount': 7,     # Total amount
+}
+
+# 每个进程最多记住的模板数
+MAX_CACHED_LAYOUTS = 64
+
+# 已知模板布局的保存位置及数量上限
+DEFAULT_LAYOUT_REGISTRY_PATH = os.path.join("cache", "invoice_layouts.json")
+DEFAULT_MAX_REGISTERED_LAYOUTS = 256
+
+
+def head_rows(df, nrows=LAYOUT_HEAD_ROWS):
+    """
+    DataFrame前nrows行的单元格值（元组列表），供布局识别使用
+    """
+    return list(df.head(nrows).itertuples(index=False, name=None))
+
+
+def is_item_number(value):
+    return pd.notna(value) and str(value).strip().isdigit()
+
+
+def header_fingerprint(row):
+    """
+    表头行的指纹：非空单元格的位置和大写文本，相同模板的表头指纹相同
+    """
+    cells = [(idx, str(cell).upper().strip()) for idx, cell in enumerate(row) if pd.notna(cell)]
+    return hashlib.sha1(repr(cells).encode('utf-8')).hexdigest()
+
+
+def row_text(row):
+    return ' '.join([str(cell).upper() for cell in row if pd.notna(cell)])
+
+
+def has_header_keyword(row):
+    """
+    行中是否包含数量、价格、金额或描述等表头关键词
+    """
+    row_str = row_text(row)
+    return any(keyword in row_str for keyword in HEADER_KEYWORDS)
+
+
+def find_header_row(rows):
+    """
+    前15行中第一个包含数量、价格、金额或描述等关键词的行，没有时返回None
+    """
+    for i, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        if has_header_keyword(row):
+            logging.info(f"Found potential header row at index {i}: {row_text(row)}")
+            return i
+    return None
+
+
+def map_columns(header_row):
+    """
+    根据表头文本确定各列的位置，缺少必要的列时使用默认列位置
+    """
+    column_indices = {}
+    for idx, cell in enumerate(header_row):
+        if pd.notna(cell):
+            cell_str = str(cell).upper().strip()
+            if any(keyword in cell_str for keyword in ['ITEM', 'NO', 'SL']) and 'Item#' not in column_indices:
+                column_indices['Item#'] = idx
+            elif any(keyword in cell_str for keyword in ['MODEL', 'PART']) and 'Model_No' not in column_indices:
+                column_indices['Model_No'] = idx
+            elif ('P/N' in cell_str or 'PN' in cell_str) and 'P/N' not in column_indices:
+                column_indices['P/N'] = idx
+            elif any(keyword in cell_str for keyword in ['DESC', 'DESCRIPTION']) and 'Desc' not in column_indices:
+                column_indices['Desc'] = idx
+            elif any(keyword in cell_str for keyword in ['COUNTRY', 'ORIGIN']) and 'Country' not in column_indices:
+                column_indices['Country'] = idx
+            elif any(keyword in cell_str for keyword in ['QTY', 'QUANTITY']) and 'Qty' not in column_indices:
+                column_indices['Qty'] = idx
+            elif any(keyword in cell_str for keyword in ['PRICE', 'RATE']) and 'Price' not in column_indices:
+                column_indices['Price'] = idx
+            elif any(keyword in cell_str for keyword in ['AMOUNT', 'TOTAL']) and 'Amount' not in column_indices:
+                column_indices['Amount'] = idx
+
+    logging.info(f"Dynamic column mapping: {column_indices}")
+
+    # 检查是否所有必要的列都被检测到
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in column_indices]
+    if missing_columns:
+        logging.warning(f"Dynamic column detection failed, missing columns: {missing_columns}")
+        logging.warning("Using default mapping")
+        return dict(DEFAULT_COLUMN_INDICES)
+
+    # 补充可能缺失的非必要列
+    if 'Country' not in column_indices:
+        column_indices['Country'] = 4  # 默认值
+    if 'Amount' not in column_indices:
+        column_indices['Amount'] = 7   # 默认值
+    return column_indices
+
+
+def find_data_start(rows, search_start):
+    """
+    search_start之后20行内第一个第一列为数字（Item#）的行，没有时返回None
+    """
+    for row_idx in range(search_start, min(search_start + DATA_START_SCAN_ROWS, len(rows))):
+        if is_item_number(rows[row_idx][0]):
+            return row_idx
+    return None
+
+
+class InvoiceLayout:
+    """
+    发票工作表的布局：表头行、各列位置和数据起始行（行号均为DataFrame中的行号）
+
+    fingerprint为表头行的指纹，没有表头时为None
+    """
+
+    def __init__(self, header_row, column_indices, data_start, fingerprint=None):
+        self.header_row = header_row
+        self.column_indices = column_indices
+        self.data_start = data_start
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return (f"InvoiceLayout(header_row={self.header_row}, data_start={self.data_start}, "
+                f"column_indices={self.column_indices})")
+
+    def matches(self, rows):
+        """
+        rows是否属于同一模板：表头位置上的行指纹相同，之前的行中没有表头关键词
+        （否则识别时会把更早的行当作表头），且数据仍从同一行开始
+        """
+        if self.header_row is None or self.data_start is None or self.data_start >= len(rows):
+            return False
+        if header_fingerprint(rows[self.header_row]) != self.fingerprint:
+            return False
+        if any(has_header_keyword(row) for row in rows[:self.header_row]):
+            return False
+        if not is_item_number(rows[self.data_start][0]):
+            return False
+        return not any(is_item_number(row[0]) for row in rows[self.header_row + 1:self.data_start])
+
+    def narrow_columns(self, rows):
+        """
+        只读取需要的列时使用的列位置（第一列和各列），不能只读这几列时返回None
+
+        需要的每一列在表头行都是文本时，整表读取的这些列是object列，单元格值与
+        dtype=object 只读这几列时完全相同；否则（例如使用默认列位置而该列没有表头）
+        整表读取时可能推断为数值列，只能读取整个工作表。
+        """
+        if self.header_row is None or self.data_start is None or self.header_row >= len(rows):
+            return None
+        header = rows[self.header_row]
+        columns = sorted({0, *self.column_indices.values()})
+        if all(idx < len(header) and isinstance(header[idx], str) for idx in columns):
+            return columns
+        return None
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'header_row': self.header_row,
+            'data_start': self.data_start,
+            'column_indices': self.column_indices,
+        }
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry['header_row'], dict(entry['column_indices']), entry['data_start'], entry['fingerprint'])
+
+
+def detect_layout(rows):
+    """
+    根据工作表的前 LAYOUT_HEAD_ROWS 行识别布局
+    """
+    header_row_idx = find_header_row(rows)
+    if header_row_idx is not None:
+        column_indices = map_columns(rows[header_row_idx])
+        fingerprint = header_fingerprint(rows[header_row_idx])
+    else:
+        logging.warning("No header row found, using default mapping")
+        column_indices = dict(DEFAULT_COLUMN_INDICES)
+        fingerprint = None
+
+    # 查找数据开始的行（在表头行之后，包含数字的行）
+    data_start = find_data_start(rows, header_row_idx + 1 if header_row_idx is not None else 0)
+    return InvoiceLayout(header_row_idx, column_indices, data_start, fingerprint)
+
+
+class LayoutRegistry:
+    """
+    已知发票模板的布局（JSON），以表头行指纹为键，跨运行保存
+
+    多个工作进程可能同时写入：每次添加时重新读取文件合并后再整体替换。
+    文件损坏或无法写入时只记录警告，不影响处理。
+    """
+
+    def __init__(self, path=DEFAULT_LAYOUT_REGISTRY_PATH, max_layouts=DEFAULT_MAX_REGISTERED_LAYOUTS):
+        self.path = path
+        self.max_layouts = max_layouts
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read invoice layout registry {self.path}: {str(e)}")
+            return []
+        return entries if isinstance(entries, list) else []
+
+    def load(self):
+        """
+        返回已保存的布局，最近添加的在前
+        """
+        layouts = []
+        for entry in reversed(self._read()):
+            try:
+                layouts.append(InvoiceLayout.from_dict(entry))
+            except (KeyError, TypeError) as e:
+                logging.warning(f"Skipping invalid invoice layout entry: {str(e)}")
+        return layouts
+
+    def add(self, layout):
+        entry = layout.to_dict()
+        entries = [e for e in self._read()
+                   if (e.get('fingerprint'), e.get('header_row')) != (layout.fingerprint, layout.header_row)]
+        entries.append(entry)
+        entries = entries[-self.max_layouts:]
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Invoice layout not registered: {str(e)}")
+            return
+        logging.info(f"Registered invoice layout {layout} in {self.path}")
+
+
+class LayoutDetector:
+    """
+    带缓存的布局识别：同一供应商模板的工作表表头相同，识别过一次后，
+    之后的工作表只需确认表头位置上的行指纹相同，不再逐行查找表头和匹配列名。
+
+    缓存在进程内有效（streamlit服务进程中跨多次处理），每个工作进程各有一份。
+    传入registry（LayoutRegistry）时，先使用以前运行中识别过的模板，新识别的模板也保存到registry。
+    """
+
+    def __init__(self, max_layouts=MAX_CACHED_LAYOUTS, registry=None):
+        self.max_layouts = max_layouts
+        self.registry = registry
+        self._layouts = OrderedDict()
+        self._registry_loaded = registry is None
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, layout, front=True):
+        key = (layout.header_row, layout.fingerprint)
+        self._layouts[key] = layout
+        self._layouts.move_to_end(key, last=not front)
+        while len(self._layouts) > self.max_layouts:
+            self._layouts.popitem()
+
+    def detect(self, rows):
+        if not self._registry_loaded:
+            for layout in self.registry.load()[:self.max_layouts]:
+                self._remember(layout, front=False)
+            self._registry_loaded = True
+
+        for key, layout in self._layouts.items():
+            if layout.matches(rows):
+                self._layouts.move_to_end(key, last=False)
+                self.hits += 1
+                return layout
+
+        self.misses += 1
+        layout = detect_layout(rows)
+        # 只记住找到了表头和数据行的布局
+        if layout.fingerprint is not None and layout.data_start is not None:
+            self._remember(layout)
+            if self.registry is not None:
+                self.registry.add(layout)
+        return layout
+
+    def clear(self):
+        self._layouts.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,366 @@
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from desc_normalizer import clean_invoice_descs
+from excel_reader import cell_text, is_buffer, open_excel_file, resolve_engine
+from invoice_layout import DEFAULT_COLUMN_INDICES, LAYOUT_HEAD_ROWS, LayoutDetector, head_rows
+
+# 默认逐个工作表解析；大于1时用多个进程并行解析
+DEFAULT_SHEET_WORKERS = 1
+
+# 发票工作表解析结果的列（按输出顺序），税率列由调用方统一匹配后填充
+INVOICE_SHEET_COLUMNS = ['Item#', 'ID', 'P/N', 'Desc', 'Qty', 'Price', 'Item_Name', 'HSN', 'BCD', 'SWS', 'IGST']
+
+
+def max_sheet_workers():
+    """
+    可用的最大并行进程数（CPU核数）
+    """
+    return os.cpu_count() or 1
+
+
+class InvoiceWorkbook:
+    """
+    发票工作簿会话：压缩包只打开一次、共享字符串表只解析一次，工作表在第一次使用时才读取
+
+    source可以是文件路径、内存中的文件内容（bytes/memoryview，例如上传的文件，直接解析不需要先保存）
+    或文件对象。同一个会话可以在预览、处理和命令行之间共享，已读取的工作表会被缓存，调用方不应修改返回的DataFrame。
+    传入cache（ParsedWorkbookCache）时，工作表名称和各工作表先从解析缓存读取，
+    全部命中时不打开Excel文件；digest为文件内容的sha256，已知时可避免重复计算。
+    engine为Excel读取引擎（见excel_reader），默认使用当前设置的引擎。
+    name为日志、进度和工作表名后缀中使用的文件名，默认为文件路径。
+    layout_detector为解析工作表时使用的布局识别缓存（LayoutDetector），调用方可以在多个会话之间共用
+    （例如streamlit会话中带已知模板登记表的识别缓存）；默认每个会话一个，不保存登记表。
+    """
+
+    def __init__(self, source, cache=None, digest=None, engine=None, name=None, layout_detector=None):
+        self.source = source
+        self.path = source if isinstance(source, (str, os.PathLike)) else None
+        # 文件对象无法在不读取的情况下计算内容的sha256，不使用解析缓存
+        self.cache = cache if self.path is not None or is_buffer(source) else None
+        self.digest = digest
+        self.engine = resolve_engine(engine)
+        self.name = name if name is not None else self.path
+        self.layout_detector = layout_detector if layout_detector is not None else LayoutDetector()
+        self._cache_key = None
+        self._excel_file = None
+        self._sheet_names = None
+        self._sheets = {}
+
+    def __repr__(self):
+        return f"InvoiceWorkbook({self.name if self.name is not None else '<in-memory>'})"
+
+    @property
+    def excel_file(self):
+        if self._excel_file is None:
+            self._excel_file = open_excel_file(self.source, self.engine)
+        return self._excel_file
+
+    @property
+    def cache_key(self):
+        if self.cache is not None and self._cache_key is None:
+            self._cache_key = self.cache.workbook_key(self.source, self.digest, self.engine)
+        return self._cache_key
+
+    @property
+    def sheet_names(self):
+        if self._sheet_names is None:
+            sheet_names = self.cache.load_sheet_names(self.cache_key) if self.cache is not None else None
+            if sheet_names is None:
+                sheet_names = self.excel_file.sheet_names
+                if self.cache is not None:
+                    self.cache.save_sheet_names(self.cache_key, sheet_names)
+            self._sheet_names = sheet_names
+        return self._sheet_names
+
+    def sheet(self, sheet_name, **read_kwargs):
+        """
+        读取一个工作表（相同工作表和读取参数只读取一次）
+
+        read_kwargs为 pd.read_excel 的其它参数，例如只读前几行的nrows或只读几列的usecols
+        """
+        key = (sheet_name, repr(sorted(read_kwargs.items())))
+        if key not in self._sheets:
+            df = self.cache.load_frame(self.cache_key, sheet_name, **read_kwargs) if self.cache is not None else None
+            if df is None:
+                df = self.excel_file.parse(sheet_name=sheet_name, **read_kwargs)
+                if self.cache is not None:
+                    self.cache.save_frame(self.cache_key, sheet_name, df, **read_kwargs)
+            self._sheets[key] = df
+        return self._sheets[key]
+
+    def is_loaded(self, sheet_name):
+        """
+        整个工作表是否已经读取过
+        """
+        return (sheet_name, repr([])) in self._sheets
+
+    def head_rows(self, sheet_name, nrows=LAYOUT_HEAD_ROWS):
+        """
+        工作表前nrows行的单元格值，供布局识别使用；整个工作表还没有读取时只读取前nrows行
+        """
+        if self.is_loaded(sheet_name):
+            return head_rows(self.sheet(sheet_name), nrows)
+        return head_rows(self.sheet(sheet_name, nrows=nrows), nrows)
+
+    def close(self):
+        if self._excel_file is not None:
+            self._excel_file.close()
+            self._excel_file = None
+        self._sheets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_workbook(workbook):
+    """
+    返回workbook对应的会话：已经是InvoiceWorkbook时直接使用，否则新建一个
+    """
+    if isinstance(workbook, InvoiceWorkbook):
+        return workbook
+    return InvoiceWorkbook(workbook)
+
+
+def read_invoice_sheet(workbook, sheet_name):
+    """
+    读取发票文件中的一个工作表
+    """
+    return open_workbook(workbook).sheet(sheet_name)
+
+
+def desc_present(df, col_idx):
+    """
+    第col_idx列各单元格是否有内容（非空且为真值，例如0不算有内容）
+    """
+    if col_idx >= df.shape[1]:
+        return pd.Series(False, index=df.index)
+    column = df.iloc[:, col_idx].astype(object)
+    return column.map(bool, na_action='ignore').eq(True)
+
+
+def parse_invoice_sheet(workbook, original_sheet_name, processed_sheet_name, layout_detector=None):
+    """
+    读取并解析一个发票工作表：检测表头和列位置，提取有效的数据行
+
+    返回包含 Item#/ID/P/N/Desc/Qty/Price/Item_Name 及空税率列的DataFrame，
+    没有数据行时返回None。税率由调用方对整个工作簿统一匹配。
+    layout_detector默认使用工作簿会话的 LayoutDetector。
+    """
+    logging.info(f"Processing sheet: {original_sheet_name}")
+    workbook = open_workbook(workbook)
+    layout_detector = layout_detector or workbook.layout_detector
+
+    # 先只读前几行识别表头、列位置和数据起始行，已知模板直接使用登记的布局
+    rows = workbook.head_rows(original_sheet_name)
+    layout = layout_detector.detect(rows)
+    usecols = layout.narrow_columns(rows) if not workbook.is_loaded(original_sheet_name) else None
+    if usecols is not None:
+        # 只读取需要的几列，跳过数据起始行之前的行；列位置换成在这几列中的位置
+        df = workbook.sheet(original_sheet_name, usecols=usecols, skiprows=range(1, layout.data_start + 1),
+                            dtype=object)
+        column_indices = {name: usecols.index(idx) for name, idx in layout.column_indices.items()}
+        data_start_row = 0
+        logging.info(f"Read columns {usecols} of sheet {original_sheet_name} from row {layout.data_start}")
+    else:
+        # Read the sheet
+        df = workbook.sheet(original_sheet_name)
+        # 只读前几行时各列的类型推断可能与整表不同，按整表的前几行重新确认布局
+        layout = layout_detector.detect(head_rows(df))
+        column_indices = dict(layout.column_indices)
+        data_start_row = layout.data_start
+    logging.info(f"Sheet data loaded. Shape: {df.shape}")
+    if not df.empty:
+        logging.info(f"First few columns: {df.columns[:5].tolist() if len(df.columns) > 5 else df.columns.tolist()}")
+    logging.info(f"Using column indices for sheet {original_sheet_name}: {column_indices}")
+
+    if data_start_row is None:
+        logging.warning(f"No data rows found in sheet {original_sheet_name}")
+        return None
+    logging.info(f"Found data starting at row {layout.data_start} in sheet {original_sheet_name}")
+
+    # 提取数据行
+    data_df = df.iloc[data_start_row:].reset_index(drop=True)
+
+    # 只处理有数据的行：第一列是有效的Item#
+    if data_df.shape[1] > 0:
+        item_cells = cell_text(data_df, 0).str.strip()
+        is_valid = data_df.iloc[:, 0].notna() & item_cells.str.isdigit()
+    else:
+        is_valid = pd.Series(False, index=data_df.index)
+    valid_rows = data_df.index[is_valid]
+
+    if len(valid_rows) == 0:
+        logging.warning(f"No valid data rows found in sheet {original_sheet_name}")
+        return None
+    
+    logging.info(f"Found {len(valid_rows)} valid data rows in sheet {original_sheet_name}")
+    
+    # 最终安全检查：确保所有必要的列索引都存在
+    required_keys = ['Item#', 'Model_No', 'P/N', 'Desc', 'Country', 'Qty', 'Price']
+    for key in required_keys:
+        if key not in column_indices:
+            logging.error(f"Missing required column index: {key}")
+            logging.error(f"Available column indices: {column_indices}")
+            logging.error("Falling back to default mapping")
+            column_indices = dict(DEFAULT_COLUMN_INDICES)
+            break
+
+    # 添加详细的调试信息，特别关注Qty字段
+    for row_idx in valid_rows[valid_rows < 3]:  # 只记录前3行的调试信息
+        row = data_df.iloc[row_idx]
+        logging.info(f"Row {row_idx} debugging:")
+        logging.info(f"  - Row length: {len(row)}")
+        logging.info(f"  - Qty column index: {column_indices.get('Qty', 'NOT_FOUND')}")
+        for name in ['Qty', 'Price']:
+            if name in column_indices and column_indices[name] < len(row):
+                raw_value = row.iloc[column_indices[name]]
+                processed_value = raw_value if pd.notna(raw_value) else ''
+                logging.info(f"  - Raw {name} value: '{raw_value}' (type: {type(raw_value)})")
+                logging.info(f"  - Processed {name}: '{processed_value}'")
+            else:
+                logging.info(f"  - {name} column index out of range or not found")
+
+    # 按列提取有效行的数据
+    rows_df = data_df.loc[valid_rows].reset_index(drop=True)
+    item_num = cell_text(rows_df, column_indices['Item#']).str.strip()
+    desc = cell_text(rows_df, column_indices['Desc'])
+
+    # 处理描述字段：Item_Name为第一个'-'之前的部分，描述文本只保留字母数字、点和括号；空描述为''
+    has_desc = desc_present(rows_df, column_indices['Desc'])
+    item_name = desc.str.split('-', n=1).str[0].str.strip().where(has_desc, '')
+    clean_desc = clean_invoice_descs(desc).where(has_desc, '')
+
+    # 税率列保持为空，由调用方统一匹配后填充
+    empty = pd.Series('', index=rows_df.index, dtype=object)
+    columns = {
+        'Item#': item_num,
+        'ID': processed_sheet_name + '_' + item_num,
+        'P/N': cell_text(rows_df, column_indices['P/N']).str.strip(),
+        'Desc': clean_desc,
+        'Qty': cell_text(rows_df, column_indices['Qty']).str.strip(),
+        'Price': cell_text(rows_df, column_indices['Price']).str.strip(),
+        'Item_Name': item_name,
+        'HSN': empty,
+        'BCD': empty,
+        'SWS': empty,
+        'IGST': empty,
+    }
+    sheet_df = pd.DataFrame({name: columns[name] for name in INVOICE_SHEET_COLUMNS}).astype(str)
+    logging.info(f"Processed {len(sheet_df)} items from sheet {original_sheet_name}")
+
+    return sheet_df
+
+
+# 工作进程中按文件路径缓存的工作簿会话，同一进程处理的多个工作表共用一个会话
+_worker_workbooks = {}
+
+
+def _call_with_worker_workbook(func, file_path, cache, digest, engine, layout_detector, args):
+    workbook = _worker_workbooks.get(file_path)
+    if workbook is None:
+        workbook = _worker_workbooks[file_path] = InvoiceWorkbook(file_path, cache=cache, digest=digest,
+                                                                  engine=engine, layout_detector=layout_detector)
+    return func(workbook, *args)
+
+
+def map_invoice_sheets(func, workbook, sheet_args, workers=DEFAULT_SHEET_WORKERS):
+    """
+    对每个工作表调用 func(workbook, *args)，按sheet_args的原始顺序返回结果列表
+
+    workbook可以是InvoiceWorkbook会话或文件路径；逐个处理时所有工作表共用同一个会话。
+    workers大于1且有多个工作表时，使用ProcessPoolExecutor并行处理，每个工作进程
+    各自打开一次工作簿并使用同一个解析缓存（需要文件路径，没有路径时退回逐个处理），
+    布局识别缓存复制到每个工作进程（有登记表时识别过的模板仍保存到同一个登记表）；
+    func必须是本模块等可导入的顶层函数（不能定义在streamlit页面脚本中）。
+    结果与逐个处理完全相同，只是处理顺序不同。
+    """
+    return map_invoice_workbooks(func, [(workbook, sheet_args)], workers)[0]
+
+
+def map_invoice_workbooks(func, jobs, workers=DEFAULT_SHEET_WORKERS, progress_callback=None):
+    """
+    多个发票文件的 map_invoice_sheets：jobs为 [(workbook, sheet_args), ...]，返回每个文件的结果列表
+
+    所有文件的工作表放进同一个进程池，一个大文件和几个小文件一起处理时进程不会空闲。
+    每个文件的工作表全部处理完后调用 progress_callback(已完成文件数, 文件总数, InvoiceWorkbook会话)。
+    """
+    jobs = [(open_workbook(workbook), list(sheet_args)) for workbook, sheet_args in jobs]
+    task_count = sum(len(sheet_args) for _, sheet_args in jobs)
+    workers = min(max(1, int(workers or 1)), task_count or 1)
+    if workers > 1 and any(workbook.path is None for workbook, _ in jobs):
+        logging.warning("Workbook has no file path, parsing sheets in the current process")
+        workers = 1
+    if workers <= 1:
+        results = []
+        for workbook, sheet_args in jobs:
+            results.append([func(workbook, *args) for args in sheet_args])
+            if progress_callback is not None:
+                progress_callback(len(results), len(jobs), workbook)
+        return results
+
+    logging.info(f"Parsing {task_count} sheets from {len(jobs)} workbooks with {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [[executor.submit(_call_with_worker_workbook, func, workbook.path, workbook.cache,
+                                    workbook.digest, workbook.engine, workbook.layout_detector, args)
+                    for args in sheet_args]
+                   for workbook, sheet_args in jobs]
+        if progress_callback is not None:
+            # 按完成顺序报告进度，没有工作表的文件直接算作完成
+            remaining = [len(job_futures) for job_futures in futures]
+            owners = {future: position for position, job_futures in enumerate(futures) for future in job_futures}
+            done = 0
+            for position, count in enumerate(remaining):
+                if count == 0:
+                    done += 1
+                    progress_callback(done, len(jobs), jobs[position][0])
+            for future in as_completed(owners):
+                position = owners[future]
+                remaining[position] -= 1
+                if remaining[position] == 0:
+                    done += 1
+                    progress_callback(done, len(jobs), jobs[position][0])
+        return [[future.result() for future in job_futures] for job_futures in futures]
+
+
+def invoice_file_suffix(file_path):
+    """
+    发票文件的后缀，与 processing_invoices.py 相同：processing_invoices2.xlsx -> '2'
+    """
+    file_id = os.path.splitext(os.path.basename(file_path))[0]
+    return file_id.replace('processing_invoices', '')
+
+
+def add_file_suffixes(sheet_names_per_file, file_paths):
+    """
+    多个发票文件中有同名的工作表时，与 processing_invoices.py 一样在后面文件的工作表名后加上文件后缀，
+    避免生成重复的ID而被去重删掉；只有一个文件或没有重名时名称不变
+    """
+    seen = set()
+    result = []
+    for position, (sheet_names, file_path) in enumerate(zip(sheet_names_per_file, file_paths)):
+        suffix = (invoice_file_suffix(file_path) if file_path is not None else '') or str(position + 1)
+        sheet_names = [f"{name}{suffix}" if name in seen else name for name in sheet_names]
+        seen.update(sheet_names)
+        result.append(sheet_names)
+    return result
+
+
+def expand_invoice_paths(spec):
+    """
+    命令行中的发票文件参数：可以用逗号分隔多个文件，也可以使用通配符，
+    例如 input/processing_invoices*.xlsx；没有匹配的文件名原样保留，由读取时报错
+    """
+    file_paths = []
+    for pattern in spec.split(','):
+        pattern = pattern.strip()
+        if pattern:
+            file_paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return file_paths
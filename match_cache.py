@@ -0,0 +1,166 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 缓存文件默认位置及容量
+DEFAULT_CACHE_DIR = "cache"
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "match_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 50000
+
+# SQLite单条语句的参数个数有限，批量查询时分块
+_SQL_CHUNK_SIZE = 500
+
+# 进程内共用的缓存实例，按缓存文件的绝对路径区分
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+class MatchCache:
+    """
+    持久化的匹配结果缓存（SQLite）
+
+    以 (税率表指纹, 标准化Item Name) 为键，保存匹配到的税率键；
+    None 表示"没有匹配"。税率表变化后指纹改变，旧结果自然失效，
+    超过容量时按最近使用时间淘汰最旧的记录。
+
+    每个实例只打开一个SQLite连接，所有查询和写入共用（逐个匹配时不再每次重新连接）。
+    同一个索引可能在streamlit的不同脚本线程中使用，连接的使用由锁保护。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.enabled = True
+        self._conn = None
+        self._lock = threading.Lock()
+
+        try:
+            cache_dir = os.path.dirname(path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS matches ("
+                    " fingerprint TEXT NOT NULL,"
+                    " item TEXT NOT NULL,"
+                    " match TEXT,"
+                    " last_used REAL NOT NULL,"
+                    " PRIMARY KEY (fingerprint, item))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used)")
+            logging.info(f"Match cache ready: {path} (max {max_entries} entries)")
+        except sqlite3.Error as e:
+            logging.warning(f"Match cache disabled, could not open {path}: {str(e)}")
+            self.enabled = False
+
+    @contextmanager
+    def _connect(self):
+        """
+        使用本实例的连接执行一个事务（第一次使用时打开连接）
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            with self._conn:
+                yield self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_many(self, fingerprint, items):
+        """
+        批量查询，返回 {item: match}；未缓存的item不包含在结果中
+        """
+        items = list(dict.fromkeys(items))
+        if not self.enabled or not items:
+            return {}
+
+        found = {}
+        try:
+            with self._connect() as conn:
+                for start in range(0, len(items), _SQL_CHUNK_SIZE):
+                    chunk = items[start:start + _SQL_CHUNK_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT item, match FROM matches WHERE fingerprint = ? AND item IN ({placeholders})",
+                        [fingerprint, *chunk]
+                    ).fetchall()
+                    found.update(rows)
+
+                # 更新命中记录的使用时间
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE matches SET last_used = ? WHERE fingerprint = ? AND item = ?",
+                        [(now, fingerprint, item) for item in found]
+                    )
+        except sqlite3.Error as e:
+            logging.warning(f"Match cache lookup failed: {str(e)}")
+            return {}
+
+        return found
+
+    def put_many(self, fingerprint, matches):
+        """
+        批量写入 {item: match}，写入后按容量淘汰最久未使用的记录
+        """
+        if not self.enabled or not matches:
+            return
+
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO matches (fingerprint, item, match, last_used) VALUES (?, ?, ?, ?)",
+                    [(fingerprint, item, match, now) for item, match in matches.items()]
+                )
+
+                total = conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+                if total > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM matches WHERE rowid IN ("
+                        " SELECT rowid FROM matches ORDER BY last_used LIMIT ?)",
+                        (total - self.max_entries,)
+                    )
+                    logging.info(f"Match cache evicted {total - self.max_entries} least recently used entries")
+        except sqlite3.Error as e:
+            logging.warning(f"Match cache write failed: {str(e)}")
+
+    def get(self, fingerprint, item):
+        """
+        查询单个item，返回 (是否命中, match)
+        """
+        found = self.get_many(fingerprint, [item])
+        if item in found:
+            return True, found[item]
+        return False, None
+
+    def put(self, fingerprint, item, match):
+        self.put_many(fingerprint, {item: match})
+
+    def __len__(self):
+        if not self.enabled:
+            return 0
+        try:
+            with self._connect() as conn:
+                return conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+def shared_match_cache(path=DEFAULT_CACHE_PATH):
+    """
+    进程内共用的MatchCache：同一缓存文件只创建一个实例（一个连接），
+    每次处理和每次重新加载税率表都使用它，不再各自打开新的连接
+    """
+    path = os.path.abspath(path)
+    with _shared_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = MatchCache(path)
+        return _shared_caches[path]
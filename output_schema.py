@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+# 处理后的发票和核对清单中各列的类型：
+# 文本列为字符串类型（空值为NaN），数量和单价为float64（有无法解析为数字的文本时保留原文本，为object列），
+# HSN为规范化后的文本，税率列为规范化文本的category
+TEXT_COLUMNS = ['Item#', 'ID', 'P/N', 'Desc', 'Item_Name']
+NUMBER_COLUMNS = ['Qty', 'Price']
+CODE_COLUMNS = ['HSN']
+RATE_COLUMNS = ['BCD', 'SWS', 'IGST']
+# 与pandas 3默认的str类型相同
+TEXT_DTYPE = pd.StringDtype(na_value=np.nan)
+# 文本为这些值（不区分大小写）时视为空值
+EMPTY_TEXTS = ['nan', 'none']
+
+
+def text_values(values):
+    """
+    转为字符串类型，"nan"/"none"文本视为空值
+    """
+    values = values.astype(TEXT_DTYPE)
+    return values.mask(values.str.lower().isin(EMPTY_TEXTS))
+
+
+def number_values(values):
+    """
+    转为数字：能解析为数字的值为float，无法解析的文本（如"N/A"）保持原文本，空值为NaN
+    全部能解析时为float64列，有无法解析的文本时为object列
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype('float64')
+    numbers, texts = number_parts(values)
+    if texts.isna().all():
+        return numbers
+    return numbers.astype(object).where(texts.isna(), texts)
+
+
+def number_parts(values):
+    """
+    把数字列拆为 (数字, 无法解析为数字的原文本)：数字为float64，不是数字的位置为NaN；
+    原文本为字符串类型，数字和空值的位置为NaN
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype('float64'), pd.Series(np.nan, index=values.index, dtype=TEXT_DTYPE)
+    is_number = values.map(lambda value: isinstance(value, (int, float)) and not isinstance(value, bool))
+    texts = text_values(values.where(~is_number))
+    texts = texts.mask(texts.str.strip() == '')
+    numbers = pd.to_numeric(values.where(is_number, texts.astype(object)), errors='coerce').astype('float64')
+    return numbers, texts.where(numbers.isna())
+
+
+def strip_zeros(values):
+    """
+    去除小数点后多余的零（85423900.0 -> 85423900，7.50 -> 7.5），不含小数点的文本不变
+    """
+    has_dot = values.str.contains('.', regex=False)
+    return values.where(~has_dot, values.str.rstrip('0').str.rstrip('.'))
+
+
+def code_values(values):
+    """
+    HSN等代码：空值为''，去除小数点后多余的零
+    """
+    return strip_zeros(text_values(values).fillna(''))
+
+
+def rate_values(values):
+    """
+    税率：与代码相同规范化后转为category（取值只有少数几种，包括'new item'）
+    """
+    return code_values(values).astype('category')
+
+
+def output_column(col, values):
+    """
+    按列名把一列转为输出类型，不在定义中的列保持不变
+    """
+    if col in TEXT_COLUMNS:
+        return text_values(values)
+    if col in NUMBER_COLUMNS:
+        return number_values(values)
+    if col in CODE_COLUMNS:
+        return code_values(values)
+    if col in RATE_COLUMNS:
+        return rate_values(values)
+    return values
+
+
+def to_output_schema(df):
+    """
+    把各列为文本的处理结果转为定义的输出类型
+    """
+    return pd.DataFrame({col: output_column(col, df[col]) for col in df.columns}, index=df.index)
+
+
+def display_values(values):
+    """
+    转为显示/导出用的文本：数字去除多余的零，空值为''
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return strip_zeros(values.astype(TEXT_DTYPE)).fillna('')
+    texts = values.astype(object).where(values.notna(), '').astype(str)
+    # 数字列中混有无法解析的文本时为object列，其中的数字同样去除多余的零
+    is_float = values.map(lambda value: isinstance(value, float))
+    if is_float.any():
+        texts = texts.where(~is_float, strip_zeros(texts[is_float]))
+    return texts
+
+
+def display_frame(df):
+    """
+    所有列转为显示/导出用的文本，只在显示到页面或写入Excel时使用
+    """
+    return pd.DataFrame({col: display_values(df[col]) for col in df.columns}, index=df.index)
@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import sys
 
+from desc_normalizer import clean_checklist_desc
+
 def process_excel(file_path):
     try:
         print("开始清理checkList文件")
@@ -43,17 +45,8 @@ def process_excel(file_path):
                     item_id = f"{current_invoice}_{int(row['Item#'])}"
                     item_name = str(row['Desc']).split('-')[0] if pd.notna(row['Desc']) else ''
 
-                    # 修改item_name的处理逻辑
-                    desc = ''
-                    if pd.notna(row['Desc']):
-                        # 分割字符串，取"-PART NO"之前的部分
-                        desc_parts = str(row['Desc']).split('-PART NO')
-                        desc = desc_parts[0]
-                        # 只保留字母数字和点号，并转换为大写
-                        desc = desc.replace('+OR-', '')
-                        desc = desc.replace('DEG', '')
-                        desc = desc.replace('-', '')
-                        desc = ''.join(char for char in desc if char.isalnum() or char in '.()').upper()
+                    # 清理描述：取"-PART NO"之前的部分，只保留字母数字和 .() 并转为大写
+                    desc = clean_checklist_desc(row['Desc']) if pd.notna(row['Desc']) else ''
                     
                     result_rows.append({
                         'Item#': row['Item#'],
@@ -3,6 +3,9 @@ import warnings
 import os
 import glob
 
+from desc_normalizer import clean_invoice_desc
+from duty_rates import aggregate_duty_rates
+
 # Filter out the warning about print area
 warnings.filterwarnings('ignore', message='Print area cannot be set to Defined name')
 
@@ -13,25 +16,7 @@ def get_duty_rates():
         df = pd.read_excel('input/duty_rate.xlsx')
         
         # Group by Item_Name and aggregate other columns
-        grouped_df = df.groupby('Item Name').agg({
-            'HSN1': lambda x: ' '.join(str(i) for i in x if pd.notna(i)),  # Concatenate HSN1 with space
-            'HSN2': lambda x: ' '.join(str(i) for i in x if pd.notna(i)),  # Add HSN2
-            'Final BCD': 'min',
-            'Final SWS': 'min',
-            'Final IGST': 'min'
-        }).reset_index()
-        
-        # Convert DataFrame to dictionary
-        duty_dict = {}
-        for _, row in grouped_df.iterrows():
-            # Use HSN2 if HSN1 is empty
-            hsn_value = row['HSN1'] if pd.notna(row['HSN1']) and row['HSN1'].strip() != '' else row['HSN2']
-            duty_dict[row['Item Name']] = {
-                'hsn': hsn_value,
-                'bcd': row['Final BCD'],
-                'sws': row['Final SWS'],
-                'igst': row['Final IGST']
-            }
+        duty_dict = aggregate_duty_rates(df)
         
         return duty_dict
     except Exception as e:
@@ -65,6 +50,8 @@ def process_invoice_file(file_path, duty_rates):
         
         # Initialize DataFrame for new descriptions
         new_descriptions_df = pd.DataFrame(columns=[])
+        sheet_frames = []
+        new_item_rows = []
 
         # Process each sheet starting from the second one
         for i, original_sheet_name in enumerate(original_sheet_names):
@@ -153,7 +140,7 @@ def process_invoice_file(file_path, duty_rates):
                     sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: str(x).split('-')[0].strip() if pd.notna(x) and '-' in str(x) else x)
                 elif new_name == 'Desc':
                     # Clean the description text to only keep alphanumeric, dots, hyphens and parentheses
-                    sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: ''.join(char.upper() for char in str(x) if char.isalnum() or char in '.()').replace('Φ', '').replace('Ω', '').replace('-', '').replace('φ', '') if pd.notna(x) else x)
+                    sheet_df[new_name] = df.iloc[:, idx].apply(lambda x: clean_invoice_desc(x) if pd.notna(x) else x)
                 else:
                     sheet_df[new_name] = df.iloc[:, idx]
 
@@ -185,18 +172,23 @@ def process_invoice_file(file_path, duty_rates):
                         sheet_df.at[idx, 'IGST'] = 'new item'
                         if itemName not in unique_desc:
                             unique_desc.add(itemName)
-                            # Add unmatched items to new_descriptions_df
-                            new_descriptions_df = pd.concat([new_descriptions_df, pd.DataFrame({
-                                '发票及项号': [row['ID']],
-                                'Item Name': [itemName],
-                                'Final BCD': [''],  # Empty as this is a new item
-                                'Final SWS': [''],  # Empty as this is a new item
-                                'Final IGST': [''], # Empty as this is a new item
-                                'HSN1': ['']        # Empty as this is a new item
-                            })], ignore_index=True)
+                            # 先收集未匹配的项目，所有工作表处理完后一次生成new_descriptions_df
+                            new_item_rows.append({
+                                '发票及项号': row['ID'],
+                                'Item Name': itemName,
+                                'Final BCD': '',  # Empty as this is a new item
+                                'Final SWS': '',  # Empty as this is a new item
+                                'Final IGST': '', # Empty as this is a new item
+                                'HSN1': ''        # Empty as this is a new item
+                            })
             
-            # Append to the final DataFrame
-            final_df = pd.concat([final_df, sheet_df], ignore_index=True)
+            # 先收集各工作表的数据，最后一次拼接
+            sheet_frames.append(sheet_df)
+        
+        if sheet_frames:
+            final_df = pd.concat(sheet_frames, ignore_index=True)
+        if new_item_rows:
+            new_descriptions_df = pd.DataFrame(new_item_rows)
         
         return final_df, new_descriptions_df
         
@@ -220,17 +212,17 @@ def create_checking_list():
             
         print(f"Found {len(invoice_files)} invoice files: {invoice_files}")
         
-        # Initialize DataFrames for final results
-        all_invoices_df = pd.DataFrame()
-        all_new_items_df = pd.DataFrame()
-        
         # Process each invoice file
+        invoice_frames = []
+        new_item_frames = []
         for file_path in invoice_files:
             invoices_df, new_items_df = process_invoice_file(file_path, duty_rates)
-            
-            # Combine results
-            all_invoices_df = pd.concat([all_invoices_df, invoices_df], ignore_index=True)
-            all_new_items_df = pd.concat([all_new_items_df, new_items_df], ignore_index=True)
+            invoice_frames.append(invoices_df)
+            new_item_frames.append(new_items_df)
+        
+        # Combine results
+        all_invoices_df = pd.concat(invoice_frames, ignore_index=True)
+        all_new_items_df = pd.concat(new_item_frames, ignore_index=True)
         
         # Group new_descriptions_df by Item Name
         if not all_new_items_df.empty:
@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import sys
 import warnings
-import glob
+import itertools
 import logging
 import datetime
 import urllib.parse
@@ -12,6 +13,22 @@ import unicodedata
 import re
 from io import BytesIO
 
+from duty_matching import DutyRateIndex, MatchTrace, diff_duty_rates, affected_item_names, is_matchable_name
+from match_cache import shared_match_cache
+from duty_rates import aggregate_duty_rates
+from duty_snapshot import DutySnapshotStore, content_sha256
+from invoice_layout import LayoutDetector, LayoutRegistry
+from invoice_sheets import (DEFAULT_SHEET_WORKERS, InvoiceWorkbook, add_file_suffixes, map_invoice_workbooks,
+                            max_sheet_workers, open_workbook, parse_invoice_sheet)
+from checklist_reader import (CHECKLIST_READ_KWARGS, ChecklistStream, DEFAULT_CHECKLIST_CHUNK_ROWS, checklist_usecols,
+                              parse_checklist_rows, map_checklist_columns)
+from workbook_cache import ParsedWorkbookCache
+from excel_reader import (READER_ENGINES, calamine_available, engine_version, get_reader_engine, set_reader_engine,
+                          source_name)
+from upload_buffer import UploadBuffer
+from output_schema import (EMPTY_TEXTS, NUMBER_COLUMNS, RATE_COLUMNS, code_values, display_frame, display_values,
+                           number_parts, number_values, output_column, text_values, to_output_schema)
+
 # Set up logging
 log_dir = "logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -286,9 +303,11 @@ def normalize_filename(filename):
         logging.info(f"Using fallback filename: '{fallback_name}'")
         return fallback_name
 
-def safe_save_uploaded_file(uploaded_file, target_path):
+def buffer_uploaded_file(uploaded_file, target_path, previous_uploads=()):
     """
-    安全保存上传的文件，处理文件名编码问题
+    返回上传文件的内存缓冲区（UploadBuffer）和安全的文件名，处理文件名编码问题
+    数据预览和处理直接解析上传的数据，文件只在后台保存到target_path所在目录留档；
+    previous_uploads为上次页面刷新时的缓冲区，同一次上传直接复用，不再重新计算哈希和保存
     """
     try:
         # 标准化文件名
@@ -298,12 +317,16 @@ def safe_save_uploaded_file(uploaded_file, target_path):
         target_dir = os.path.dirname(target_path)
         safe_target_path = os.path.join(target_dir, safe_filename)
 
-        # 保存文件
-        with open(safe_target_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        upload_id = getattr(uploaded_file, 'file_id', None)
+        for upload in previous_uploads:
+            if upload_id is not None and upload.upload_id == upload_id and upload.path == safe_target_path:
+                return upload, safe_filename
 
-        logging.info(f"File saved successfully: {safe_target_path}")
-        return safe_target_path, safe_filename
+        # getvalue() 与上传控件共用同一块内存，不复制文件内容
+        upload = UploadBuffer(safe_filename, uploaded_file.getvalue(), safe_target_path, upload_id=upload_id)
+        upload.persist()
+        logging.info(f"File uploaded: {safe_target_path} ({upload.digest[:12]})")
+        return upload, safe_filename
 
     except Exception as e:
         logging.error(f"Error saving uploaded file: {str(e)}")
@@ -378,6 +401,35 @@ with st.sidebar:
 
     st.markdown("---")
 
+    # 性能设置
+    st.markdown("### ⚙️ 性能设置")
+    sheet_workers = st.number_input(
+        "并行解析进程数",
+        min_value=1,
+        max_value=max_sheet_workers(),
+        value=DEFAULT_SHEET_WORKERS,
+        step=1,
+        help="发票工作表较多时，可用多个进程同时解析各工作表；结果与逐个解析完全相同"
+    )
+    reader_engine = st.selectbox(
+        "Excel读取引擎",
+        READER_ENGINES,
+        index=READER_ENGINES.index(get_reader_engine()) if get_reader_engine() in READER_ENGINES else 0,
+        help="auto：安装了 python-calamine 时使用calamine（比openpyxl快数倍），否则使用openpyxl；"
+             "calamine无法读取某个文件时自动改用openpyxl"
+    )
+    if reader_engine != get_reader_engine():
+        set_reader_engine(reader_engine)
+    if reader_engine == 'calamine' and not calamine_available():
+        st.caption("⚠️ 未安装 python-calamine，将使用 openpyxl")
+    stream_checklist = st.checkbox(
+        "流式读取核对清单",
+        value=False,
+        help=f"每次只读取{DEFAULT_CHECKLIST_CHUNK_ROWS}行，适合几十万行的大型核对清单，内存占用不随文件大小增长；结果与一次性读取完全相同"
+    )
+
+    st.markdown("---")
+
     # 快速导航
     st.markdown("### 🧭 快速导航")
     st.markdown("""
@@ -396,115 +448,47 @@ with st.sidebar:
 # Main content area with tabs
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["文件上传", "数据预览", "处理结果", "差异报告", "日志"])
 
-def normalize_item_name(item_name):
-    """
-    标准化Item Name，用于更好的匹配
-    保留更多原始信息以避免过度匹配
-    """
-    if pd.isna(item_name) or item_name == '':
-        return ''
-
-    # 转换为字符串并转为大写
-    normalized = str(item_name).upper().strip()
+# Functions from the original scripts
 
-    # 只移除多余的空格，保留单个空格作为分隔符
-    normalized = ' '.join(normalized.split())
-    
-    # 标准化常见的分隔符为空格
-    normalized = normalized.replace('-', ' ').replace('_', ' ')
-    normalized = normalized.replace(',', ' ').replace(';', ' ')
-    
-    # 再次清理多余空格
-    normalized = ' '.join(normalized.split())
+# 与 str.split() 相同的空白字符集合（pyarrow字符串的正则中 \s 只匹配ASCII空白，
+# 也不支持 \u 转义，所以直接写入字符本身）
+ITEM_NAME_WHITESPACE_PATTERN = (
+    '[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+'
+)
 
-    return normalized
 
-def find_best_match(item_name, duty_rates_dict):
+def clean_item_names(item_names):
     """
-    为给定的item_name在duty_rates字典中找到最佳匹配
-    使用更严格的匹配策略避免错误匹配
+    清理 Item Name：所有空白字符（空格、制表符、不间断空格、换行等）
+    合并为单个空格并去掉首尾空格，空值变为空字符串
     """
-    if not item_name or pd.isna(item_name):
-        return None
-
-    normalized_item = normalize_item_name(item_name)
-
-    # 首先尝试精确匹配（原始值）
-    if item_name in duty_rates_dict:
-        return item_name
-
-    # 尝试标准化后的精确匹配
-    for duty_item in duty_rates_dict.keys():
-        if normalize_item_name(duty_item) == normalized_item:
-            return duty_item
-
-    # 更严格的部分匹配策略
-    best_match = None
-    best_score = 0
-    
-    # 将标准化后的item_name分割成单词
-    item_words = normalized_item.split()
-    
-    for duty_item in duty_rates_dict.keys():
-        normalized_duty = normalize_item_name(duty_item)
-        duty_words = normalized_duty.split()
-        
-        # 计算匹配分数 - 使用更严格的策略
-        score = 0
-        
-        # 策略1: 完全相同的单词匹配
-        if len(item_words) == len(duty_words):
-            matching_words = sum(1 for w1, w2 in zip(item_words, duty_words) if w1 == w2)
-            if matching_words == len(item_words):
-                # 完全匹配，直接返回
-                return duty_item
-            elif matching_words >= len(item_words) * 0.8:  # 至少80%的单词匹配
-                score = matching_words / len(item_words)
-        
-        # 策略2: 检查是否所有关键词都存在（适用于不同长度的情况）
-        elif len(item_words) <= len(duty_words):
-            # 检查item的所有单词是否都在duty中出现
-            matching_words = sum(1 for word in item_words if word in duty_words)
-            if matching_words == len(item_words) and len(item_words) >= 2:
-                # 所有单词都匹配，且至少有2个单词
-                score = 0.9  # 给一个较高但不是最高的分数
-        
-        # 策略3: 对于单个长单词，使用更严格的子串匹配
-        elif len(item_words) == 1 and len(duty_words) == 1:
-            item_word = item_words[0]
-            duty_word = duty_words[0]
-            
-            # 只有当一个词完全包含另一个词，且长度差异不大时才匹配
-            if item_word in duty_word or duty_word in item_word:
-                shorter_len = min(len(item_word), len(duty_word))
-                longer_len = max(len(item_word), len(duty_word))
-                
-                # 长度差异不能超过30%，且较短的词至少要有6个字符
-                if shorter_len >= 6 and (longer_len - shorter_len) / longer_len <= 0.3:
-                    score = shorter_len / longer_len
-        
-        # 更新最佳匹配 - 提高阈值到0.85
-        if score > best_score and score >= 0.85:
-            best_score = score
-            best_match = duty_item
-            
-            # 记录匹配信息用于调试
-            logging.info(f"Potential match found: '{item_name}' -> '{duty_item}' (score: {score:.3f})")
-
-    # 如果找到匹配，记录详细信息
-    if best_match:
-        logging.info(f"Best match selected: '{item_name}' -> '{best_match}' (final score: {best_score:.3f})")
-    else:
-        logging.info(f"No suitable match found for: '{item_name}' (normalized: '{normalized_item}')")
+    return (
+        item_names.astype(str)
+        .str.replace(ITEM_NAME_WHITESPACE_PATTERN, ' ', regex=True)
+        .str.strip(' ')
+        .where(item_names.notna(), '')
+    )
 
-    return best_match
 
-# Functions from the original scripts
-def get_duty_rates(file_path):
-    logging.info(f"Reading duty rates from: {file_path}")
+def get_duty_rates(file_path, content_digest=None):
+    """
+    读取税率文件，返回 (duty_dict, 原始DataFrame, DutyRateIndex)
+    索引在每次加载时只构建一次，供后续所有匹配使用
+    税率文件内容不变时直接读取二进制快照，不再解析Excel
+    file_path也可以是内存中的文件内容（上传的文件），content_digest为内容的sha256
+    """
+    logging.info(f"Reading duty rates from: {source_name(file_path)}")
     try:
-        # Read duty_rate.xlsx
-        df = pd.read_excel(file_path)
+        snapshot_store = DutySnapshotStore()
+        snapshot_key = snapshot_store.snapshot_key(file_path, f"streamlit_app:{engine_version()}", content_digest)
+        snapshot = snapshot_store.load(snapshot_key)
+        if snapshot is not None:
+            duty_dict, df, normalized_names = snapshot
+            duty_index = DutyRateIndex(duty_dict, match_cache=shared_match_cache(), normalized_names=normalized_names)
+            return duty_dict, df, duty_index
+
+        # Read duty_rate.xlsx（相同内容的文件只解析一次，与数据预览共用）
+        df = ParsedWorkbookCache().read_excel(file_path, content_digest=content_digest)
         logging.info(f"Duty rate file loaded. Shape: {df.shape}")
         logging.info(f"Duty rate columns: {df.columns.tolist()}")
 
@@ -518,17 +502,7 @@ def get_duty_rates(file_path):
             logging.info(f"Sample Item Names before cleaning: {[repr(item) for item in sample_items]}")
             
             # 清理 Item Name：移除前后空格、制表符、不间断空格等
-            df['Item Name'] = df['Item Name'].apply(lambda x: 
-                str(x).strip()                           # 移除前后空格
-                .replace('\xa0', ' ')                    # 替换不间断空格为普通空格
-                .replace('\t', ' ')                      # 替换制表符为空格
-                .replace('\n', ' ')                      # 替换换行符为空格
-                .replace('\r', ' ')                      # 替换回车符为空格
-                if pd.notna(x) else ''
-            )
-            
-            # 进一步标准化：移除多余的空格
-            df['Item Name'] = df['Item Name'].apply(lambda x: ' '.join(x.split()) if x else '')
+            df['Item Name'] = clean_item_names(df['Item Name'])
             
             # 清理后记录样本
             sample_items_cleaned = df['Item Name'].head(5).tolist()
@@ -541,347 +515,172 @@ def get_duty_rates(file_path):
 
         # Group by Item_Name and aggregate other columns
         logging.info("Grouping duty rates by 'Item Name'")
-        
-        # 动态构建聚合字典，只包含存在的列
-        agg_dict = {
-            'HSN1': lambda x: ' '.join(str(i) for i in x if pd.notna(i)),  # Concatenate HSN1 with space
-            'Final BCD': 'min',
-            'Final SWS': 'min',
-            'Final IGST': 'min'
-        }
-        
-        # 只有在HSN2列存在时才添加它
-        if 'HSN2' in df.columns:
-            agg_dict['HSN2'] = lambda x: ' '.join(str(i) for i in x if pd.notna(i))
-        
-        grouped_df = df.groupby('Item Name').agg(agg_dict).reset_index()
-
-        logging.info(f"Grouped duty rates. Shape: {grouped_df.shape}")
-
-        # Convert DataFrame to dictionary
-        duty_dict = {}
-        for _, row in grouped_df.iterrows():
-            # Use HSN2 if HSN1 is empty and HSN2 exists
-            hsn_value = row['HSN1']
-            if 'HSN2' in grouped_df.columns and (pd.isna(hsn_value) or str(hsn_value).strip() == ''):
-                hsn_value = row['HSN2']
-            
-            item_name = row['Item Name']
-            
-            # 额外的安全检查：确保键是干净的
-            if item_name and item_name.strip():
-                duty_dict[item_name] = {
-                    'hsn': hsn_value,
-                    'bcd': row['Final BCD'],
-                    'sws': row['Final SWS'],
-                    'igst': row['Final IGST']
-                }
+        duty_dict = aggregate_duty_rates(df)
 
         logging.info(f"Created duty dictionary with {len(duty_dict)} items")
         
         # 记录一些键的样本用于调试
         sample_keys = list(duty_dict.keys())[:5]
         logging.info(f"Sample duty_dict keys: {[repr(key) for key in sample_keys]}")
-        
-        return duty_dict, df
+
+        # 预先构建标准化键表，避免每次匹配都重新标准化整个税率表
+        # 模糊匹配结果按税率表指纹持久化缓存，税率表变化后自动失效
+        duty_index = DutyRateIndex(duty_dict, match_cache=shared_match_cache())
+        snapshot_store.save(snapshot_key, duty_dict, df, duty_index.normalized_names)
+
+        return duty_dict, df, duty_index
     except Exception as e:
         error_msg = f"读取税率文件失败: {str(e)}"
         logging.error(error_msg)
         logging.exception("Exception details:")
         st.error(error_msg)
-        return {}, None
+        return {}, None, None
 
-def process_invoice_file(file_path, duty_rates):
-    logging.info(f"Processing invoice file: {file_path}")
-    try:
-        # Get all sheet names
-        excel_file = pd.ExcelFile(file_path)
-        all_sheet_names = excel_file.sheet_names
-        logging.info(f"All sheet names in invoice file: {all_sheet_names}")
+def get_layout_detector():
+    """
+    本会话的发票布局识别缓存：同一模板的工作表只识别一次，识别过的模板保存在已知模板登记表中
+    （第一次使用时创建，数据预览和处理的所有工作簿共用）
+    """
+    if 'layout_detector' not in st.session_state:
+        st.session_state.layout_detector = LayoutDetector(registry=LayoutRegistry())
+    return st.session_state.layout_detector
+
+def get_invoice_workbook(upload):
+    """
+    返回上传的发票文件（UploadBuffer）的工作簿会话，数据预览和处理共用同一个会话
+    会话直接解析上传的数据，按留档路径保存在session_state中跨页面刷新复用，文件内容变化时重新打开；
+    各工作表通过解析缓存读取，重新上传相同的文件时不再解析
+    """
+    workbooks = st.session_state.setdefault('invoice_workbooks', {})
+    workbook = workbooks.get(upload.path)
+    if workbook is not None and workbook.digest == upload.digest:
+        return workbook
+
+    if workbook is not None:
+        workbook.close()
+    workbook = InvoiceWorkbook(upload.data, cache=ParsedWorkbookCache(), digest=upload.digest, name=upload.path,
+                               layout_detector=get_layout_detector())
+    workbooks[upload.path] = workbook
+    return workbook
+
+def new_item_row(item_id, item_name):
+    """
+    newDutyRate 中的一行：未匹配到税率的项目，税率留空待补充
+    """
+    return {
+        '发票及项号': str(item_id),
+        'Item Name': item_name,
+        'Final BCD': '',
+        'Final SWS': '',
+        'Final IGST': '',
+        'HSN1': '',
+        # 添加兼容旧版本的列，确保为字符串类型
+        'Duty': '',
+        'Welfare': ''
+    }
 
-        # Store original sheet names for accessing sheets
-        original_sheet_names = excel_file.sheet_names[1:]  # Skip the first sheet
-        logging.info(f"Processing sheets (skipping first): {original_sheet_names}")
+def process_invoice_file(file_path, duty_rates, duty_index=None, workers=DEFAULT_SHEET_WORKERS):
+    return process_invoice_files([file_path], duty_rates, duty_index, workers)
 
-        # Process sheet names for display and ID creation (remove CI- prefix and trim spaces)
-        processed_sheet_names = [name.replace('CI-', '').strip() if name.startswith('CI-') else name.strip()
-                      for name in original_sheet_names]
-        logging.info(f"Processed sheet names: {processed_sheet_names}")
+def process_invoice_files(file_paths, duty_rates, duty_index=None, workers=DEFAULT_SHEET_WORKERS,
+                          progress_callback=None):
+    """
+    处理一个或多个发票文件，结果合并为一个发票表和一个新项目表
+    所有文件的工作表在同一个进程池中解析，每个文件解析完成后调用 progress_callback(已完成文件数, 文件总数, 工作簿会话)；
+    不同文件中的同名工作表按 processing_invoices.py 的方式加上文件后缀
+    """
+    logging.info(f"Processing invoice files: {file_paths}")
+    try:
+        # 税率表索引只构建一次，供所有工作表的匹配使用
+        if duty_index is None:
+            duty_index = DutyRateIndex(duty_rates)
+
+        # 每个工作簿只打开一次，file_paths中也可以是预览时已经打开的InvoiceWorkbook会话
+        workbooks = [open_workbook(file_path) for file_path in file_paths]
+
+        original_sheet_names_per_file = []
+        processed_sheet_names_per_file = []
+        for workbook in workbooks:
+            # Get all sheet names
+            all_sheet_names = workbook.sheet_names
+            logging.info(f"All sheet names in invoice file {workbook}: {all_sheet_names}")
+
+            # Store original sheet names for accessing sheets
+            original_sheet_names = all_sheet_names[1:]  # Skip the first sheet
+            logging.info(f"Processing sheets (skipping first): {original_sheet_names}")
+            original_sheet_names_per_file.append(original_sheet_names)
+
+            # Process sheet names for display and ID creation (remove CI- prefix and trim spaces)
+            processed_sheet_names_per_file.append([name.replace('CI-', '').strip() if name.startswith('CI-') else name.strip()
+                                                   for name in original_sheet_names])
+        processed_sheet_names_per_file = add_file_suffixes(processed_sheet_names_per_file,
+                                                           [workbook.name for workbook in workbooks])
+        logging.info(f"Processed sheet names: {processed_sheet_names_per_file}")
 
         # Initialize DataFrames for results
         all_invoices_df = pd.DataFrame()
         new_descriptions_df = pd.DataFrame()
-
-        # Process each sheet
-        for i, (original_sheet_name, processed_sheet_name) in enumerate(zip(original_sheet_names, processed_sheet_names)):
-            logging.info(f"Processing sheet {i+1}/{len(original_sheet_names)}: {original_sheet_name}")
-            # Read the sheet
-            df = pd.read_excel(file_path, sheet_name=original_sheet_name)
-            logging.info(f"Sheet data loaded. Shape: {df.shape}")
-            if not df.empty:
-                logging.info(f"First few columns: {df.columns[:5].tolist() if len(df.columns) > 5 else df.columns.tolist()}")
-
-            # 动态检测列结构
-            # 首先尝试找到表头行
-            header_row_idx = None
-            for i in range(min(15, len(df))):
-                row = df.iloc[i]
-                # 检查是否包含典型的表头关键词
-                row_str = ' '.join([str(cell).upper() for cell in row if pd.notna(cell)])
-                if any(keyword in row_str for keyword in ['QTY', 'QUANTITY', 'PRICE', 'AMOUNT', 'DESC', 'DESCRIPTION']):
-                    header_row_idx = i
-                    logging.info(f"Found potential header row at index {i}: {row_str}")
-                    break
-            
-            # 根据实际的发票文件结构定义列索引
-            # 如果找到表头，尝试动态映射；否则使用默认映射
-            if header_row_idx is not None:
-                header_row = df.iloc[header_row_idx]
-                column_indices = {}
-                
-                for idx, cell in enumerate(header_row):
-                    if pd.notna(cell):
-                        cell_str = str(cell).upper().strip()
-                        if any(keyword in cell_str for keyword in ['ITEM', 'NO', 'SL']) and 'Item#' not in column_indices:
-                            column_indices['Item#'] = idx
-                        elif any(keyword in cell_str for keyword in ['MODEL', 'PART']) and 'Model_No' not in column_indices:
-                            column_indices['Model_No'] = idx
-                        elif ('P/N' in cell_str or 'PN' in cell_str) and 'P/N' not in column_indices:
-                            column_indices['P/N'] = idx
-                        elif any(keyword in cell_str for keyword in ['DESC', 'DESCRIPTION']) and 'Desc' not in column_indices:
-                            column_indices['Desc'] = idx
-                        elif any(keyword in cell_str for keyword in ['COUNTRY', 'ORIGIN']) and 'Country' not in column_indices:
-                            column_indices['Country'] = idx
-                        elif any(keyword in cell_str for keyword in ['QTY', 'QUANTITY']) and 'Qty' not in column_indices:
-                            column_indices['Qty'] = idx
-                        elif any(keyword in cell_str for keyword in ['PRICE', 'RATE']) and 'Price' not in column_indices:
-                            column_indices['Price'] = idx
-                        elif any(keyword in cell_str for keyword in ['AMOUNT', 'TOTAL']) and 'Amount' not in column_indices:
-                            column_indices['Amount'] = idx
-                
-                logging.info(f"Dynamic column mapping: {column_indices}")
-                
-                # 检查是否所有必要的列都被检测到
-                required_columns = ['Item#', 'Model_No', 'P/N', 'Desc', 'Qty', 'Price']
-                missing_columns = [col for col in required_columns if col not in column_indices]
-                
-                if missing_columns:
-                    logging.warning(f"Dynamic column detection failed, missing columns: {missing_columns}")
-                    logging.warning("Using default mapping")
-                    column_indices = {
-                        'Item#': 0,      # Item number (1, 2, 3...)
-                        'Model_No': 1,   # Model number (IPC-K7CP-3H1WE)
-                        'P/N': 2,        # Part number (1.2.03.01.0002)
-                        'Desc': 3,       # Description
-                        'Country': 4,    # Country
-                        'Qty': 5,        # Quantity
-                        'Price': 6,      # Unit price
-                        'Amount': 7,     # Total amount
-                    }
-                else:
-                    # 补充可能缺失的非必要列
-                    if 'Country' not in column_indices:
-                        column_indices['Country'] = 4  # 默认值
-                    if 'Amount' not in column_indices:
-                        column_indices['Amount'] = 7   # 默认值
+        sheet_frames = []
+
+        # 解析各工作表（可用多个进程并行），结果按原始文件和工作表顺序排列
+        # 先收集各工作表的数据，所有工作表读取完后再统一匹配税率
+        parsed_workbooks = map_invoice_workbooks(
+            parse_invoice_sheet,
+            [(workbook, zip(original_sheet_names, processed_sheet_names))
+             for workbook, original_sheet_names, processed_sheet_names
+             in zip(workbooks, original_sheet_names_per_file, processed_sheet_names_per_file)],
+            workers, progress_callback
+        )
+        for workbook, file_path in zip(workbooks, file_paths):
+            if workbook is not file_path:
+                workbook.close()
+        for original_sheet_names, parsed_sheets in zip(original_sheet_names_per_file, parsed_workbooks):
+            for original_sheet_name, sheet_df in zip(original_sheet_names, parsed_sheets):
+                if sheet_df is not None:
+                    sheet_frames.append((original_sheet_name, sheet_df))
+
+        # 整个工作簿中相同的Item_Name只匹配一次
+        matches = duty_index.match_items(
+            item_name for _, sheet_df in sheet_frames for item_name in sheet_df['Item_Name']
+        )
+        new_item_names = {item_name for item_name, matched_duty_item in matches.items() if matched_duty_item is None}
+        fuzzy_item_names = {item_name for item_name, matched_duty_item in matches.items()
+                            if matched_duty_item and matched_duty_item != item_name}
+
+        # 按唯一名称构建税率查找表，再按列整体填充
+        rate_maps = {'HSN': {}, 'BCD': {}, 'SWS': {}, 'IGST': {}}
+        for item_name, matched_duty_item in matches.items():
+            if matched_duty_item:
+                rates = duty_rates[matched_duty_item]
+                rate_maps['HSN'][item_name] = str(rates['hsn'])
+                rate_maps['BCD'][item_name] = str(rates['bcd'])
+                rate_maps['SWS'][item_name] = str(rates['sws'])
+                rate_maps['IGST'][item_name] = str(rates['igst'])
             else:
-                logging.warning("No header row found, using default mapping")
-                # 使用默认的列索引映射
-                column_indices = {
-                    'Item#': 0,      # Item number (1, 2, 3...)
-                    'Model_No': 1,   # Model number (IPC-K7CP-3H1WE)
-                    'P/N': 2,        # Part number (1.2.03.01.0002)
-                    'Desc': 3,       # Description
-                    'Country': 4,    # Country
-                    'Qty': 5,        # Quantity
-                    'Price': 6,      # Unit price
-                    'Amount': 7,     # Total amount
-                }
-
-            logging.info(f"Using column indices for sheet {original_sheet_name}: {column_indices}")
-            
-            # 查找数据开始的行（在表头行之后，包含数字的行）
-            data_start_row = None
-            search_start = header_row_idx + 1 if header_row_idx is not None else 0
-            
-            for row_idx in range(search_start, min(search_start + 20, len(df))):
-                # 检查第一列是否为数字（Item#）
-                if row_idx < len(df):
-                    first_col_val = df.iloc[row_idx, 0]
-                    if pd.notna(first_col_val) and str(first_col_val).strip().isdigit():
-                        data_start_row = row_idx
-                        logging.info(f"Found data starting at row {row_idx} in sheet {original_sheet_name}")
-                        break
-            
-            if data_start_row is None:
-                logging.warning(f"No data rows found in sheet {original_sheet_name}")
-                continue
-            
-            # 提取数据行
-            data_df = df.iloc[data_start_row:].copy()
-            
-            # 重置索引
-            data_df = data_df.reset_index(drop=True)
-
-            # 创建新的DataFrame
-            sheet_df = pd.DataFrame()
-            
-            # 只处理有数据的行
-            valid_rows = []
-            for idx, row in data_df.iterrows():
-                # 检查第一列是否为有效的Item#
-                item_num = row.iloc[0] if len(row) > 0 else None
-                if pd.notna(item_num) and str(item_num).strip().isdigit():
-                    valid_rows.append(idx)
-            
-            if not valid_rows:
-                logging.warning(f"No valid data rows found in sheet {original_sheet_name}")
-                continue
-            
-            logging.info(f"Found {len(valid_rows)} valid data rows in sheet {original_sheet_name}")
-            
-            # 最终安全检查：确保所有必要的列索引都存在
-            required_keys = ['Item#', 'Model_No', 'P/N', 'Desc', 'Country', 'Qty', 'Price']
-            for key in required_keys:
-                if key not in column_indices:
-                    logging.error(f"Missing required column index: {key}")
-                    logging.error(f"Available column indices: {column_indices}")
-                    logging.error("Falling back to default mapping")
-                    column_indices = {
-                        'Item#': 0,      # Item number (1, 2, 3...)
-                        'Model_No': 1,   # Model number (IPC-K7CP-3H1WE)
-                        'P/N': 2,        # Part number (1.2.03.01.0002)
-                        'Desc': 3,       # Description
-                        'Country': 4,    # Country
-                        'Qty': 5,        # Quantity
-                        'Price': 6,      # Unit price
-                        'Amount': 7,     # Total amount
-                    }
-                    break
-            
-            # 处理每个有效行
-            for row_idx in valid_rows:
-                row = data_df.iloc[row_idx]
-                
-                # 安全获取列值
-                def safe_get_col(col_idx):
-                    if col_idx < len(row):
-                        val = row.iloc[col_idx]
-                        return val if pd.notna(val) else ''
-                    return ''
-                
-                # 提取各列数据
-                item_num = safe_get_col(column_indices['Item#'])
-                part_num = safe_get_col(column_indices['P/N'])
-                model_no = safe_get_col(column_indices['Model_No'])
-                desc = safe_get_col(column_indices['Desc'])
-                country = safe_get_col(column_indices['Country'])
-                qty = safe_get_col(column_indices['Qty'])
-                price = safe_get_col(column_indices['Price'])
-                
-                # 添加详细的调试信息，特别关注Qty字段
-                if row_idx < 3:  # 只记录前3行的调试信息
-                    logging.info(f"Row {row_idx} debugging:")
-                    logging.info(f"  - Row length: {len(row)}")
-                    logging.info(f"  - Qty column index: {column_indices.get('Qty', 'NOT_FOUND')}")
-                    if 'Qty' in column_indices and column_indices['Qty'] < len(row):
-                        raw_qty = row.iloc[column_indices['Qty']]
-                        logging.info(f"  - Raw Qty value: '{raw_qty}' (type: {type(raw_qty)})")
-                        logging.info(f"  - Processed Qty: '{qty}'")
-                    else:
-                        logging.info(f"  - Qty column index out of range or not found")
-                    
-                    if 'Price' in column_indices and column_indices['Price'] < len(row):
-                        raw_price = row.iloc[column_indices['Price']]
-                        logging.info(f"  - Raw Price value: '{raw_price}' (type: {type(raw_price)})")
-                        logging.info(f"  - Processed Price: '{price}'")
-                    else:
-                        logging.info(f"  - Price column index out of range or not found")
-                
-                # 处理描述字段，提取Item_Name
-                item_name = ''
-                if desc:
-                    # 从描述中提取Item_Name（通常是第一个'-'之前的部分）
-                    desc_str = str(desc)
-                    if '-' in desc_str:
-                        item_name = desc_str.split('-')[0].strip()
-                    else:
-                        item_name = desc_str.strip()
-                
-                # 清理描述文本
-                clean_desc = ''
-                if desc:
-                    clean_desc = ''.join(char.upper() for char in str(desc) if char.isalnum() or char in '.()').replace('Φ', '').replace('Ω', '').replace('-', '').replace('φ', '')
-                
-                # 创建ID
-                item_id = f"{processed_sheet_name}_{str(item_num).strip()}"
-                
-                # 添加到结果DataFrame
-                row_data = {
-                    'Item#': str(item_num).strip(),
-                    'ID': item_id,
-                    'P/N': str(part_num).strip(),
-                    'Desc': clean_desc,
-                    'Qty': str(qty).strip(),
-                    'Price': str(price).strip(),
-                    'Item_Name': item_name,
-                    'HSN': '',
-                    'BCD': '',
-                    'SWS': '',
-                    'IGST': ''
-                }
-                
-                sheet_df = pd.concat([sheet_df, pd.DataFrame([row_data])], ignore_index=True)
-            
-            logging.info(f"Processed {len(sheet_df)} items from sheet {original_sheet_name}")
-
-            # 填充税率信息并收集未匹配的项目
-            unique_desc = set()
-            new_items_count = 0
-            
-            for idx, row in sheet_df.iterrows():
-                itemName = row['Item_Name']
-                if pd.notna(itemName) and itemName != '':
-                    # 使用改进的匹配算法
-                    matched_duty_item = find_best_match(itemName, duty_rates)
-
-                    if matched_duty_item:
-                        rates = duty_rates[matched_duty_item]
-                        sheet_df.at[idx, 'HSN'] = str(rates['hsn'])
-                        sheet_df.at[idx, 'BCD'] = str(rates['bcd'])
-                        sheet_df.at[idx, 'SWS'] = str(rates['sws'])
-                        sheet_df.at[idx, 'IGST'] = str(rates['igst'])
-
-                        # 记录匹配信息用于调试
-                        if matched_duty_item != itemName:
-                            logging.info(f"Fuzzy match found: '{itemName}' -> '{matched_duty_item}'")
-                    else:
-                        sheet_df.at[idx, 'HSN'] = 'new item'
-                        sheet_df.at[idx, 'BCD'] = 'new item'
-                        sheet_df.at[idx, 'SWS'] = 'new item'
-                        sheet_df.at[idx, 'IGST'] = 'new item'
-                        if itemName not in unique_desc:
-                            unique_desc.add(itemName)
-                            new_items_count += 1
-                            logging.info(f"No match found for item: '{itemName}' (normalized: '{normalize_item_name(itemName)}')")
-                            # Add unmatched items to new_descriptions_df
-                            new_descriptions_df = pd.concat([new_descriptions_df, pd.DataFrame({
-                                '发票及项号': [str(row['ID'])],
-                                'Item Name': [itemName],
-                                'Final BCD': [''],
-                                'Final SWS': [''],
-                                'Final IGST': [''],
-                                'HSN1': [''],
-                                # 添加兼容旧版本的列，确保为字符串类型
-                                'Duty': [''],
-                                'Welfare': ['']
-                            })], ignore_index=True)
-
-            logging.info(f"Found {new_items_count} new items in sheet {original_sheet_name}")
-
-            # Add this sheet's data to the combined DataFrame
-            all_invoices_df = pd.concat([all_invoices_df, sheet_df], ignore_index=True)
-            logging.info(f"Added sheet data to combined DataFrame. Current size: {all_invoices_df.shape}")
+                for rate_map in rate_maps.values():
+                    rate_map[item_name] = 'new item'
+
+        new_item_rows = []
+        for original_sheet_name, sheet_df in sheet_frames:
+            # 填充税率信息，空的Item_Name保持为空
+            for col, rate_map in rate_maps.items():
+                sheet_df[col] = sheet_df['Item_Name'].map(rate_map).fillna('')
+
+            # 收集未匹配的项目（每个工作表内去重）
+            is_new_item = sheet_df['Item_Name'].isin(new_item_names)
+            sheet_new_items = sheet_df.loc[is_new_item, ['ID', 'Item_Name']].drop_duplicates(subset=['Item_Name'], keep='first')
+            for item_id, item_name in zip(sheet_new_items['ID'], sheet_new_items['Item_Name']):
+                new_item_rows.append(new_item_row(item_id, item_name))
+
+            # 每个工作表只记录一条汇总日志，逐项的匹配过程可通过审计模式导出
+            logging.info(f"Matched sheet {original_sheet_name}: {len(sheet_df)} rows, "
+                         f"{int(sheet_df['Item_Name'].isin(fuzzy_item_names).sum())} fuzzy matched, "
+                         f"{int(is_new_item.sum())} new item rows ({len(sheet_new_items)} unique new items)")
+
+        if sheet_frames:
+            all_invoices_df = pd.concat([sheet_df for _, sheet_df in sheet_frames], ignore_index=True)
+        if new_item_rows:
+            new_descriptions_df = pd.DataFrame(new_item_rows)
 
         logging.info(f"Completed processing invoice file. Final DataFrame shape: {all_invoices_df.shape}")
         logging.info(f"New items found: {len(new_descriptions_df)}")
@@ -895,24 +694,9 @@ def process_invoice_file(file_path, duty_rates):
             all_invoices_df = all_invoices_df.drop_duplicates(subset=['ID'], keep='first')
             logging.info(f"Removed duplicates. New DataFrame shape: {all_invoices_df.shape}")
 
-        # 在return前添加类型转换
-        # 确保所有列为字符串类型，解决Arrow序列化问题
-        logging.info(f"Converting all columns to string type for invoices DataFrame. Columns: {all_invoices_df.columns.tolist()}")
-        for col in all_invoices_df.columns:
-            try:
-                all_invoices_df[col] = all_invoices_df[col].astype(str)
-            except Exception as e:
-                logging.error(f"Error converting column '{col}' to string: {str(e)}")
-                # 如果转换失败，尝试强制转换
-                all_invoices_df[col] = all_invoices_df[col].apply(lambda x: str(x) if x is not None else '')
-
-        # 额外处理：确保没有字符串形式的'nan'或'none'
-        for col in all_invoices_df.columns:
-            all_invoices_df[col] = all_invoices_df[col].apply(
-                lambda x: '' if str(x).lower() in ['nan', 'none'] else str(x)
-            )
-
-        logging.info("Completed type conversion for invoices DataFrame")
+        # 转为定义的输出类型（数量和单价为数字，税率为category），显示和导出时再转为文本
+        all_invoices_df = to_output_schema(all_invoices_df)
+        logging.info(f"Converted invoices DataFrame to output types: {all_invoices_df.dtypes.astype(str).to_dict()}")
 
         # 确保new_descriptions_df中的所有列都是字符串类型，特别是Duty列
         if not new_descriptions_df.empty:
@@ -937,164 +721,121 @@ def process_invoice_file(file_path, duty_rates):
         st.error(error_msg)
         return pd.DataFrame(), pd.DataFrame()
 
-def process_checklist(file_path):
-    logging.info(f"Processing checklist file: {file_path}")
-    try:
-        # 读取Excel文件
-        df = pd.read_excel(file_path, skiprows=3)
-        logging.info(f"Checklist file loaded. Shape: {df.shape}")
-        logging.info(f"Checklist columns: {df.columns.tolist()}")
-
-        # 检查必要的列是否存在，如果不存在则尝试找到相似的列名
-        required_columns = ['P/N', 'Item#', 'Desc', 'Qty', 'Price', 'HSN', 'BCD', 'SWS', 'IGST']
-        column_mapping = {}
-
-        for req_col in required_columns:
-            if req_col in df.columns:
-                column_mapping[req_col] = req_col
+def refresh_invoice_rates(processed_invoices, old_duty_rates, old_duty_index, duty_rates, duty_index):
+    """
+    税率表更新后只重新匹配受影响的发票行，不重新读取发票文件
+
+    按 Item Name 比较新旧税率表：只有原匹配键被删除、或能匹配到新增键的名称需要重新匹配；
+    只有匹配结果或所匹配键的税率发生变化的行需要更新税率列。
+    返回 (processed_invoices, new_items, 税率列发生变化的ID列表)
+    """
+    added, removed, changed = diff_duty_rates(old_duty_rates, duty_rates)
+    logging.info(f"Duty rate table changed: {len(added)} added, {len(removed)} removed, {len(changed)} changed items")
+
+    # 与 match_items 使用相同的规则跳过空名称，两者不会不一致
+    item_names = [item_name for item_name in processed_invoices['Item_Name'].unique() if is_matchable_name(item_name)]
+    unresolved = [item_name for item_name in item_names if item_name not in old_duty_index.resolved]
+    if unresolved:
+        old_duty_index.match_items(unresolved)
+    old_matches = {item_name: old_duty_index.resolved.get(item_name) for item_name in item_names}
+
+    affected = affected_item_names(old_matches, added, removed)
+    matches = dict(old_matches)
+    matches.update(duty_index.match_items(affected))
+    duty_index.resolved.update(matches)
+
+    changed_keys = set(changed)
+    updated_names = {item_name for item_name, matched_duty_item in matches.items()
+                     if matched_duty_item != old_matches[item_name] or matched_duty_item in changed_keys}
+    logging.info(f"Re-resolved {len(affected)} of {len(item_names)} unique item names, "
+                 f"{len(updated_names)} with new rates")
+
+    processed_invoices = processed_invoices.copy()
+    rows = processed_invoices['Item_Name'].isin(updated_names)
+    for col, rate_key in (('HSN', 'hsn'), ('BCD', 'bcd'), ('SWS', 'sws'), ('IGST', 'igst')):
+        rate_map = {}
+        for item_name in updated_names:
+            if matches[item_name]:
+                rate_map[item_name] = str(duty_rates[matches[item_name]][rate_key])
             else:
-                # 特殊处理IGST列，可能对应Duty列
-                if req_col == 'IGST' and 'Duty' in df.columns:
-                    column_mapping[req_col] = 'Duty'
-                    logging.info(f"Mapped column '{req_col}' to 'Duty'")
-                    continue
-                
-                # 尝试找到相似的列名（不区分大小写，忽略空格和特殊字符）
-                found = False
-                for col in df.columns:
-                    col_clean = str(col).strip().replace(' ', '').replace('/', '').replace('-', '').upper()
-                    req_col_clean = req_col.replace('/', '').replace('-', '').upper()
-                    if col_clean == req_col_clean or req_col_clean in col_clean:
-                        column_mapping[req_col] = col
-                        logging.info(f"Mapped column '{req_col}' to '{col}'")
-                        found = True
-                        break
-
-                if not found:
-                    logging.warning(f"Column '{req_col}' not found in checklist file")
-                    column_mapping[req_col] = None
+                rate_map[item_name] = 'new item'
+        # 税率列为category，按文本更新后重新转换，与完整处理时的类型转换一致
+        values = processed_invoices[col].astype(object)
+        values[rows] = processed_invoices.loc[rows, 'Item_Name'].map(rate_map)
+        processed_invoices[col] = output_column(col, values)
+
+    # 重新收集未匹配的项目（每个工作表内去重，ID为"工作表_项号"）
+    new_item_names = {item_name for item_name, matched_duty_item in matches.items() if matched_duty_item is None}
+    new_rows = processed_invoices.loc[processed_invoices['Item_Name'].isin(new_item_names), ['ID', 'Item_Name']]
+    new_rows = new_rows.assign(Sheet=new_rows['ID'].str.rsplit('_', n=1).str[0])
+    new_rows = new_rows.drop_duplicates(subset=['Sheet', 'Item_Name'], keep='first')
+    new_items = pd.DataFrame([new_item_row(item_id, item_name)
+                              for item_id, item_name in zip(new_rows['ID'], new_rows['Item_Name'])])
+
+    changed_ids = processed_invoices.loc[rows, 'ID'].tolist()
+    return processed_invoices, new_items, changed_ids
+
+def process_checklist(file_path, chunk_rows=None, content_digest=None):
+    """
+    处理核对清单。chunk_rows不为空时用openpyxl只读模式流式读取，
+    每次只解析chunk_rows行，适合几十万行的年度汇总核对清单
+    file_path也可以是内存中的文件内容（上传的文件），content_digest为内容的sha256
+    """
+    logging.info(f"Processing checklist file: {source_name(file_path)}")
+    try:
+        # 解析缓存中已有整个核对清单时直接使用；否则先只读表头确定需要的列，之后只读取这些列
+        # （相同内容的文件只解析一次）
+        cache = ParsedWorkbookCache()
+        if content_digest is None:
+            content_digest = content_sha256(file_path)
+        full_df = None if chunk_rows else cache.load_frame(cache.workbook_key(file_path, content_digest),
+                                                           **CHECKLIST_READ_KWARGS)
+        if full_df is not None:
+            columns = full_df.columns
+        else:
+            columns = cache.read_excel(file_path, content_digest=content_digest, nrows=0,
+                                       **CHECKLIST_READ_KWARGS).columns
+        logging.info(f"Checklist columns: {columns.tolist()}")
+        column_mapping = map_checklist_columns(columns)
+        usecols = checklist_usecols(columns, column_mapping) if full_df is None else None
+        read_kwargs = {'usecols': usecols} if usecols is not None else {}
+
+        if chunk_rows:
+            # 流式读取：第一块提供列名，之后逐块送入下面的发票行/明细行处理
+            chunks = ChecklistStream(file_path, columns, chunk_rows=chunk_rows, usecols=usecols).iter_chunks()
+            df = next(chunks)
+            chunks = itertools.chain([df], chunks)
+            logging.info(f"Streaming checklist file in chunks of {chunk_rows} rows")
+        else:
+            df = full_df if full_df is not None else \
+                cache.read_excel(file_path, content_digest=content_digest, **CHECKLIST_READ_KWARGS, **read_kwargs)
+            chunks = [df]
+            logging.info(f"Checklist file loaded. Shape: {df.shape}")
+        if usecols is not None:
+            logging.info(f"Read checklist columns {df.columns.tolist()} only")
 
         logging.info(f"Column mapping: {column_mapping}")
 
-        # 初始化新的DataFrame用于存储结果
-        result_rows = []
+        # 按列处理发票行和明细行（流式读取时逐块处理），发票号跨块向下填充
+        result_frames = []
         current_invoice = None
-        invoice_count = 0
-        item_count = 0
-
-        # 遍历每一行
-        for _, row in df.iterrows():  # 使用 _ 表示不使用的索引变量
-            # 检查是否是发票行 - 使用安全的列访问
-            pn_col = column_mapping.get('P/N')
-            if pn_col and pn_col in df.columns:
-                pn = str(row[pn_col]) if pd.notna(row[pn_col]) else ''
-            else:
-                # 如果没有P/N列，尝试在第一列或其他列中查找Invoice信息
-                pn = ''
-                for col in df.columns:
-                    if pd.notna(row[col]) and 'Invoice:' in str(row[col]):
-                        pn = str(row[col])
-                        break
-
-            if 'Invoice:' in str(pn):
-                # 提取发票号并去除所有空格
-                invoice_no = pn.split('Invoice:')[1].split('dt.')[0].strip().replace(' ', '')
-                current_invoice = invoice_no
-                invoice_count += 1
-                logging.info(f"Found invoice #{invoice_count}: {invoice_no}")
-                # 保存发票行
-                result_rows.append({
-                    'Item#': pn,
-                    'ID': None,
-                    'P/N': None,
-                    'Desc': None,
-                    'Qty': None,
-                    'Price': None,
-                    'Item_Name': None,
-                    'HSN': None,
-                    'BCD': None,
-                    'SWS': None,
-                    'IGST': None
-                })
-            else:
-                # 处理常规行 - 使用安全的列访问
-                item_col = column_mapping.get('Item#')
-                if item_col and item_col in df.columns and pd.notna(row[item_col]) and current_invoice:
-                    # Convert Item# to integer before concatenating to remove the decimal and spaces
-                    try:
-                        item_num = int(float(row[item_col])) if pd.notna(row[item_col]) else 0
-                        item_id = f"{current_invoice}_{item_num}"
-                    except (ValueError, TypeError):
-                        # Remove spaces from item number to ensure clean IDs
-                        clean_item = str(row[item_col]).strip().replace(' ', '')
-                        item_id = f"{current_invoice}_{clean_item}"
-
-                    # 安全获取Desc列
-                    desc_col = column_mapping.get('Desc')
-                    if desc_col and desc_col in df.columns and pd.notna(row[desc_col]):
-                        item_name = str(row[desc_col]).split('-')[0]
-                        # 修改item_name的处理逻辑
-                        desc_parts = str(row[desc_col]).split('-PART NO')
-                        desc = desc_parts[0]
-                        # 只保留字母数字和点号，并转换为大写
-                        desc = desc.replace('+OR-', '')
-                        desc = desc.replace('DEG', '')
-                        desc = desc.replace('-', '')
-                        desc = ''.join(char for char in desc if char.isalnum() or char in '.()').upper()
-                    else:
-                        item_name = ''
-                        desc = ''
-
-                    item_count += 1
-
-                    # 创建一个安全的字典，使用映射的列名
-                    def safe_get_value(col_name):
-                        mapped_col = column_mapping.get(col_name)
-                        if mapped_col and mapped_col in df.columns:
-                            return row[mapped_col] if pd.notna(row[mapped_col]) else ''
-                        return ''
-
-                    item_dict = {
-                        'Item#': safe_get_value('Item#'),
-                        'ID': item_id,
-                        'P/N': safe_get_value('P/N'),
-                        'Desc': desc,
-                        'Qty': safe_get_value('Qty'),
-                        'Price': safe_get_value('Price'),
-                        'Item_Name': item_name,
-                        'HSN': '',
-                        'BCD': '',
-                        'SWS': '',
-                        'IGST': '',
-                    }
-
-                    # 处理HSN列（可能是数字）
-                    hsn_value = safe_get_value('HSN')
-                    if hsn_value and str(hsn_value).strip().isdigit():
-                        item_dict['HSN'] = int(float(hsn_value))
-                    else:
-                        item_dict['HSN'] = hsn_value
-
-                    # 处理其他数值列
-                    for col in ['BCD', 'SWS', 'IGST']:
-                        item_dict[col] = safe_get_value(col)
-
-                    # 确保所有值都是字符串类型
-                    for key in ['Item#', 'P/N', 'ID', 'Qty', 'Price', 'HSN', 'BCD', 'SWS', 'IGST']:
-                        if key in item_dict and item_dict[key] is not None:
-                            item_dict[key] = str(item_dict[key])
-
-                    result_rows.append(item_dict)
+        for chunk in chunks:
+            chunk_rows_df, current_invoice = parse_checklist_rows(chunk, column_mapping, current_invoice)
+            result_frames.append(chunk_rows_df)
 
-        # 创建结果DataFrame
-        result_df = pd.DataFrame(result_rows)
+        # 创建结果DataFrame（没有发票行和明细行时为没有列的空DataFrame）
+        result_df = pd.concat(result_frames, ignore_index=True)
+        if result_df.empty:
+            result_df = pd.DataFrame()
+        invoice_count = int(result_df['ID'].isna().sum()) if not result_df.empty else 0
+        item_count = len(result_df) - invoice_count
         logging.info(f"Processed checklist with {invoice_count} invoices and {item_count} items")
         logging.info(f"Final checklist DataFrame shape: {result_df.shape}")
 
         # 如果没有处理到任何数据，记录详细信息
         if result_df.empty:
             logging.warning("No data was processed from checklist file")
-            logging.warning(f"Available columns in file: {df.columns.tolist()}")
+            logging.warning(f"Available columns in file: {columns.tolist()}")
             logging.warning(f"Column mapping used: {column_mapping}")
             logging.warning("Please check if the file format matches expected structure")
 
@@ -1117,16 +858,8 @@ def process_checklist(file_path):
             result_df = result_df.drop_duplicates(subset=['ID'], keep='first')
             logging.info(f"Removed duplicates. New DataFrame shape: {result_df.shape}")
 
-        # 在return前添加类型转换
-        # 确保所有列为字符串类型，解决Arrow序列化问题
-        for col in result_df.columns:
-            result_df[col] = result_df[col].astype(str)
-
-        # 额外处理：确保没有字符串形式的'nan'或'none'
-        for col in result_df.columns:
-            result_df[col] = result_df[col].apply(
-                lambda x: '' if str(x).lower() in ['nan', 'none'] else str(x)
-            )
+        # 转为定义的输出类型（数量和单价为数字，税率为category），显示和导出时再转为文本
+        result_df = to_output_schema(result_df)
 
         return result_df
     except Exception as e:
@@ -1146,6 +879,12 @@ def process_checklist(file_path):
 
         return pd.DataFrame()
 
+def is_empty_display(values):
+    """
+    差异报告中显示为 "null" 的空值："nan"/"none"/空白文本
+    """
+    return values.str.lower().isin(EMPTY_TEXTS + ['']) | (values.str.strip() == '')
+
 def compare_excels(df1, df2, price_tolerance_pct=1.1):
     logging.info("Starting comparison between processed invoices and checklist")
     logging.info(f"Using price tolerance: {price_tolerance_pct}%")
@@ -1206,193 +945,74 @@ def compare_excels(df1, df2, price_tolerance_pct=1.1):
         df2 = df2[common_columns]
         logging.info(f"Aligned columns between DataFrames")
 
-        # 用于存储差异信息
-        diff_data = []
-        # Keep track of processed IDs to avoid duplicates
-        processed_ids = set()
-        match_count = 0
-        diff_count = 0
-
         # 定义期望的列顺序 (按照指定顺序)
         expected_columns = ['ID', 'P/N', 'Desc', 'HSN', 'BCD', 'SWS', 'IGST', 'Qty', 'Price']
-
-        for _, row1 in df1.iterrows():
-            id1 = row1['ID']
-            # Skip if this ID has already been processed or is None
-            if id1 is None or pd.isna(id1) or id1 in processed_ids:
-                continue
-
-            # Add this ID to the processed set
-            processed_ids.add(id1)
-
-            # 查找 df2 中对应 ID 的行
-            matching_row = df2[df2['ID'] == id1]
-            if not matching_row.empty:
-                match_count += 1
-                row2 = matching_row.iloc[0]
-                diff_cols = []
-                
-                # 创建差异信息字典，包含所有期望的列
-                diff_info = {'ID': id1}
-                
-                # 为所有期望的列添加数据，只有发生变化的才显示内容
-                for col in expected_columns:
-                    if col == 'ID':
-                        continue  # ID已经添加
-                    
-                    if col not in df1.columns or col not in df2.columns:
-                        # 如果列不存在，跳过
-                        continue
-                    
-                    # 跳过Item_Name列和Item#列的比对
-                    if col == 'Item_Name' or col == 'Item#':
-                        continue
-
-                    has_difference = False
-                    
-                    # 对Price列使用用户设置的误差范围
-                    if col == 'Price':
-                        if pd.notna(row1[col]) and pd.notna(row2[col]):
-                            try:
-                                # 首先尝试将值转换为float类型
-                                price1 = float(row1[col]) if isinstance(row1[col], str) else row1[col]
-                                price2 = float(row2[col]) if isinstance(row2[col], str) else row2[col]
-
-                                # 计算容差
-                                tolerance = price1 * (price_tolerance_pct / 100)  # 转换为小数
-                                if abs(price1 - price2) > tolerance:
-                                    has_difference = True
-                                    diff_cols.append(col)
-                            except (ValueError, TypeError):
-                                # 如果转换失败，记录错误并跳过比较
-                                logging.warning(f"无法比较价格: {row1[col]} vs {row2[col]}，跳过此比较")
-                                # 保险起见，标记为有差异
-                                has_difference = True
-                                diff_cols.append(col)
-                    # 对HSN列特殊处理，忽略浮点数和整数的差异（如85423900.0和85423900）
-                    elif col == 'HSN':
-                        if pd.notna(row1[col]) and pd.notna(row2[col]):
-                            # 将两个值转换为字符串并去除小数点后的零
-                            val1 = str(row1[col]).rstrip('0').rstrip('.') if '.' in str(row1[col]) else str(row1[col])
-                            val2 = str(row2[col]).rstrip('0').rstrip('.') if '.' in str(row2[col]) else str(row2[col])
-
-                            # 记录HSN值的比较
-                            if val1 != val2:
-                                logging.info(f"HSN difference found: {row1[col]} vs {row2[col]} (normalized: {val1} vs {val2})")
-                                has_difference = True
-                                diff_cols.append(col)
-                            else:
-                                logging.debug(f"HSN values considered equal: {row1[col]} vs {row2[col]} (normalized: {val1} vs {val2})")
-                    # 其他列使用精确比对，但先转换为字符串避免类型不匹配
-                    else:
-                        # 将两个值都转换为字符串进行比较，避免类型不匹配问题
-                        val1_str = str(row1[col]).strip()
-                        val2_str = str(row2[col]).strip()
-                        
-                        # 对于数值列，还需要处理小数点后的零
-                        if col in ['HSN', 'BCD', 'SWS', 'IGST', 'Qty', 'Price']:
-                            val1_str = val1_str.rstrip('0').rstrip('.') if '.' in val1_str else val1_str
-                            val2_str = val2_str.rstrip('0').rstrip('.') if '.' in val2_str else val2_str
-                        
-                        if val1_str != val2_str:
-                            has_difference = True
-                            diff_cols.append(col)
-
-                    # 只有发生变化的列才添加内容，未变化的列留空
-                    if has_difference:
-                        # 对数字列特殊处理显示格式，去除小数点后的零
-                        if col in ['HSN', 'BCD', 'SWS', 'IGST', 'Qty', 'Price']:
-                            # 处理数值，去除小数点后的零
-                            val1 = str(row1[col]).rstrip('0').rstrip('.') if '.' in str(row1[col]) else str(row1[col])
-                            val2 = str(row2[col]).rstrip('0').rstrip('.') if '.' in str(row2[col]) else str(row2[col])
-
-                            # 特别为BCD字段添加调试信息
-                            if col == 'BCD':
-                                logging.info(f"Processing BCD difference for ID {id1}:")
-                                logging.info(f"  - Original values: '{row1[col]}' vs '{row2[col]}'")
-                                logging.info(f"  - Processed values: '{val1}' vs '{val2}'")
-
-                            # 检查是否为空值/NaN值
-                            def is_empty_value(val):
-                                return (val.lower() in ['nan', 'none', ''] or
-                                       val.strip() == '' or
-                                       val == 'nan')
-
-                            val1_is_empty = is_empty_value(val1)
-                            val2_is_empty = is_empty_value(val2)
-
-                            # 处理显示值：空值显示为 "null"
-                            display_val1 = 'null' if val1_is_empty else val1
-                            display_val2 = 'null' if val2_is_empty else val2
-
-                            # 添加差异信息（格式：checklist值 -> invoice值）
-                            diff_info[f'{col}'] = f'{display_val2} -> {display_val1}'
-                            
-                            # 特别为BCD字段添加确认信息
-                            if col == 'BCD':
-                                logging.info(f"BCD difference added to report: '{display_val2} -> {display_val1}'")
-                        else:
-                            # 检查是否为空值/NaN值
-                            def is_empty_value_general(val):
-                                if pd.isna(val):
-                                    return True
-                                val_str = str(val).strip().lower()
-                                return val_str in ['nan', 'none', ''] or val_str == ''
-
-                            val1_is_empty = is_empty_value_general(row1[col])
-                            val2_is_empty = is_empty_value_general(row2[col])
-
-                            # 处理显示值：空值显示为 "null"
-                            display_val1 = 'null' if val1_is_empty else str(row1[col])
-                            display_val2 = 'null' if val2_is_empty else str(row2[col])
-
-                            # 添加差异信息（格式：checklist值 -> invoice值）
-                            diff_info[f'{col}'] = f'{display_val2} -> {display_val1}'
-                    else:
-                        # 没有差异的列留空
-                        diff_info[f'{col}'] = ''
-
-                if diff_cols:
-                    diff_count += 1
-                    logging.info(f"ID {id1} 的差异列: {diff_cols}")
-
-                # 只有当存在差异时才添加到差异数据中
-                if diff_cols:
-                    diff_data.append(diff_info)
+        compare_columns = [col for col in expected_columns[1:] if col in common_columns]
+
+        # 按ID合并两边的行（保持发票中的顺序），之后按列整体比较
+        merged = df1[df1['ID'].notna()].merge(df2, on='ID', how='inner', suffixes=('_invoice', '_checklist'))
+        match_count = len(merged)
+
+        has_difference = {}
+        diff_texts = {}
+        for col in compare_columns:
+            invoice_values = merged[f'{col}_invoice']
+            checklist_values = merged[f'{col}_checklist']
+
+            if col in NUMBER_COLUMNS:
+                invoice_numbers, invoice_texts = number_parts(invoice_values)
+                checklist_numbers, checklist_texts = number_parts(checklist_values)
+                if col == 'Price':
+                    # 对Price列使用用户设置的误差范围，无法解析为数字的价格标记为有差异
+                    tolerance = invoice_numbers * (price_tolerance_pct / 100)  # 转换为小数
+                    differs = (invoice_numbers.isna() | checklist_numbers.isna()
+                               | ((invoice_numbers - checklist_numbers).abs() > tolerance))
+                else:
+                    # 无法解析为数字的数量按原文本比较（"N/A"与空值、"abc"与"N/A"都是差异）
+                    differs = ~((invoice_numbers == checklist_numbers)
+                                | (invoice_numbers.isna() & checklist_numbers.isna()))
+                    differs |= invoice_texts.fillna('').str.strip() != checklist_texts.fillna('').str.strip()
+                invoice_display = display_values(number_values(invoice_values))
+                checklist_display = display_values(number_values(checklist_values))
+            elif col == 'HSN' or col in RATE_COLUMNS:
+                # 去除小数点后的零，忽略浮点数和整数的差异（如85423900.0和85423900）
+                invoice_display = code_values(invoice_values)
+                checklist_display = code_values(checklist_values)
+                if col == 'HSN':
+                    differs = invoice_display != checklist_display
+                else:
+                    differs = code_values(invoice_display.str.strip()) != code_values(checklist_display.str.strip())
+            else:
+                # 其他列去除首尾空白后精确比对
+                invoice_display = text_values(invoice_values).fillna('')
+                checklist_display = text_values(checklist_values).fillna('')
+                differs = invoice_display.str.strip() != checklist_display.str.strip()
+
+            differs = differs.to_numpy(dtype=bool)
+            has_difference[col] = differs
+            if differs.any():
+                logging.info(f"Column {col}: {int(differs.sum())} differences")
+
+            # 空值显示为 "null"，差异格式：checklist值 -> invoice值，没有差异的列留空
+            invoice_display = invoice_display.astype(object).mask(is_empty_display(invoice_display), 'null')
+            checklist_display = checklist_display.astype(object).mask(is_empty_display(checklist_display), 'null')
+            diff_texts[col] = (checklist_display + ' -> ' + invoice_display).where(differs, '')
+
+        diff_rows = np.zeros(len(merged), dtype=bool)
+        for differs in has_difference.values():
+            diff_rows |= differs
+        diff_count = int(diff_rows.sum())
 
         logging.info(f"Comparison complete. Found {match_count} matching IDs between files")
         logging.info(f"Found {diff_count} differences")
 
-        if diff_data:
-            diff_df = pd.DataFrame(diff_data)
-
-            # 严格按照期望的列顺序排序，只包含存在的列
-            ordered_columns = []
-            for col in expected_columns:
-                if col in diff_df.columns:
-                    ordered_columns.append(col)
-                    logging.info(f"添加列到最终报告: {col}")
-
-            logging.info(f"最终列顺序: {ordered_columns}")
-
-            # 应用新的列顺序
-            diff_df = diff_df[ordered_columns]
-
+        if diff_count:
+            diff_df = pd.DataFrame({'ID': merged['ID'], **diff_texts})[diff_rows].reset_index(drop=True)
             logging.info(f"Created difference DataFrame with shape: {diff_df.shape}")
             logging.info(f"Columns in final report: {diff_df.columns.tolist()}")
 
-            # 添加类型转换，解决Arrow序列化问题
-            for col in diff_df.columns:
-                # 所有列都转为字符串，包括之前排除的Item Name
-                diff_df[col] = diff_df[col].astype(str)
-
-            # 额外处理：确保没有字符串形式的'nan'或'none'
-            for col in diff_df.columns:
-                diff_df[col] = diff_df[col].apply(
-                    lambda x: '' if x.lower() in ['nan', 'none'] else x
-                )
-
-            return diff_df
+            # 差异报告是显示和导出用的文本
+            return diff_df.astype(str)
         else:
             logging.info("No differences found between files")
             return pd.DataFrame()
@@ -1404,6 +1024,30 @@ def compare_excels(df1, df2, price_tolerance_pct=1.1):
         st.error(error_msg)
         return pd.DataFrame()
 
+def refresh_diff_report(diff_report, processed_invoices, processed_checklist, changed_ids, price_tolerance_pct=1.1):
+    """
+    只重新比对税率列发生变化的ID，其余差异行保持不变，结果与完整比对相同
+    """
+    changed_ids = set(changed_ids)
+    if not changed_ids:
+        return diff_report
+    logging.info(f"Refreshing diff report for {len(changed_ids)} invoice rows")
+
+    refreshed = compare_excels(processed_invoices[processed_invoices['ID'].isin(changed_ids)],
+                               processed_checklist[processed_checklist['ID'].isin(changed_ids)],
+                               price_tolerance_pct)
+    if not diff_report.empty:
+        diff_report = diff_report[~diff_report['ID'].isin(changed_ids)]
+
+    frames = [df for df in (diff_report, refreshed) if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    diff_report = pd.concat(frames, ignore_index=True)
+
+    # 按发票中ID的顺序排列，与完整比对的顺序一致
+    id_order = {item_id: i for i, item_id in enumerate(processed_invoices['ID'].drop_duplicates())}
+    return diff_report.iloc[diff_report['ID'].map(id_order).argsort(kind='stable')].reset_index(drop=True)
+
 def generate_email_draft(diff_report_df):
     """
     根据差异报告生成邮件草稿内容
@@ -1518,14 +1162,9 @@ def safe_display_dataframe(df, container_width=True):
     安全显示 DataFrame，避免 PyArrow 序列化错误
     """
     try:
-        # 创建副本并转换所有列为字符串类型
-        display_df = df.copy()
-        for col in display_df.columns:
-            display_df[col] = display_df[col].astype(str)
-        
-        # 处理 NaN 值
-        display_df = display_df.fillna('')
-        
+        # 所有列转为显示用的文本（数字去除多余的零，空值为''）
+        display_df = display_frame(df)
+
         # 显示 DataFrame
         st.dataframe(display_df, use_container_width=container_width)
         return True
@@ -1545,6 +1184,37 @@ def safe_display_dataframe(df, container_width=True):
                 st.error(f"无法显示数据: {str(text_error)}")
         return False
 
+# 数据预览每页显示的行数
+PREVIEW_PAGE_ROWS = 200
+
+def preview_read_kwargs(page, header_row=0):
+    """
+    只读取预览第page页（从1开始）的 read_excel 参数：保留表头行，跳过前面各页的数据行，只读一页
+    """
+    start = (page - 1) * PREVIEW_PAGE_ROWS
+    read_kwargs = {'nrows': PREVIEW_PAGE_ROWS}
+    if header_row:
+        read_kwargs['header'] = header_row
+    if start:
+        read_kwargs['skiprows'] = range(header_row + 1, header_row + 1 + start)
+    return read_kwargs
+
+def show_preview_pages(read_page, key, header_row=0):
+    """
+    分页显示数据预览，read_page(read_kwargs) 只读取当前一页，header_row为表头所在的行
+    每页的读取结果按文件内容和工作表缓存，翻页时才读取下一页；只有当前页需要转换为字符串显示
+    """
+    page = int(st.number_input("页码", min_value=1, value=1, step=1, key=key))
+    start = (page - 1) * PREVIEW_PAGE_ROWS
+    page_df = read_page(preview_read_kwargs(page, header_row))
+    if page_df.empty and page > 1:
+        st.info("没有更多数据")
+        return
+    more = "，可翻到下一页继续查看" if len(page_df) == PREVIEW_PAGE_ROWS else ""
+    st.caption(f"第 {start + 1}-{start + len(page_df)} 行{more}")
+    # 行号与整个工作表中的行号一致
+    safe_display_dataframe(page_df.set_index(pd.RangeIndex(start, start + len(page_df))))
+
 # File Upload Tab
 with tab1:
     st.markdown("<h2 class='sub-header'>文件上传与设置</h2>", unsafe_allow_html=True)
@@ -1564,18 +1234,23 @@ with tab1:
         duty_rate_file = st.file_uploader("上传税率文件", type=["xlsx"], key="duty_rate")
         if duty_rate_file is not None:
             try:
-                # 使用安全保存函数
-                safe_path, safe_name = safe_save_uploaded_file(duty_rate_file, os.path.join("input", "duty_rate.xlsx"))
+                # 直接使用上传的数据，文件在后台保存到input/留档
+                duty_rate_upload, safe_name = buffer_uploaded_file(
+                    duty_rate_file, os.path.join("input", "duty_rate.xlsx"),
+                    [st.session_state.duty_rate_upload] if st.session_state.get('duty_rate_upload') else []
+                )
                 st.success(f"✅ 已上传: {safe_name}")
                 # 更新session state
                 st.session_state.duty_rate_uploaded = True
-                st.session_state.duty_rate_path = safe_path
+                st.session_state.duty_rate_upload = duty_rate_upload
             except Exception as e:
                 st.error(f"❌ 上传失败: {str(e)}")
                 st.session_state.duty_rate_uploaded = False
+                st.session_state.duty_rate_upload = None
         else:
             st.info("📁 请上传税率文件")
             st.session_state.duty_rate_uploaded = False
+            st.session_state.duty_rate_upload = None
 
     with col2:
         st.markdown("""
@@ -1586,18 +1261,23 @@ with tab1:
         checklist_file = st.file_uploader("上传核对清单", type=["xlsx"], key="checklist")
         if checklist_file is not None:
             try:
-                # 使用安全保存函数
-                safe_path, safe_name = safe_save_uploaded_file(checklist_file, os.path.join("input", "processing_checklist.xlsx"))
+                # 直接使用上传的数据，文件在后台保存到input/留档
+                checklist_upload, safe_name = buffer_uploaded_file(
+                    checklist_file, os.path.join("input", "processing_checklist.xlsx"),
+                    [st.session_state.checklist_upload] if st.session_state.get('checklist_upload') else []
+                )
                 st.success(f"✅ 已上传: {safe_name}")
                 # 更新session state
                 st.session_state.checklist_uploaded = True
-                st.session_state.checklist_path = safe_path
+                st.session_state.checklist_upload = checklist_upload
             except Exception as e:
                 st.error(f"❌ 上传失败: {str(e)}")
                 st.session_state.checklist_uploaded = False
+                st.session_state.checklist_upload = None
         else:
             st.info("📁 请上传核对清单")
             st.session_state.checklist_uploaded = False
+            st.session_state.checklist_upload = None
 
     with col3:
         st.markdown("""
@@ -1605,21 +1285,30 @@ with tab1:
             <h3>发票文件</h3>
         </div>
         """, unsafe_allow_html=True)
-        invoices_file = st.file_uploader("上传发票文件", type=["xlsx"], key="invoices")
-        if invoices_file is not None:
+        invoices_files = create_safe_file_uploader("上传发票文件（可多选）", key="invoices", accept_multiple_files=True)
+        if invoices_files:
             try:
-                # 使用安全保存函数
-                safe_path, safe_name = safe_save_uploaded_file(invoices_file, os.path.join("input", "processing_invoices.xlsx"))
-                st.success(f"✅ 已上传: {safe_name}")
-                # 更新session state
+                invoice_uploads = []
+                for invoices_file in invoices_files:
+                    # 直接使用上传的数据，文件在后台保存到input/留档
+                    upload, safe_name = buffer_uploaded_file(invoices_file, os.path.join("input", "processing_invoices.xlsx"),
+                                                             st.session_state.get('invoice_uploads') or [])
+                    if all(previous.path != upload.path for previous in invoice_uploads):
+                        invoice_uploads.append(upload)
+                    st.success(f"✅ 已上传: {safe_name}")
+                # 更新session state，删除已移除文件的工作簿会话
+                for removed_path in set(st.session_state.get('invoice_workbooks', {})) - {upload.path for upload in invoice_uploads}:
+                    st.session_state.invoice_workbooks.pop(removed_path).close()
                 st.session_state.invoices_uploaded = True
-                st.session_state.invoices_path = safe_path
+                st.session_state.invoice_uploads = invoice_uploads
             except Exception as e:
                 st.error(f"❌ 上传失败: {str(e)}")
                 st.session_state.invoices_uploaded = False
+                st.session_state.invoice_uploads = []
         else:
-            st.info("📁 请上传发票文件")
+            st.info("📁 请上传发票文件，可以同时选择多个")
             st.session_state.invoices_uploaded = False
+            st.session_state.invoice_uploads = []
 
     # 添加分隔线
     st.markdown("---")
@@ -1635,6 +1324,11 @@ with tab1:
         """, unsafe_allow_html=True)
         price_tolerance = st.slider("价格比对误差范围 (%)", min_value=0.1, max_value=5.0, value=1.1, step=0.1)
         st.caption(f"当前设置: 价格差异超过 {price_tolerance}% 将被标记")
+        explain_matches = st.checkbox(
+            "记录匹配过程（审计用）",
+            value=False,
+            help="导出每个Item Name的候选项及得分到 output/match_trace.xlsx，会增加处理时间"
+        )
 
     with col_process:
         st.markdown("""
@@ -1683,8 +1377,13 @@ with tab2:
     with preview_tabs[0]:
         if duty_rate_file is not None:
             try:
-                duty_df = pd.read_excel(duty_rate_file)
-                safe_display_dataframe(duty_df)
+                duty_rate_upload = st.session_state.duty_rate_upload
+                show_preview_pages(
+                    lambda read_kwargs: ParsedWorkbookCache().read_excel(duty_rate_upload.data,
+                                                                         content_digest=duty_rate_upload.digest,
+                                                                         **read_kwargs),
+                    key=f"duty_rate_preview_page_{duty_rate_upload.digest}"
+                )
             except Exception as e:
                 st.error(f"无法预览税率文件: {str(e)}")
         else:
@@ -1693,23 +1392,33 @@ with tab2:
     with preview_tabs[1]:
         if checklist_file is not None:
             try:
-                checklist_df = pd.read_excel(checklist_file, skiprows=3)
-                safe_display_dataframe(checklist_df)
+                checklist_upload = st.session_state.checklist_upload
+                show_preview_pages(
+                    lambda read_kwargs: ParsedWorkbookCache().read_excel(checklist_upload.data,
+                                                                         content_digest=checklist_upload.digest,
+                                                                         **read_kwargs),
+                    key=f"checklist_preview_page_{checklist_upload.digest}", header_row=3
+                )
             except Exception as e:
                 st.error(f"无法预览核对清单: {str(e)}")
         else:
             st.info("请先上传核对清单")
 
     with preview_tabs[2]:
-        if invoices_file is not None:
+        if invoices_files:
             try:
-                excel_file = pd.ExcelFile(invoices_file)
-                sheet_names = excel_file.sheet_names[1:]  # Skip the first sheet
+                invoice_uploads = st.session_state.invoice_uploads
+                if len(invoice_uploads) > 1:
+                    selected_upload = st.selectbox("选择发票文件", invoice_uploads, format_func=lambda upload: upload.name)
+                else:
+                    selected_upload = invoice_uploads[0]
+                invoice_workbook = get_invoice_workbook(selected_upload)
+                sheet_names = invoice_workbook.sheet_names[1:]  # Skip the first sheet
 
                 if sheet_names:
                     selected_sheet = st.selectbox("选择发票工作表", sheet_names)
-                    invoices_df = pd.read_excel(invoices_file, sheet_name=selected_sheet)
-                    safe_display_dataframe(invoices_df)
+                    show_preview_pages(lambda read_kwargs: invoice_workbook.sheet(selected_sheet, **read_kwargs),
+                                       key=f"invoice_preview_page_{invoice_workbook.digest}_{selected_sheet}")
                 else:
                     st.warning("发票文件中没有找到工作表")
             except Exception as e:
@@ -1720,13 +1429,13 @@ with tab2:
 # Process data when button is clicked
 if process_button:
     logging.info("Process button clicked")
-    if duty_rate_file is None or checklist_file is None or invoices_file is None:
+    if duty_rate_file is None or checklist_file is None or not invoices_files:
         missing_files = []
         if duty_rate_file is None:
             missing_files.append("税率文件")
         if checklist_file is None:
             missing_files.append("核对清单")
-        if invoices_file is None:
+        if not invoices_files:
             missing_files.append("发票文件")
         error_msg = f"请先上传所有必要的文件: {', '.join(missing_files)}"
         logging.error(error_msg)
@@ -1735,37 +1444,114 @@ if process_button:
         logging.info("Starting data processing workflow")
         with st.spinner("正在处理数据..."):
             try:
-                # 使用session state中保存的实际文件路径
-                duty_rate_path = st.session_state.get('duty_rate_path', os.path.join("input", "duty_rate.xlsx"))
-                invoices_path = st.session_state.get('invoices_path', os.path.join("input", "processing_invoices.xlsx"))
-                checklist_path = st.session_state.get('checklist_path', os.path.join("input", "processing_checklist.xlsx"))
-
-                logging.info(f"Input files: duty_rate={duty_rate_path}, invoices={invoices_path}, checklist={checklist_path}")
+                # 直接处理session state中上传文件的内存缓冲区，与数据预览共用
+                duty_rate_upload = st.session_state.get('duty_rate_upload')
+                invoice_uploads = st.session_state.get('invoice_uploads') or []
+                checklist_upload = st.session_state.get('checklist_upload')
+
+                # 验证文件是否已读取
+                if duty_rate_upload is None:
+                    raise FileNotFoundError("税率文件未能读取，请重新上传")
+                if not invoice_uploads:
+                    raise FileNotFoundError("发票文件未能读取，请重新上传")
+                if checklist_upload is None:
+                    raise FileNotFoundError("核对清单文件未能读取，请重新上传")
+
+                logging.info(f"Input files: duty_rate={duty_rate_upload.path}, "
+                             f"invoices={[upload.path for upload in invoice_uploads]}, checklist={checklist_upload.path}")
                 logging.info(f"Price tolerance: {price_tolerance}%")
-                
-                # 验证文件是否存在
-                if not os.path.exists(duty_rate_path):
-                    raise FileNotFoundError(f"税率文件不存在: {duty_rate_path}")
-                if not os.path.exists(invoices_path):
-                    raise FileNotFoundError(f"发票文件不存在: {invoices_path}")
-                if not os.path.exists(checklist_path):
-                    raise FileNotFoundError(f"核对清单文件不存在: {checklist_path}")
 
                 # Process duty rates
                 logging.info("Step 1: Processing duty rates")
-                duty_rates, duty_df = get_duty_rates(duty_rate_path)
+                duty_rates, duty_df, duty_index = get_duty_rates(duty_rate_upload.data, duty_rate_upload.digest)
+                if explain_matches and duty_index is not None:
+                    duty_index.trace = MatchTrace()
+
+                # 只更新了税率文件（发票、核对清单和误差范围都没变）时，
+                # 不重新处理发票和核对清单，只重新匹配受影响的发票行
+                invoice_workbooks = [get_invoice_workbook(upload) for upload in invoice_uploads]
+                run_inputs = (tuple(workbook.digest for workbook in invoice_workbooks), checklist_upload.digest,
+                              price_tolerance)
+                duty_rate_digest = duty_rate_upload.digest
+                last_run = st.session_state.get('last_processing_run')
+                duty_table_changed = (
+                    last_run is not None and duty_index is not None and duty_index.trace is None
+                    and last_run['inputs'] == run_inputs and last_run['duty_rate_digest'] != duty_rate_digest
+                )
+
+                if duty_table_changed:
+                    logging.info("Duty rate file changed, refreshing affected invoice rows only")
+                    st.info("🔄 税率文件已更新，只重新匹配受影响的发票行")
+
+                    logging.info("Step 2: Refreshing invoice duty rates")
+                    processed_invoices, new_items, changed_ids = refresh_invoice_rates(
+                        last_run['processed_invoices'], last_run['duty_rates'], last_run['duty_index'],
+                        duty_rates, duty_index
+                    )
 
-                # Process invoices
-                logging.info("Step 2: Processing invoices")
-                processed_invoices, new_items = process_invoice_file(invoices_path, duty_rates)
+                    logging.info("Step 3: Reusing processed checklist")
+                    processed_checklist = last_run['processed_checklist']
 
-                # Process checklist
-                logging.info("Step 3: Processing checklist")
-                processed_checklist = process_checklist(checklist_path)
+                    logging.info(f"Step 4: Refreshing diff report for {len(changed_ids)} changed invoice rows")
+                    diff_report = refresh_diff_report(last_run['diff_report'], processed_invoices,
+                                                      processed_checklist, changed_ids, price_tolerance)
+                else:
+                    # Process invoices
+                    logging.info("Step 2: Processing invoices")
+                    # 多个发票文件时逐个文件显示进度
+                    invoice_progress = st.progress(0.0, text=f"正在处理发票文件 0/{len(invoice_workbooks)}")
+
+                    def show_invoice_progress(done, total, workbook):
+                        invoice_progress.progress(done / total, text=f"已处理发票文件 {done}/{total}: "
+                                                                     f"{os.path.basename(workbook.name)}")
+
+                    # 多进程解析时工作进程从留档的文件读取各工作表（解析缓存与数据预览共用），
+                    # 留档写入失败时在当前进程解析上传的数据
+                    saved_paths = [upload.saved_path() for upload in invoice_uploads] if sheet_workers > 1 else []
+                    if saved_paths and all(saved_paths):
+                        processing_workbooks = [InvoiceWorkbook(saved_path, cache=ParsedWorkbookCache(),
+                                                                layout_detector=get_layout_detector())
+                                                for saved_path in saved_paths]
+                    else:
+                        processing_workbooks = invoice_workbooks
+                    try:
+                        processed_invoices, new_items = process_invoice_files(processing_workbooks, duty_rates, duty_index,
+                                                                              workers=sheet_workers,
+                                                                              progress_callback=show_invoice_progress)
+                    finally:
+                        if processing_workbooks is not invoice_workbooks:
+                            for workbook in processing_workbooks:
+                                workbook.close()
+
+                    # Process checklist
+                    logging.info("Step 3: Processing checklist")
+                    processed_checklist = process_checklist(
+                        checklist_upload.data, chunk_rows=DEFAULT_CHECKLIST_CHUNK_ROWS if stream_checklist else None,
+                        content_digest=checklist_upload.digest
+                    )
 
-                # Compare the processed files
-                logging.info("Step 4: Comparing processed files")
-                diff_report = compare_excels(processed_invoices, processed_checklist, price_tolerance)
+                    # Compare the processed files
+                    logging.info("Step 4: Comparing processed files")
+                    diff_report = compare_excels(processed_invoices, processed_checklist, price_tolerance)
+
+                # 审计模式：导出匹配过程记录；否则删除上次运行留下的记录，避免混淆
+                match_trace_path = os.path.join("output", "match_trace.xlsx")
+                if duty_index is not None and duty_index.trace is not None:
+                    duty_index.trace.export(match_trace_path)
+                elif os.path.exists(match_trace_path):
+                    os.remove(match_trace_path)
+
+                # 保存本次结果，税率文件再次更新时只需增量更新
+                if duty_index is not None and not processed_invoices.empty:
+                    st.session_state.last_processing_run = {
+                        'inputs': run_inputs,
+                        'duty_rate_digest': duty_rate_digest,
+                        'duty_rates': duty_rates,
+                        'duty_index': duty_index,
+                        'processed_invoices': processed_invoices,
+                        'processed_checklist': processed_checklist,
+                        'diff_report': diff_report,
+                    }
 
                 # Save the processed files
                 logging.info("Step 5: Saving output files")
@@ -1922,7 +1708,7 @@ with tab3:
         processed_invoices_path = os.path.join("output", "processed_invoices.xlsx")
         if os.path.exists(processed_invoices_path):
             try:
-                processed_invoices_df = pd.read_excel(processed_invoices_path)
+                processed_invoices_df = ParsedWorkbookCache().read_excel(processed_invoices_path)
                 safe_display_dataframe(processed_invoices_df)
 
                 # Download button
@@ -1942,7 +1728,7 @@ with tab3:
         processed_checklist_path = os.path.join("output", "processed_checklist.xlsx")
         if os.path.exists(processed_checklist_path):
             try:
-                processed_checklist_df = pd.read_excel(processed_checklist_path)
+                processed_checklist_df = ParsedWorkbookCache().read_excel(processed_checklist_path)
                 safe_display_dataframe(processed_checklist_df)
 
                 # Download button
@@ -1962,11 +1748,11 @@ with tab3:
         new_items_path = os.path.join("output", "added_new_items.xlsx")
         if os.path.exists(new_items_path):
             try:
-                excel_file = pd.ExcelFile(new_items_path)
-                sheet_names = excel_file.sheet_names
+                new_items_workbook = InvoiceWorkbook(new_items_path, cache=ParsedWorkbookCache())
+                sheet_names = new_items_workbook.sheet_names
 
                 if 'newDutyRate' in sheet_names:
-                    new_items_df = pd.read_excel(new_items_path, sheet_name='newDutyRate')
+                    new_items_df = new_items_workbook.sheet('newDutyRate')
                     if not new_items_df.empty:
                         safe_display_dataframe(new_items_df)
 
@@ -1987,6 +1773,16 @@ with tab3:
         else:
             st.info("没有发现新增税率项或请先处理数据")
 
+        match_trace_path = os.path.join("output", "match_trace.xlsx")
+        if os.path.exists(match_trace_path):
+            with open(match_trace_path, "rb") as file:
+                st.download_button(
+                    label="下载匹配过程记录",
+                    data=file,
+                    file_name="match_trace.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
 # Diff Report Tab
 with tab4:
     st.markdown("<h2 class='sub-header'>差异报告</h2>", unsafe_allow_html=True)
@@ -1994,7 +1790,7 @@ with tab4:
     diff_report_path = os.path.join("output", "processed_report.xlsx")
     if os.path.exists(diff_report_path):
         try:
-            diff_report_df = pd.read_excel(diff_report_path)
+            diff_report_df = ParsedWorkbookCache().read_excel(diff_report_path)
 
             if not diff_report_df.empty:
                 safe_display_dataframe(diff_report_df)
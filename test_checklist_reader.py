@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式读取核对清单的原始单元格值与 pd.read_excel 相同，以及核对清单各列的转换
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from checklist_reader import (CHECKLIST_READ_KWARGS, ChecklistStream, checklist_usecols, map_checklist_columns,
+                              parse_checklist_rows)
+
+CHECKLIST_PATHS = [
+    "input/processing_checklist.xlsx",
+    "test/c.xlsx",
+    "526input/Test1-Import_CheckList(SI_M_10911_24-25).CheckList.Data.xlsx",
+]
+
+
+def read_streamed(file_path, chunk_rows):
+    return pd.concat(list(ChecklistStream(file_path, chunk_rows=chunk_rows).iter_chunks()))
+
+
+def test_stream_matches_read_excel():
+    """真实核对清单分块读取后拼接，与一次性读取原始单元格值的列、索引和值都相同"""
+    for file_path in CHECKLIST_PATHS:
+        if not os.path.exists(file_path):
+            print(f"⚠️ 核对清单不存在: {file_path}")
+            continue
+
+        expected = pd.read_excel(file_path, **CHECKLIST_READ_KWARGS)
+        for chunk_rows in [1, 7, 500]:
+            pd.testing.assert_frame_equal(read_streamed(file_path, chunk_rows), expected)
+
+
+def test_stream_returns_raw_cells():
+    """每块都是原始单元格值的object列（不推断类型，"NA"等文本保持原样），与一次性读取相同；
+    列名来自表头（空列名和重复列名由pandas生成），表头之外的列不读取，末尾的空行去掉"""
+    rows = [
+        ['Checklist'], [], ['Generated'],
+        ['P/N', 'Item#', 'Qty', 'HSN', 'Flag', 'Date', None, 'Note', 'P/N'],
+        ['Invoice: 24HC01733-1S dt. 27-Dec-2024'],
+        ['1.1.01', 1, 10, '85423900', True, datetime.datetime(2024, 12, 27), None, 'NA', 'x'],
+        ['1.1.02', 2, 2.5, 85423900, False, None, None, 'note', 'y'],
+        [],
+        ['1.1.03', 3, 4, 'N/A', True, datetime.datetime(2025, 1, 2)],
+        ['1.1.04', 4, 5, '85423900', None, None, 7, '12', None, 'extra'],
+        [None, 5],
+        [],
+        [],
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'checklist.xlsx')
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        workbook.save(file_path)
+
+        expected = pd.read_excel(file_path, **CHECKLIST_READ_KWARGS).iloc[:, :9]
+        assert expected.columns.tolist() == ['P/N', 'Item#', 'Qty', 'HSN', 'Flag', 'Date', 'Unnamed: 6', 'Note',
+                                             'P/N.1']
+        for chunk_rows in [1, 2, 3, 100]:
+            chunks = list(ChecklistStream(file_path, chunk_rows=chunk_rows).iter_chunks())
+            assert all(len(chunk) <= chunk_rows and (chunk.dtypes == object).all() for chunk in chunks)
+            pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+        streamed = read_streamed(file_path, 100)
+        assert streamed['Item#'].tolist() == ['', 1, 2, '', 3, 4, 5]
+        assert streamed['HSN'].tolist()[1:5] == ['85423900', 85423900, '', 'N/A']
+
+        usecols = [0, 3, 8]
+        pd.testing.assert_frame_equal(
+            pd.concat(list(ChecklistStream(file_path, chunk_rows=2, usecols=usecols).iter_chunks())),
+            pd.read_excel(file_path, usecols=usecols, **CHECKLIST_READ_KWARGS)
+        )
+
+        # 只有表头没有数据行
+        header_only = os.path.join(tmp_dir, 'header_only.xlsx')
+        workbook = Workbook()
+        for row in [['Checklist'], [], [], ['P/N', 'Item#', None, 'Qty']]:
+            workbook.active.append(row)
+        workbook.save(header_only)
+        pd.testing.assert_frame_equal(next(ChecklistStream(header_only).iter_chunks()),
+                                      pd.read_excel(header_only, **CHECKLIST_READ_KWARGS))
+
+
+def test_process_checklist_streaming_is_identical():
+    """process_checklist 流式读取和一次性读取的输出相同"""
+    file_path = "526input/Test1-Import_CheckList(SI_M_10911_24-25).CheckList.Data.xlsx"
+    if not os.path.exists(file_path):
+        print(f"⚠️ 核对清单不存在: {file_path}")
+        return
+
+    from streamlit_app import process_checklist
+
+    expected = process_checklist(file_path)
+    assert not expected.empty
+    pd.testing.assert_frame_equal(process_checklist(file_path, chunk_rows=300), expected)
+
+
+def test_checklist_usecols():
+    """只读映射到的列；没有P/N列或映射到pandas生成的列名时读取所有列"""
+    columns = pd.Index(['P/N', 'Desc', 'HSN', 'Duty', 'Cus AIDC', 'Qty', 'Price', 'Category', 'Item#', 'Remark'])
+    mapping = map_checklist_columns(columns)
+    assert mapping['IGST'] == 'Duty' and mapping['BCD'] is None
+    assert checklist_usecols(columns, mapping) == [0, 1, 2, 3, 5, 6, 8]
+
+    no_pn = pd.Index(['Part', 'Desc', 'Qty', 'Item#'])
+    assert checklist_usecols(no_pn, map_checklist_columns(no_pn)) is None
+    unnamed = pd.Index(['P/N', 'Unnamed: 1', 'Qty', 'Price'])
+    assert checklist_usecols(unnamed, {'P/N': 'P/N', 'Desc': 'Unnamed: 1'}) is None
+    duplicated = pd.Index(['P/N', 'Qty', 'Price', 'Qty.1'])
+    assert checklist_usecols(duplicated, {'P/N': 'P/N', 'Qty': 'Qty.1'}) is None
+
+
+def test_pruned_read_matches_full_read():
+    """真实核对清单只读需要的列（一次性读取和流式读取），与读取所有列后选出这些列相同"""
+    for file_path in CHECKLIST_PATHS:
+        if not os.path.exists(file_path):
+            print(f"⚠️ 核对清单不存在: {file_path}")
+            continue
+
+        expected = pd.read_excel(file_path, **CHECKLIST_READ_KWARGS)
+        usecols = checklist_usecols(expected.columns, map_checklist_columns(expected.columns))
+        assert usecols is not None and len(usecols) < expected.shape[1]
+        expected = expected.iloc[:, usecols]
+        pd.testing.assert_frame_equal(pd.read_excel(file_path, usecols=usecols, **CHECKLIST_READ_KWARGS), expected)
+        for chunk_rows in [7, 500]:
+            chunks = ChecklistStream(file_path, chunk_rows=chunk_rows, usecols=usecols).iter_chunks()
+            pd.testing.assert_frame_equal(pd.concat(list(chunks)), expected)
+
+
+def test_process_checklist_pruned_is_identical():
+    """process_checklist 只读需要的列、读取所有列以及使用解析缓存中的整个核对清单，输出都相同"""
+    from streamlit_app import process_checklist
+    from workbook_cache import ParsedWorkbookCache
+
+    for file_path in CHECKLIST_PATHS:
+        if not os.path.exists(file_path):
+            print(f"⚠️ 核对清单不存在: {file_path}")
+            continue
+
+        with tempfile.TemporaryDirectory() as full_dir, tempfile.TemporaryDirectory() as pruned_dir:
+            with mock.patch('streamlit_app.ParsedWorkbookCache', lambda: ParsedWorkbookCache(full_dir)), \
+                    mock.patch('streamlit_app.checklist_usecols', return_value=None):
+                expected = process_checklist(file_path)
+            assert not expected.empty
+
+            with mock.patch('streamlit_app.ParsedWorkbookCache', lambda: ParsedWorkbookCache(pruned_dir)):
+                pd.testing.assert_frame_equal(process_checklist(file_path), expected)
+                pd.testing.assert_frame_equal(process_checklist(file_path, chunk_rows=300), expected)
+
+            # 解析缓存中已有整个核对清单
+            with mock.patch('streamlit_app.ParsedWorkbookCache', lambda: ParsedWorkbookCache(full_dir)):
+                pd.testing.assert_frame_equal(process_checklist(file_path), expected)
+
+
+def checklist_frame(rows, pn_col='P/N'):
+    return pd.DataFrame(rows, columns=[pn_col, 'Desc', 'HSN', 'Qty', 'Price', 'Item#', 'BCD', 'SWS', 'IGST'])
+
+
+def test_parse_checklist_rows():
+    """发票行保留原文，明细行的ID为发票号_Item#；发票号为空的发票之后的明细行不保留"""
+    nan = float('nan')
+    df = checklist_frame([
+        ['P0', 'RES-1', 85423900, 5, 0.5, 1, 10, 18, 11],
+        ['Invoice: 24HC 001-1S dt. 27-Dec-2024   Invoice 1 / 30', nan, nan, nan, nan, nan, nan, nan, nan],
+        ['P1', 'RESISTOR-10R-+OR-5%-PART NO.1.2', '85423900', 5, 0.5, 1.0, 10, 18, 11],
+        [12345, 0, ' 0012 ', nan, nan, ' 1 2 ', nan, nan, nan],
+        ['P3', nan, 85423900.5, 1, 1, -2.5, 1, 1, 1],
+        ['P4', 'LENS', nan, 1, 1, nan, 1, 1, 1],
+        ['Invoice:   dt. 1', nan, nan, nan, nan, nan, nan, nan, nan],
+        ['P5', 'LENS', 1, 1, 1, 5, 1, 1, 1],
+    ])
+    mapping = map_checklist_columns(df.columns)
+    rows, current_invoice = parse_checklist_rows(df, mapping)
+    assert current_invoice == ''
+    assert rows.index.tolist() == [1, 2, 3, 4, 6]
+    assert rows['Item#'].tolist() == [df.iloc[1, 0], '1', ' 1 2 ', '-2.5', df.iloc[6, 0]]
+    assert rows['ID'].tolist()[1:4] == ['24HC001-1S_1', '24HC001-1S_12', '24HC001-1S_-2']
+    assert rows.loc[[1, 6], 'ID'].isna().all()
+    assert rows.loc[2].tolist()[2:] == ['P1', 'RESISTOR10R5', '5', '0.5', 'RESISTOR', '85423900', '10', '18', '11']
+    assert rows.loc[3].tolist()[2:] == ['12345', '0', '', '', '0', '12', '', '', '']
+    assert rows.loc[4, ['Desc', 'Item_Name', 'HSN']].tolist() == ['', '', '85423900.5']
+
+    # 原始单元格值（空单元格为''，整数值的数字为int）的结果与推断过类型的列相同；"N/A"等文本保持原样
+    raw = df.astype(object).where(df.notna(), '').map(
+        lambda value: int(value) if isinstance(value, float) and value.is_integer() else value)
+    pd.testing.assert_frame_equal(parse_checklist_rows(raw, mapping)[0], rows)
+    raw.loc[2, ['Qty', 'Price']] = ['N/A', 'NA']
+    assert parse_checklist_rows(raw, mapping)[0].loc[2, ['Qty', 'Price']].tolist() == ['N/A', 'NA']
+
+
+def test_parse_checklist_rows_across_chunks():
+    """分块处理时发票号带到下一块，结果与整块处理相同；没有P/N列时在每一列中查找发票行"""
+    rows = []
+    for invoice in range(4):
+        rows.append([f'Invoice: 24HC{invoice:03d}-1S dt. 27-Dec-2024'] + [None] * 8)
+        rows += [[f'P{item}', f'CAP-{item}', 85322400, item, 0.1, item, 10, 18, 11] for item in range(1, 6)]
+    df = checklist_frame(rows)
+    mapping = map_checklist_columns(df.columns)
+    expected, expected_invoice = parse_checklist_rows(df, mapping)
+    assert len(expected) == len(df)
+
+    chunks = []
+    current_invoice = None
+    for start in range(0, len(df), 4):
+        chunk_rows, current_invoice = parse_checklist_rows(df.iloc[start:start + 4], mapping, current_invoice)
+        chunks.append(chunk_rows)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+    assert current_invoice == expected_invoice == '24HC003-1S'
+
+    # 没有P/N列：发票号在Desc列中
+    moved = checklist_frame([[None, row[0]] + row[2:] if row[0].startswith('Invoice:') else row for row in rows],
+                            pn_col='Material')
+    moved_rows, _ = parse_checklist_rows(moved, map_checklist_columns(moved.columns))
+    assert moved_rows['ID'].tolist() == expected['ID'].tolist()
+    assert (moved_rows['P/N'].dropna() == '').all()
+
+
+if __name__ == "__main__":
+    test_stream_matches_read_excel()
+    test_stream_returns_raw_cells()
+    test_process_checklist_streaming_is_identical()
+    test_checklist_usecols()
+    test_pruned_read_matches_full_read()
+    test_process_checklist_pruned_is_identical()
+    test_parse_checklist_rows()
+    test_parse_checklist_rows_across_chunks()
+    print("测试完成！")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试描述清理（str.translate 转换表）与原来逐个字符处理的结果完全相同
+"""
+
+import os
+import random
+import sys
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from desc_normalizer import (CharTable, INVOICE_DELETE_CHARS, clean_checklist_desc, clean_checklist_descs,
+                             clean_invoice_desc, clean_invoice_descs)
+
+# 随机描述的组成片段：常见的描述文本、会被删除的片段，以及大写后长度变化或被删除的字符
+FRAGMENTS = ['RESISTOR', 'cap', '-', '-PART NO', '-PART NO.', '+OR-', '+or-', 'DEG', 'deg', 'D', 'EG', '+OR', ' ',
+             '.', '(', ')', '%', '±', '/', '_', '10', '0.5', '²', '½', '١٢', 'Φ', 'φ', 'ϕ', 'Ω', 'ω', '\u2126', 'ß',
+             'ﬁ', 'ŉ', 'İ', 'é', 'e\u0301', '电阻', 'ｘ', '\u00a0', '\t', '\u200b', '🙂']
+ALL_CHARS = ''.join(chr(code) for code in range(0x110000) if not 0xD800 <= code <= 0xDFFF)
+
+
+def reference_invoice_desc(desc):
+    return ''.join(char.upper() for char in str(desc) if char.isalnum() or char in '.()').replace('Φ', '').replace('Ω', '').replace('-', '').replace('φ', '')
+
+
+def reference_checklist_desc(desc):
+    desc_parts = str(desc).split('-PART NO')
+    desc = desc_parts[0]
+    desc = desc.replace('+OR-', '')
+    desc = desc.replace('DEG', '')
+    desc = desc.replace('-', '')
+    return ''.join(char for char in desc if char.isalnum() or char in '.()').upper()
+
+
+def random_descs(count=3000, seed=23):
+    rng = random.Random(seed)
+    descs = []
+    for _ in range(count):
+        parts = [rng.choice(FRAGMENTS) if rng.random() < 0.7 else chr(rng.randrange(0x20, 0x3000))
+                 for _ in range(rng.randint(0, 12))]
+        descs.append(''.join(parts))
+    return descs
+
+
+def test_every_character():
+    """每个Unicode字符的转换结果与逐个字符处理相同（使用新的转换表，不填满模块共用的表）"""
+    assert ALL_CHARS.translate(CharTable(INVOICE_DELETE_CHARS)) == reference_invoice_desc(ALL_CHARS)
+    assert ALL_CHARS.translate(CharTable()) == reference_checklist_desc(ALL_CHARS)
+
+
+def test_random_descriptions():
+    """随机拼接的描述（包括 -PART NO、+OR-、DEG 跨片段出现）逐条比较"""
+    for desc in random_descs():
+        assert clean_invoice_desc(desc).encode('utf-8') == reference_invoice_desc(desc).encode('utf-8'), desc
+        assert clean_checklist_desc(desc).encode('utf-8') == reference_checklist_desc(desc).encode('utf-8'), desc
+    for value in [0, 12345, 0.30000000000000004, 1e16, True]:
+        assert clean_invoice_desc(value) == reference_invoice_desc(value)
+        assert clean_checklist_desc(value) == reference_checklist_desc(value)
+
+
+def test_series_matches_scalar():
+    """Series版本与逐个处理相同，空值保持为空"""
+    descs = random_descs(count=500, seed=5)
+    for series in [pd.Series(descs + [None]), pd.Series(descs + [None], dtype=object)]:
+        invoice = clean_invoice_descs(series)
+        checklist = clean_checklist_descs(series)
+        assert invoice.dtype == object and checklist.dtype == object
+        assert invoice.tolist()[:-1] == [reference_invoice_desc(desc) for desc in descs]
+        assert checklist.tolist()[:-1] == [reference_checklist_desc(desc) for desc in descs]
+        assert pd.isna(invoice.iloc[-1]) and pd.isna(checklist.iloc[-1])
+
+
+if __name__ == "__main__":
+    test_every_character()
+    test_random_descriptions()
+    test_series_matches_scalar()
+    print("测试完成！")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向量化的税率表清理和汇总与原来的逐行实现结果一致
+"""
+
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_duty_rates import (build_duty_table, legacy_aggregate_duty_rates, legacy_clean_item_names,
+                                  legacy_pipeline, vectorized_pipeline)
+
+
+def value_types(duty_dict):
+    return [type(value) for rates in duty_dict.values() for value in rates.values()]
+
+
+def test_clean_item_names_matches_legacy():
+    """所有Unicode空白字符的处理与 str.split() 一致"""
+    from streamlit_app import clean_item_names
+
+    names = pd.Series(['  Bare\xa0PCB ', 'IC\tCHIP\r\nARM', 'Lens　Cap\x1c', ' \xa0 ', '', None, np.nan,
+                       'Zero​Width', 'Multi   Space\x85End', 12345, 1.5], dtype=object)
+    assert clean_item_names(names).tolist() == legacy_clean_item_names(names).tolist()
+
+    # pyarrow字符串列
+    str_names = pd.Series(['  Bare\xa0PCB ', None, 'Lens Cap'], dtype='str')
+    assert clean_item_names(str_names).tolist() == legacy_clean_item_names(str_names).tolist()
+
+
+def test_aggregate_matches_legacy():
+    """HSN拼接、HSN2回退、最小税率和数值类型与原实现一致"""
+    df = build_duty_table(3000)
+    legacy_dict = legacy_pipeline(df)
+    duty_dict = vectorized_pipeline(df)
+
+    assert duty_dict == legacy_dict
+    assert list(duty_dict) == list(legacy_dict)
+    assert value_types(duty_dict) == value_types(legacy_dict)
+
+
+def test_aggregate_without_hsn2():
+    """没有HSN2列时只使用HSN1"""
+    from duty_rates import aggregate_duty_rates
+
+    df = pd.DataFrame({
+        'Item Name': ['B', 'A', 'B', 'C'],
+        'HSN1': [85340000, np.nan, 85423100, np.nan],
+        'Final BCD': [10.0, 0.0, 7.5, 15.0],
+        'Final SWS': [10, 10, 0, 10],
+        'Final IGST': [18, 18, 18, 28],
+    })
+    duty_dict = aggregate_duty_rates(df)
+    assert duty_dict == legacy_aggregate_duty_rates(df)
+    assert duty_dict['B'] == {'hsn': '85340000.0 85423100.0', 'bcd': 7.5, 'sws': 0, 'igst': 18}
+    assert duty_dict['A']['hsn'] == ''
+
+
+def test_processing_invoices_matches_legacy():
+    """processing_invoices.get_duty_rates 与原实现一致"""
+    import processing_invoices
+
+    df = build_duty_table(3000)
+    df = df[df['Item Name'].notna() & (df['Item Name'].str.strip() != '')]
+    with mock.patch('pandas.read_excel', return_value=df):
+        duty_dict = processing_invoices.get_duty_rates()
+
+    legacy_dict = legacy_aggregate_duty_rates(df)
+    assert duty_dict == legacy_dict
+    assert value_types(duty_dict) == value_types(legacy_dict)
+
+
+if __name__ == "__main__":
+    test_clean_item_names_matches_legacy()
+    test_aggregate_matches_legacy()
+    test_aggregate_without_hsn2()
+    test_processing_invoices_matches_legacy()
+    print("测试完成！")
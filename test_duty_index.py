@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试DutyRateIndex与逐个扫描的匹配结果完全一致
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from duty_matching import DutyRateIndex, MatchTrace, normalize_item_name, find_best_match
+
+
+def reference_find_best_match(item_name, duty_rates_dict):
+    """原始的逐个扫描实现，作为对照"""
+    if not item_name or pd.isna(item_name):
+        return None
+
+    normalized_item = normalize_item_name(item_name)
+
+    if item_name in duty_rates_dict:
+        return item_name
+
+    for duty_item in duty_rates_dict.keys():
+        if normalize_item_name(duty_item) == normalized_item:
+            return duty_item
+
+    best_match = None
+    best_score = 0
+    item_words = normalized_item.split()
+
+    for duty_item in duty_rates_dict.keys():
+        duty_words = normalize_item_name(duty_item).split()
+        score = 0
+        if len(item_words) == len(duty_words):
+            matching_words = sum(1 for w1, w2 in zip(item_words, duty_words) if w1 == w2)
+            if matching_words == len(item_words):
+                return duty_item
+            elif matching_words >= len(item_words) * 0.8:
+                score = matching_words / len(item_words)
+        elif len(item_words) <= len(duty_words):
+            matching_words = sum(1 for word in item_words if word in duty_words)
+            if matching_words == len(item_words) and len(item_words) >= 2:
+                score = 0.9
+        elif len(item_words) == 1 and len(duty_words) == 1:
+            item_word = item_words[0]
+            duty_word = duty_words[0]
+            if item_word in duty_word or duty_word in item_word:
+                shorter_len = min(len(item_word), len(duty_word))
+                longer_len = max(len(item_word), len(duty_word))
+                if shorter_len >= 6 and (longer_len - shorter_len) / longer_len <= 0.3:
+                    score = shorter_len / longer_len
+        if score > best_score and score >= 0.85:
+            best_score = score
+            best_match = duty_item
+
+    return best_match
+
+
+def build_synthetic_duty_rates(seed=7, size=600):
+    """构造包含多单词、重复单词和分隔符变体的税率表"""
+    rng = random.Random(seed)
+    vocabulary = ['CAMERA', 'IPC', 'DOME', 'BULLET', 'LENS', 'PCBA', 'CABLE', 'POWER', 'ADAPTER',
+                  'BRACKET', 'SCREW', 'IC', 'LED', 'RESISTOR', 'CAPACITOR', 'MODULE', 'WIFI', '4MP']
+    duty_rates = {}
+    while len(duty_rates) < size:
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(1, 9))]
+        separator = rng.choice([' ', '-', '_', ', '])
+        name = separator.join(words)
+        if rng.random() < 0.3:
+            name = name.lower()
+        duty_rates[name] = {'hsn': '85258900', 'bcd': 10, 'sws': 10, 'igst': 18}
+    return duty_rates, vocabulary
+
+
+def test_index_matches_reference_on_synthetic_table():
+    """随机生成的item name与原始扫描结果一致"""
+    duty_rates, vocabulary = build_synthetic_duty_rates()
+    duty_index = DutyRateIndex(duty_rates)
+    rng = random.Random(11)
+
+    queries = list(duty_rates.keys())[:50]
+    for _ in range(2000):
+        words = [rng.choice(vocabulary + ['UNKNOWN']) for _ in range(rng.randint(1, 9))]
+        queries.append(rng.choice([' ', '-']).join(words))
+
+    mismatches = 0
+    for query in queries:
+        expected = reference_find_best_match(query, duty_rates)
+        actual = duty_index.find_best_match(query)
+        if expected != actual:
+            mismatches += 1
+            print(f"❌ '{query}': 索引={actual!r}, 扫描={expected!r}")
+
+    print(f"对比 {len(queries)} 个查询，不一致 {mismatches} 个")
+    assert mismatches == 0
+
+
+def test_index_matches_reference_on_duty_file():
+    """真实税率文件上的结果一致"""
+    duty_rate_path = "input/duty_rate.xlsx"
+    if not os.path.exists(duty_rate_path):
+        print(f"⚠️ 税率文件不存在: {duty_rate_path}")
+        return
+
+    duty_df = pd.read_excel(duty_rate_path)
+    names = [str(name).strip() for name in duty_df['Item Name'].dropna()]
+    duty_rates = {name: {} for name in names if name}
+    duty_index = DutyRateIndex(duty_rates)
+
+    queries = names + [name.lower() for name in names] + [name + ' NEW' for name in names]
+    queries += ['Bare PCB board', 'IC chip', 'Power adapter cable', '']
+    for query in queries:
+        assert duty_index.find_best_match(query) == reference_find_best_match(query, duty_rates), query
+
+
+def test_find_best_match_accepts_plain_dict():
+    """不传入索引时仍然可以直接使用字典"""
+    duty_rates = {'CONNECTOR USB TYPE-C': {}, 'IC MICROCONTROLLER ARM': {}}
+    assert find_best_match('connector_usb type c', duty_rates) == 'CONNECTOR USB TYPE-C'
+    assert find_best_match('IC MICROCONTROLLER', duty_rates) == 'IC MICROCONTROLLER ARM'
+    assert find_best_match('UNKNOWN COMPONENT', duty_rates) is None
+    assert find_best_match(None, duty_rates) is None
+
+
+def test_normalized_key_table():
+    """预先计算的标准化键表、单词元组和单词集合"""
+    duty_rates = {'Bare PCB': {}, 'bare-pcb': {}, 'IC_CHIP ARM': {}, 'ARM IC CHIP': {}}
+    duty_index = DutyRateIndex(duty_rates)
+
+    # 标准化后的精确匹配只需一次字典查找，重复时保留第一个键
+    assert duty_index.normalized_keys == {'BARE PCB': 'Bare PCB', 'IC CHIP ARM': 'IC_CHIP ARM', 'ARM IC CHIP': 'ARM IC CHIP'}
+
+    assert duty_index.token_tuples[2] == ('IC', 'CHIP', 'ARM')
+    assert duty_index.token_sets[2] == duty_index.token_sets[3]
+
+
+def test_match_items_deduplicates_names():
+    """批量匹配时相同名称只匹配一次，空名称被跳过"""
+    duty_rates = {'IC MICROCONTROLLER ARM': {}, 'LED 0805 RED': {}}
+    duty_index = DutyRateIndex(duty_rates)
+
+    calls = []
+    original_fuzzy_match = duty_index._fuzzy_match
+    duty_index._fuzzy_match = lambda name, normalized: calls.append(name) or original_fuzzy_match(name, normalized)
+
+    names = ['LED 0805 RED', 'IC MICROCONTROLLER', '', None, 'LED 0805 RED', 'UNKNOWN PART', 'IC MICROCONTROLLER']
+    matches = duty_index.match_items(names)
+
+    assert matches == {
+        'LED 0805 RED': 'LED 0805 RED',
+        'IC MICROCONTROLLER': 'IC MICROCONTROLLER ARM',
+        'UNKNOWN PART': None,
+    }
+    # 精确匹配不需要打分，模糊匹配每个唯一名称只打分一次
+    assert calls == ['IC MICROCONTROLLER', 'UNKNOWN PART']
+
+
+def test_single_token_items_skip_candidate_scoring():
+    """单个单词的型号与逐个扫描结果一致（子串规则从不生效），且不进行候选打分"""
+    duty_rates = {'IPCK7CP3H1W': {}, 'DS2CD2143G2': {}, 'CAMERA IPCK7CP3H1WE': {}, 'NVR': {}}
+    duty_index = DutyRateIndex(duty_rates)
+    duty_index._candidates = lambda item_words: (_ for _ in ()).throw(AssertionError(item_words))
+
+    for query in ['IPCK7CP3H1WE', 'DS2CD2143G2IU', 'IPCK7CP3H1', 'NVR4', 'ipck7cp3h1w', 'nvr']:
+        assert duty_index.find_best_match(query) == reference_find_best_match(query, duty_rates), query
+
+    assert duty_index.find_best_match('IPCK7CP3H1WE') is None
+    assert duty_index.find_best_match('ipck7cp3h1w') == 'IPCK7CP3H1W'
+
+
+def test_match_trace_records_candidate_scores():
+    """审计模式记录每个候选项的得分，并可导出"""
+    duty_rates = {'IC MICROCONTROLLER ARM': {}, 'IC MICROCONTROLLER': {}, 'IC DRIVER ARM': {}, 'LED 0805 RED': {}}
+    duty_index = DutyRateIndex(duty_rates, trace=MatchTrace())
+    duty_index.match_items(['led-0805 red', 'IC ARM', 'NVR'])
+
+    trace_df = duty_index.trace.to_dataframe()
+    assert trace_df.columns.tolist() == MatchTrace.COLUMNS
+
+    exact_rows = trace_df[trace_df['Item Name'] == 'led-0805 red']
+    assert exact_rows[['Candidate', 'Strategy', 'Selected']].values.tolist() == [['LED 0805 RED', 'normalized', True]]
+
+    fuzzy_rows = trace_df[trace_df['Item Name'] == 'IC ARM']
+    assert fuzzy_rows[['Candidate', 'Strategy', 'Score', 'Selected']].values.tolist() == [
+        ['IC MICROCONTROLLER ARM', 'all_words', 0.9, True],
+        ['IC MICROCONTROLLER', 'same_words', 0, False],
+        ['IC DRIVER ARM', 'all_words', 0.9, False],
+    ]
+
+    single_rows = trace_df[trace_df['Item Name'] == 'NVR']
+    assert single_rows['Strategy'].tolist() == ['single_token']
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace_path = os.path.join(tmp_dir, 'match_trace.csv')
+        duty_index.trace.export(trace_path)
+        assert len(pd.read_csv(trace_path)) == len(trace_df)
+
+
+if __name__ == "__main__":
+    test_index_matches_reference_on_synthetic_table()
+    test_index_matches_reference_on_duty_file()
+    test_find_best_match_accepts_plain_dict()
+    test_normalized_key_table()
+    test_match_items_deduplicates_names()
+    test_single_token_items_skip_candidate_scoring()
+    test_match_trace_records_candidate_scores()
+    print("测试完成！")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试税率表更新后的增量重新匹配与完整处理结果一致
+"""
+
+import os
+import random
+import sys
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from duty_matching import DutyRateIndex, diff_duty_rates, affected_item_names
+
+
+def test_affected_item_names_cover_all_changed_matches():
+    """随机增删税率键后，未列为受影响的名称匹配结果不变"""
+    rng = random.Random(3)
+    vocabulary = ['CAMERA', 'IPC', 'DOME', 'LENS', 'PCBA', 'CABLE', 'POWER', 'ADAPTER', 'IC', 'LED']
+
+    def random_name():
+        return rng.choice([' ', '-']).join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5)))
+
+    old_rates = {}
+    while len(old_rates) < 300:
+        old_rates[random_name()] = {'hsn': '85258900', 'bcd': 10, 'sws': 10, 'igst': 18}
+    old_rates = dict(sorted(old_rates.items()))
+    queries = list(dict.fromkeys(random_name() for _ in range(1500)))
+
+    total_changed = 0
+    for _ in range(5):
+        new_rates = {key: rates for key, rates in old_rates.items() if rng.random() > 0.05}
+        while len(new_rates) < len(old_rates) + 10:
+            new_rates.setdefault(random_name(), {'hsn': '85258900', 'bcd': 10, 'sws': 10, 'igst': 18})
+        new_rates = dict(sorted(new_rates.items()))
+
+        old_matches = DutyRateIndex(old_rates).match_items(queries)
+        new_matches = DutyRateIndex(new_rates).match_items(queries)
+        added, removed, changed = diff_duty_rates(old_rates, new_rates)
+        affected = set(affected_item_names(old_matches, added, removed))
+
+        changed_names = {name for name in queries if old_matches[name] != new_matches[name]}
+        assert changed_names <= affected, changed_names - affected
+        total_changed += len(changed_names)
+        old_rates = new_rates
+
+    assert total_changed > 0
+
+
+def test_diff_duty_rates():
+    old_rates = {'A': {'bcd': 10}, 'B': {'bcd': 10}, 'C': {'bcd': 10}}
+    new_rates = {'A': {'bcd': 10}, 'C': {'bcd': 7.5}, 'D': {'bcd': 10}}
+    assert diff_duty_rates(old_rates, new_rates) == (['D'], ['B'], ['C'])
+
+
+def test_refresh_matches_full_processing():
+    """增量更新后的发票、新增项目和差异报告与用新税率表完整处理的结果相同"""
+    duty_rate_path = "input/duty_rate.xlsx"
+    invoice_path = "input/processing_invoices23.xlsx"
+    checklist_path = "input/processing_checklist.xlsx"
+    if not all(os.path.exists(path) for path in [duty_rate_path, invoice_path, checklist_path]):
+        print("⚠️ 测试文件不存在，跳过")
+        return
+
+    from streamlit_app import (get_duty_rates, process_invoice_file, process_checklist, compare_excels,
+                               refresh_invoice_rates, refresh_diff_report)
+
+    old_rates, _, old_index = get_duty_rates(duty_rate_path)
+    processed_invoices, new_items = process_invoice_file(invoice_path, old_rates, old_index)
+    processed_checklist = process_checklist(checklist_path)
+    diff_report = compare_excels(processed_invoices, processed_checklist)
+    assert not new_items.empty
+
+    # 删除一个已匹配的键、补充一个新项目、修改一个税率
+    matched_keys = [key for key in dict.fromkeys(old_index.resolved.values()) if key]
+    new_rates = {key: dict(rates) for key, rates in old_rates.items() if key != matched_keys[0]}
+    new_rates[new_items['Item Name'].iloc[0]] = {'hsn': '85299090', 'bcd': 15.0, 'sws': 10, 'igst': 18}
+    new_rates[matched_keys[1]]['bcd'] = 99.0
+    new_rates = dict(sorted(new_rates.items()))
+    new_index = DutyRateIndex(new_rates)
+
+    refreshed_invoices, refreshed_new_items, changed_ids = refresh_invoice_rates(
+        processed_invoices, old_rates, old_index, new_rates, new_index)
+    refreshed_report = refresh_diff_report(diff_report, refreshed_invoices, processed_checklist, changed_ids)
+    assert changed_ids
+
+    expected_invoices, expected_new_items = process_invoice_file(invoice_path, new_rates, DutyRateIndex(new_rates))
+    expected_report = compare_excels(expected_invoices, processed_checklist)
+
+    pd.testing.assert_frame_equal(refreshed_invoices, expected_invoices)
+    pd.testing.assert_frame_equal(refreshed_new_items, expected_new_items)
+    pd.testing.assert_frame_equal(refreshed_report, expected_report)
+
+
+def test_refresh_with_missing_item_name():
+    """发票中Item_Name为空值（包括"none"文本）的行不参与重新匹配，税率列保持为空"""
+    from output_schema import to_output_schema
+    from streamlit_app import refresh_invoice_rates
+
+    old_rates = {'CAMERA': {'hsn': '85258900', 'bcd': 10, 'sws': 10, 'igst': 18}}
+    new_rates = {'CAMERA': {'hsn': '85258900', 'bcd': 15, 'sws': 10, 'igst': 18}}
+    processed_invoices = to_output_schema(pd.DataFrame({
+        'Item#': ['1', '2', '3', '4'], 'ID': ['CI_1', 'CI_2', 'CI_3', 'CI_4'],
+        'Item_Name': ['CAMERA', None, 'none', ''],
+        'HSN': ['85258900', '', '', ''], 'BCD': ['10', '', '', ''], 'SWS': ['10', '', '', ''],
+        'IGST': ['18', '', '', ''],
+    }, dtype=object))
+    assert processed_invoices['Item_Name'].isna().sum() == 2
+
+    old_index = DutyRateIndex(old_rates)
+    old_index.match_items(processed_invoices['Item_Name'])
+    refreshed, new_items, changed_ids = refresh_invoice_rates(
+        processed_invoices, old_rates, old_index, new_rates, DutyRateIndex(new_rates))
+    assert changed_ids == ['CI_1']
+    assert refreshed['BCD'].tolist() == ['15', '', '', '']
+    assert new_items.empty
+
+
+if __name__ == "__main__":
+    test_affected_item_names_cover_all_changed_matches()
+    test_diff_duty_rates()
+    test_refresh_matches_full_processing()
+    test_refresh_with_missing_item_name()
+    print("测试完成！")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试税率表二进制快照
+"""
+
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from duty_matching import DutyRateIndex
+from duty_snapshot import DutySnapshotStore
+
+
+def test_snapshot_round_trip():
+    """快照读回的税率字典、原始表和标准化名称与写入时完全一致（包括数值类型）"""
+    duty_dict = {
+        'Bare PCB': {'hsn': '85340000', 'bcd': 10.0, 'sws': 10, 'igst': 18},
+        'IC_CHIP ARM': {'hsn': '85423100 85423900', 'bcd': 0.0, 'sws': 0, 'igst': 18},
+    }
+    df = pd.DataFrame({'Item Name': ['Bare PCB', 'IC_CHIP ARM'], 'HSN1': [85340000, 85423100]}, index=[0, 2])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, 'duty_rate.xlsx')
+        with open(source_path, 'wb') as f:
+            f.write(b'duty rate workbook')
+
+        store = DutySnapshotStore(os.path.join(tmp_dir, 'snapshots'))
+        key = store.snapshot_key(source_path, 'test')
+        assert store.load(key) is None
+
+        store.save(key, duty_dict, df, DutyRateIndex(duty_dict).normalized_names)
+        loaded_dict, loaded_df, normalized_names = store.load(key)
+
+        assert loaded_dict == duty_dict
+        assert list(loaded_dict) == list(duty_dict)
+        assert [type(v) for rates in loaded_dict.values() for v in rates.values()] == \
+            [type(v) for rates in duty_dict.values() for v in rates.values()]
+        pd.testing.assert_frame_equal(loaded_df, df)
+        assert normalized_names == ['BARE PCB', 'IC CHIP ARM']
+
+        # 从快照构建的索引与直接构建的索引一致
+        assert DutyRateIndex(loaded_dict, normalized_names=normalized_names).normalized_keys == \
+            DutyRateIndex(duty_dict).normalized_keys
+
+        # 文件内容变化后key改变，需要重新生成快照
+        with open(source_path, 'ab') as f:
+            f.write(b' changed')
+        assert store.snapshot_key(source_path, 'test') != key
+        assert store.load(store.snapshot_key(source_path, 'test')) is None
+
+
+def test_snapshot_skips_mixed_types_and_evicts():
+    """混合类型的列不写快照；超过保留数量时删除最久未使用的快照"""
+    df = pd.DataFrame({'Item Name': ['A']})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = DutySnapshotStore(tmp_dir, max_snapshots=2)
+
+        store.save('mixed', {'A': {'hsn': '1', 'bcd': 10, 'sws': 10, 'igst': 18},
+                             'B': {'hsn': '2', 'bcd': 7.5, 'sws': 10, 'igst': 18}}, df)
+        assert store.load('mixed') is None
+
+        rates = {'A': {'hsn': '1', 'bcd': 10, 'sws': 10, 'igst': 18}}
+        store.save('k1', rates, df)
+        store.save('k2', rates, df)
+        os.utime(os.path.join(tmp_dir, 'k1.rates.arrow'), (100, 100))
+        os.utime(os.path.join(tmp_dir, 'k2.rates.arrow'), (200, 200))
+        store.save('k3', rates, df)
+
+        assert store.load('k1') is None
+        assert store.load('k3') is not None
+
+
+def test_get_duty_rates_uses_snapshot():
+    """第二次读取同一税率文件时使用快照，结果与解析Excel一致"""
+    duty_rate_path = "input/duty_rate.xlsx"
+    if not os.path.exists(duty_rate_path):
+        print(f"⚠️ 税率文件不存在: {duty_rate_path}")
+        return
+
+    from streamlit_app import get_duty_rates
+
+    # 在临时目录中运行，快照和匹配缓存写到临时目录下的cache/
+    duty_rate_path = os.path.abspath(duty_rate_path)
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            parsed_dict, parsed_df, parsed_index = get_duty_rates(duty_rate_path)
+            assert len(os.listdir(os.path.join('cache', 'duty_snapshots'))) == 2
+
+            snapshot_dict, snapshot_df, snapshot_index = get_duty_rates(duty_rate_path)
+        finally:
+            os.chdir(original_cwd)
+
+    assert snapshot_dict == parsed_dict
+    pd.testing.assert_frame_equal(snapshot_df, parsed_df)
+    assert snapshot_index.fingerprint == parsed_index.fingerprint
+    assert snapshot_index.normalized_keys == parsed_index.normalized_keys
+    # 两次读取共用同一个匹配缓存（同一个SQLite连接）
+    assert snapshot_index.match_cache is parsed_index.match_cache
+
+
+if __name__ == "__main__":
+    test_snapshot_round_trip()
+    test_snapshot_skips_mixed_types_and_evicts()
+    test_get_duty_rates_uses_snapshot()
+    print("测试完成！")
@@ -29,7 +29,7 @@ def test_processing():
             print(f"❌ 税率文件不存在: {duty_rate_path}")
             return False
             
-        duty_rates, duty_df = get_duty_rates(duty_rate_path)
+        duty_rates, duty_df, duty_index = get_duty_rates(duty_rate_path)
         print(f"✅ 税率文件处理成功，包含 {len(duty_rates)} 个项目")
         
         # 2. 测试发票文件处理
@@ -39,7 +39,7 @@ def test_processing():
         for invoice_path in invoice_files:
             if os.path.exists(invoice_path):
                 print(f"处理发票文件: {invoice_path}")
-                processed_invoices, new_items = process_invoice_file(invoice_path, duty_rates)
+                processed_invoices, new_items = process_invoice_file(invoice_path, duty_rates, duty_index)
                 
                 if not processed_invoices.empty:
                     print(f"✅ 发票文件处理成功:")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试发票工作表布局识别及相同模板的布局缓存
+"""
+
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from invoice_layout import DEFAULT_COLUMN_INDICES, LayoutDetector, LayoutRegistry, detect_layout, head_rows
+from invoice_sheets import InvoiceWorkbook, parse_invoice_sheet
+
+INVOICE_PATH = "input/processing_invoices23.xlsx"
+
+HEADER = ('Item No.', 'Model', 'P/N', 'Description', 'Origin', 'Qty (PCS)', 'Unit Price', 'Amount')
+
+
+def invoice_rows(invoice_no, items, header=HEADER, title_rows=3):
+    rows = [(f'Invoice No. {invoice_no}',) + (np.nan,) * 7]
+    rows += [(np.nan,) * 8] * (title_rows - 1)
+    rows.append(header)
+    rows.append(('Sl', np.nan, np.nan, 'Goods', np.nan, np.nan, 'USD', 'USD'))
+    rows += [(i, 'IPC-K7', f'1.2.{i}', f'RESISTOR-{i}R', 'CN', i * 10, 0.5, i * 5.0) for i in range(1, items + 1)]
+    return rows
+
+
+def test_detect_layout():
+    """找到表头、各列位置和数据起始行；没有表头时使用默认列位置"""
+    layout = detect_layout(invoice_rows('24HC001', 5))
+    assert layout.header_row == 3
+    assert layout.data_start == 5
+    assert layout.column_indices == {'Item#': 0, 'Model_No': 1, 'P/N': 2, 'Desc': 3, 'Country': 4,
+                                     'Qty': 5, 'Price': 6, 'Amount': 7}
+
+    no_header = detect_layout([(np.nan,) * 8, (1, 'a', 'b', 'c', 'd', 1, 2.0, 2.0)])
+    assert no_header.header_row is None and no_header.fingerprint is None
+    assert no_header.data_start == 1
+    assert no_header.column_indices == DEFAULT_COLUMN_INDICES
+
+
+def test_same_template_detected_once():
+    """相同模板的工作表只识别一次；表头或数据起始行不同时重新识别"""
+    detector = LayoutDetector()
+    with mock.patch('invoice_layout.detect_layout', wraps=detect_layout) as detect:
+        first = detector.detect(invoice_rows('24HC001', 5))
+        second = detector.detect(invoice_rows('24HC002', 30))
+        assert second is first
+        assert detect.call_count == 1
+
+        # 表头文本不同
+        other_header = HEADER[:5] + ('Quantity',) + HEADER[6:]
+        assert detector.detect(invoice_rows('24HC003', 5, header=other_header)).column_indices['Qty'] == 5
+        # 表头位置不同
+        assert detector.detect(invoice_rows('24HC004', 5, title_rows=5)).header_row == 5
+        # 表头相同，但表头后多了一行说明
+        rows = invoice_rows('24HC005', 5)
+        rows.insert(5, ('Continued', np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan))
+        assert detector.detect(rows).data_start == 6
+        assert detect.call_count == 4
+    assert (detector.hits, detector.misses) == (1, 4)
+
+
+def assert_cached_layout_parses_identically(path):
+    detector = LayoutDetector()
+    with InvoiceWorkbook(path) as workbook:
+        for sheet_name in workbook.sheet_names[1:]:
+            cached = parse_invoice_sheet(workbook, sheet_name, sheet_name, layout_detector=detector)
+            fresh = parse_invoice_sheet(workbook, sheet_name, sheet_name, layout_detector=LayoutDetector())
+            if fresh is None:
+                assert cached is None
+            else:
+                pd.testing.assert_frame_equal(cached, fresh)
+            assert detect_layout(head_rows(workbook.sheet(sheet_name))).column_indices == \
+                detector.detect(head_rows(workbook.sheet(sheet_name))).column_indices
+    return detector
+
+
+def test_cached_layout_parses_identically():
+    """使用缓存布局和每个工作表单独识别的解析结果相同"""
+    # 表头行与已知模板相同，但之前的行中有表头关键词时，单独识别会把那一行当作表头
+    header = HEADER[:5] + ('Unit Price', 'Qty (PCS)') + HEADER[7:]
+    keyword_rows = invoice_rows('24HC003', 5, header=header)
+    keyword_rows[1] = ('Description of goods as per contract',) + (np.nan,) * 7
+    sheets = {
+        'Summary': [('Total',) + (np.nan,) * 7],
+        'CI-24HC001': invoice_rows('24HC001', 5, header=header),
+        'CI-24HC002': invoice_rows('24HC002', 8, header=header),
+        'CI-24HC003': keyword_rows,
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'invoices.xlsx')
+        with pd.ExcelWriter(path) as writer:
+            for sheet_name, rows in sheets.items():
+                pd.DataFrame([('Supplier Co., Ltd.',) + (np.nan,) * 7] + rows).to_excel(
+                    writer, sheet_name=sheet_name, header=False, index=False)
+        detector = assert_cached_layout_parses_identically(path)
+    assert detector.hits > 0
+
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+    detector = assert_cached_layout_parses_identically(INVOICE_PATH)
+    assert detector.hits > detector.misses
+
+
+def test_registry_persists_layouts():
+    """识别过的模板保存在登记表中，下次运行时不再识别"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry_path = os.path.join(tmp_dir, 'layouts.json')
+        layout = LayoutDetector(registry=LayoutRegistry(registry_path)).detect(invoice_rows('24HC001', 5))
+
+        with mock.patch('invoice_layout.detect_layout') as detect:
+            detector = LayoutDetector(registry=LayoutRegistry(registry_path))
+            known = detector.detect(invoice_rows('24HC002', 8))
+        assert detect.call_count == 0
+        assert (known.header_row, known.column_indices, known.data_start) == \
+            (layout.header_row, layout.column_indices, layout.data_start)
+
+        # 登记表损坏时只是重新识别
+        with open(registry_path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        assert LayoutDetector(registry=LayoutRegistry(registry_path)).detect(invoice_rows('24HC003', 5)).data_start == 5
+
+
+def test_narrow_columns():
+    """需要的列在表头行都有文本时只读这几列，否则读取整个工作表"""
+    rows = invoice_rows('24HC001', 5)
+    assert detect_layout(rows).narrow_columns(rows) == [0, 1, 2, 3, 4, 5, 6, 7]
+
+    # 表头没有Origin和Amount列时使用默认列位置4和7，这两列没有表头文本
+    header = ('Item No.', 'Model', 'P/N', 'Description', np.nan, 'Qty (PCS)', 'Unit Price', np.nan)
+    rows = invoice_rows('24HC001', 5, header=header)
+    assert detect_layout(rows).narrow_columns(rows) is None
+
+
+def test_narrow_read_parses_identically():
+    """只读需要的几列的解析结果与读取整个工作表相同"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    narrow_reads = 0
+    with InvoiceWorkbook(INVOICE_PATH) as narrow, InvoiceWorkbook(INVOICE_PATH) as full:
+        for sheet_name in narrow.sheet_names[1:]:
+            full.sheet(sheet_name)
+            expected = parse_invoice_sheet(full, sheet_name, sheet_name, layout_detector=LayoutDetector())
+            actual = parse_invoice_sheet(narrow, sheet_name, sheet_name, layout_detector=LayoutDetector())
+            if expected is None:
+                assert actual is None
+            else:
+                pd.testing.assert_frame_equal(actual, expected)
+            narrow_reads += not narrow.is_loaded(sheet_name)
+    assert narrow_reads > 0
+
+
+if __name__ == "__main__":
+    test_detect_layout()
+    test_same_template_detected_once()
+    test_cached_layout_parses_identically()
+    test_registry_persists_layouts()
+    test_narrow_columns()
+    test_narrow_read_parses_identically()
+    print("测试完成！")
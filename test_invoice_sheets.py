@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试工作簿会话、多个发票文件的合并，以及多进程并行解析发票工作表的结果与逐个解析完全相同
+"""
+
+import datetime
+import io
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from invoice_sheets import (INVOICE_SHEET_COLUMNS, InvoiceWorkbook, add_file_suffixes, expand_invoice_paths,
+                            map_invoice_sheets, parse_invoice_sheet, read_invoice_sheet)
+from invoice_layout import LayoutDetector, LayoutRegistry
+from output_schema import to_output_schema
+
+INVOICE_PATH = "input/processing_invoices23.xlsx"
+SECOND_INVOICE_PATH = "input/processing_invoices33.xlsx"
+
+
+def test_map_invoice_sheets_keeps_sheet_order():
+    """并行读取的工作表按原始顺序返回"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    sheet_names = pd.ExcelFile(INVOICE_PATH).sheet_names[1:6]
+    sheet_args = [(sheet_name,) for sheet_name in sheet_names]
+    serial = map_invoice_sheets(read_invoice_sheet, INVOICE_PATH, sheet_args, workers=1)
+    parallel = map_invoice_sheets(read_invoice_sheet, INVOICE_PATH, sheet_args, workers=3)
+
+    assert len(parallel) == len(sheet_names)
+    for serial_df, parallel_df in zip(serial, parallel):
+        pd.testing.assert_frame_equal(serial_df, parallel_df)
+
+
+def test_workbook_opened_once():
+    """整个工作簿只打开一次，读取结果与逐个工作表 read_excel 相同"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    with mock.patch('invoice_sheets.pd.ExcelFile', wraps=pd.ExcelFile) as excel_file:
+        with InvoiceWorkbook(INVOICE_PATH) as workbook:
+            sheet_names = workbook.sheet_names[1:]
+            sheet_args = [(sheet_name, sheet_name) for sheet_name in sheet_names]
+            parsed = map_invoice_sheets(parse_invoice_sheet, workbook, sheet_args, workers=1)
+            # 预览再次读取同一个工作表时使用缓存
+            assert workbook.sheet(sheet_names[0]) is read_invoice_sheet(workbook, sheet_names[0])
+    assert excel_file.call_count == 1
+
+    for sheet_name, sheet_df in zip(sheet_names[:3], parsed):
+        expected = parse_invoice_sheet(INVOICE_PATH, sheet_name, sheet_name)
+        pd.testing.assert_frame_equal(sheet_df, expected)
+        pd.testing.assert_frame_equal(InvoiceWorkbook(INVOICE_PATH).sheet(sheet_name),
+                                      pd.read_excel(INVOICE_PATH, sheet_name=sheet_name))
+
+    # bytes输入与文件路径的结果相同
+    with open(INVOICE_PATH, 'rb') as f:
+        in_memory = InvoiceWorkbook(f.read())
+    assert in_memory.sheet_names == InvoiceWorkbook(INVOICE_PATH).sheet_names
+    pd.testing.assert_frame_equal(in_memory.sheet(sheet_names[0]), pd.read_excel(INVOICE_PATH, sheet_name=sheet_names[0]))
+
+
+def test_parallel_processing_is_identical_to_serial():
+    """process_invoice_file 并行和逐个解析的输出逐字节相同"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    from streamlit_app import process_invoice_file, get_duty_rates
+
+    duty_rates, _, duty_index = get_duty_rates("input/duty_rate.xlsx")
+    serial_invoices, serial_new_items = process_invoice_file(INVOICE_PATH, duty_rates, duty_index, workers=1)
+    parallel_invoices, parallel_new_items = process_invoice_file(INVOICE_PATH, duty_rates, duty_index, workers=4)
+
+    assert not serial_invoices.empty
+    pd.testing.assert_frame_equal(serial_invoices, parallel_invoices)
+    pd.testing.assert_frame_equal(serial_new_items, parallel_new_items)
+    assert serial_invoices.to_csv(index=False).encode('utf-8') == parallel_invoices.to_csv(index=False).encode('utf-8')
+    assert serial_new_items.to_csv(index=False).encode('utf-8') == parallel_new_items.to_csv(index=False).encode('utf-8')
+
+
+def test_layout_detector_from_workbook():
+    """布局识别缓存由调用方通过工作簿会话传入；默认不写已知模板登记表，传入的登记表在并行解析时也会写入"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    invoice_path = os.path.abspath(INVOICE_PATH)
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            with InvoiceWorkbook(invoice_path) as workbook:
+                sheet_args = [(sheet_name, sheet_name) for sheet_name in workbook.sheet_names[1:]]
+                expected = map_invoice_sheets(parse_invoice_sheet, workbook, sheet_args, workers=1)
+                assert workbook.layout_detector.hits > 0
+            assert not os.path.exists('cache')
+
+            for workers in [1, 2]:
+                registry_path = os.path.join(tmp_dir, f'layouts{workers}.json')
+                detector = LayoutDetector(registry=LayoutRegistry(registry_path))
+                with InvoiceWorkbook(invoice_path, layout_detector=detector) as workbook:
+                    parsed = map_invoice_sheets(parse_invoice_sheet, workbook, sheet_args, workers=workers)
+                for sheet_df, expected_df in zip(parsed, expected):
+                    pd.testing.assert_frame_equal(sheet_df, expected_df)
+                assert LayoutRegistry(registry_path).load()
+        finally:
+            os.chdir(original_cwd)
+
+
+def test_add_file_suffixes():
+    """只有不同文件中重名的工作表才加文件后缀"""
+    assert add_file_suffixes([['A', 'B'], ['C']], ['input/processing_invoices1.xlsx', 'input/processing_invoices2.xlsx']) \
+        == [['A', 'B'], ['C']]
+    assert add_file_suffixes([['A', 'B'], ['B', 'C']], ['input/processing_invoices1.xlsx', 'input/processing_invoices2.xlsx']) \
+        == [['A', 'B'], ['B2', 'C']]
+    assert add_file_suffixes([['A'], ['A']], ['input/processing_invoices.xlsx', None]) == [['A'], ['A2']]
+    assert expand_invoice_paths(f"{INVOICE_PATH}, missing.xlsx") == [INVOICE_PATH, 'missing.xlsx']
+
+
+def test_multiple_invoice_files():
+    """多个发票文件合并处理的结果等于逐个处理后拼接，每个文件报告一次进度"""
+    if not os.path.exists(INVOICE_PATH) or not os.path.exists(SECOND_INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}, {SECOND_INVOICE_PATH}")
+        return
+
+    from streamlit_app import process_invoice_file, process_invoice_files, get_duty_rates
+
+    duty_rates, _, duty_index = get_duty_rates("input/duty_rate.xlsx")
+    separate = [process_invoice_file(path, duty_rates, duty_index) for path in [INVOICE_PATH, SECOND_INVOICE_PATH]]
+    # 两个文件都有PL工作表，第二个文件的PL加上文件后缀33
+    second_invoices, second_new_items = separate[1][0].copy(), separate[1][1].copy()
+    second_invoices['ID'] = second_invoices['ID'].str.replace(r'^PL_', 'PL33_', regex=True)
+    if not second_new_items.empty:
+        second_new_items['发票及项号'] = second_new_items['发票及项号'].str.replace(r'^PL_', 'PL33_', regex=True)
+    # 两个文件的税率列category取值不同，拼接后重新转换类型
+    expected_invoices = to_output_schema(pd.concat([separate[0][0], second_invoices], ignore_index=True))
+    expected_new_items = pd.concat([separate[0][1], second_new_items], ignore_index=True)
+
+    for workers in [1, 3]:
+        progress = []
+        invoices, new_items = process_invoice_files(
+            [INVOICE_PATH, SECOND_INVOICE_PATH], duty_rates, duty_index, workers=workers,
+            progress_callback=lambda done, total, workbook: progress.append((done, total, workbook.path))
+        )
+        assert [(done, total) for done, total, _ in progress] == [(1, 2), (2, 2)]
+        assert {path for _, _, path in progress} == {INVOICE_PATH, SECOND_INVOICE_PATH}
+        # 输出时不写行索引，只比较内容
+        pd.testing.assert_frame_equal(invoices.reset_index(drop=True), expected_invoices)
+        pd.testing.assert_frame_equal(new_items, expected_new_items)
+
+    # 同一批发票出现在两个文件中时，第二个文件的ID带文件后缀，两份都保留
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        copy_path = os.path.join(tmp_dir, 'processing_invoices2.xlsx')
+        shutil.copyfile(INVOICE_PATH, copy_path)
+        invoices, _ = process_invoice_files([INVOICE_PATH, copy_path], duty_rates, duty_index)
+    single = separate[0][0]
+    assert len(invoices) == 2 * len(single)
+    assert invoices['ID'].iloc[len(single):].tolist() == [
+        f"{sheet_id.rsplit('_', 1)[0]}2_{sheet_id.rsplit('_', 1)[1]}" for sheet_id in single['ID']
+    ]
+
+
+def test_parsed_sheet_matches_row_concat():
+    """按列收集生成的DataFrame与原来逐行 pd.concat 累积的结果相同（列顺序和类型都相同）"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    with InvoiceWorkbook(INVOICE_PATH) as workbook:
+        for sheet_name in workbook.sheet_names[1:6]:
+            sheet_df = parse_invoice_sheet(workbook, sheet_name, sheet_name)
+            assert list(sheet_df.columns) == INVOICE_SHEET_COLUMNS
+            expected = pd.DataFrame()
+            for row_data in sheet_df.to_dict('records'):
+                expected = pd.concat([expected, pd.DataFrame([row_data])], ignore_index=True)
+            pd.testing.assert_frame_equal(sheet_df, expected)
+
+
+def test_row_extraction_edge_cases():
+    """Item#的判断和各列文本与逐行处理时相同：前后空格、非ASCII数字、小数、0、数字和日期单元格"""
+    rows = [
+        ['Invoice No. 24HC001'], [], [],
+        ['Item No.', 'Model', 'P/N', 'Description', 'Origin', 'Qty (PCS)', 'Unit Price', 'Amount'],
+        ['Sl', None, None, 'Goods', None, None, 'USD', 'USD'],
+        [1, 'M', '1.2.3', 'RESISTOR-10R-5%', 'CN', 10, 0.5, 5.0],
+        [' 2 ', 'M', 'P2 ', '  LENS  ', 'CN', '20', ' 1.25'],
+        ['²', 'M', 'P3', 'IC', 'CN', 1, 1, 1],
+        [3.5, 'M', 'P4', 'X', 'CN', 1, 1, 1],
+        ['x', 'M', 'P5', 'X', 'CN', 1, 1, 1],
+        [None],
+        [4, None, None, 0, 'CN'],
+        [5, 'M', 12345, 'Φ-Ω cap (x)-1', 'CN', 7, datetime.datetime(2024, 1, 2)],
+    ]
+    workbook = Workbook()
+    sheet = workbook.create_sheet('CI-1')
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    expected = pd.DataFrame({
+        'Item#': ['1', '2', '²', '4', '5'],
+        'ID': ['1_1', '1_2', '1_²', '1_4', '1_5'],
+        'P/N': ['1.2.3', 'P2', 'P3', '', '12345'],
+        'Desc': ['RESISTOR10R5', 'LENS', 'IC', '', 'CAP(X)1'],
+        'Qty': ['10', '20', '1', '', '7'],
+        'Price': ['0.5', '1.25', '1', '', '2024-01-02 00:00:00'],
+        'Item_Name': ['RESISTOR', 'LENS', 'IC', '', 'Φ'],
+        'HSN': [''] * 5, 'BCD': [''] * 5, 'SWS': [''] * 5, 'IGST': [''] * 5,
+    })
+    for full in [False, True]:
+        with InvoiceWorkbook(buffer.getvalue()) as invoice_workbook:
+            if full:
+                invoice_workbook.sheet('CI-1')
+            pd.testing.assert_frame_equal(parse_invoice_sheet(invoice_workbook, 'CI-1', '1'), expected)
+
+
+if __name__ == "__main__":
+    test_map_invoice_sheets_keeps_sheet_order()
+    test_workbook_opened_once()
+    test_parallel_processing_is_identical_to_serial()
+    test_layout_detector_from_workbook()
+    test_add_file_suffixes()
+    test_multiple_invoice_files()
+    test_parsed_sheet_matches_row_concat()
+    test_row_extraction_edge_cases()
+    print("测试完成！")
@@ -6,7 +6,7 @@ import os
 sys.path.append('.')
 
 # 导入修复后的函数
-from streamlit_app import normalize_item_name, find_best_match
+from duty_matching import normalize_item_name, find_best_match
 
 def test_item_matching():
     """测试Item Name匹配功能的改进"""
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试持久化匹配缓存
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from duty_matching import DutyRateIndex
+from match_cache import MatchCache, shared_match_cache
+
+
+def test_cache_round_trip_and_no_match():
+    """缓存可以保存匹配结果和"没有匹配" """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = MatchCache(os.path.join(tmp_dir, "cache.sqlite3"))
+        cache.put_many("fp1", {"IC CHIP": "IC CHIP ARM", "UNKNOWN PART": None})
+
+        assert cache.get("fp1", "IC CHIP") == (True, "IC CHIP ARM")
+        assert cache.get("fp1", "UNKNOWN PART") == (True, None)
+        assert cache.get("fp1", "LED") == (False, None)
+        # 指纹不同则不会命中
+        assert cache.get("fp2", "IC CHIP") == (False, None)
+
+
+def test_cache_evicts_least_recently_used():
+    """超过容量时淘汰最久未使用的记录"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = MatchCache(os.path.join(tmp_dir, "cache.sqlite3"), max_entries=2)
+        cache.put("fp", "A", "KEY A")
+        cache.put("fp", "B", "KEY B")
+        # 访问A使其成为最近使用
+        assert cache.get("fp", "A") == (True, "KEY A")
+        cache.put("fp", "C", "KEY C")
+
+        assert len(cache) == 2
+        assert cache.get("fp", "B") == (False, None)
+        assert cache.get("fp", "A") == (True, "KEY A")
+
+
+def test_single_lookups_share_one_connection():
+    """逐个查询和写入使用同一个连接，不再每次重新连接；其它线程中也可以使用"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = MatchCache(os.path.join(tmp_dir, "cache.sqlite3"))
+        with mock.patch('match_cache.sqlite3.connect', wraps=sqlite3.connect) as connect:
+            for i in range(20):
+                cache.put("fp", f"ITEM {i}", f"KEY {i}")
+                assert cache.get("fp", f"ITEM {i}") == (True, f"KEY {i}")
+        assert connect.call_count == 0
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cache.get("fp", "ITEM 3")))
+        thread.start()
+        thread.join()
+        assert results == [(True, "KEY 3")]
+        cache.close()
+        assert len(MatchCache(cache.path)) == 20
+
+
+def test_shared_cache_per_file():
+    """同一缓存文件（相对路径或绝对路径）共用一个实例，不同文件各有一个"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cache.sqlite3")
+        cache = shared_match_cache(path)
+        original_cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            assert shared_match_cache("cache.sqlite3") is cache
+        finally:
+            os.chdir(original_cwd)
+        assert shared_match_cache(os.path.join(tmp_dir, "other.sqlite3")) is not cache
+
+
+def test_index_uses_cache_and_invalidates_on_change():
+    """税率表变化后指纹改变，缓存结果不再使用"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "cache.sqlite3")
+        duty_rates = {'IC MICROCONTROLLER ARM': {}, 'LED 0805 RED': {}}
+
+        duty_index = DutyRateIndex(duty_rates, match_cache=MatchCache(cache_path))
+        assert duty_index.match_items(['IC MICROCONTROLLER', 'UNKNOWN PART']) == {
+            'IC MICROCONTROLLER': 'IC MICROCONTROLLER ARM',
+            'UNKNOWN PART': None,
+        }
+
+        # 新的索引（相同税率表）直接从缓存取结果，不再打分
+        cached_index = DutyRateIndex(duty_rates, match_cache=MatchCache(cache_path))
+        cached_index._fuzzy_match = lambda item_name, normalized_item: 'SHOULD NOT BE CALLED'
+        assert cached_index.fingerprint == duty_index.fingerprint
+        assert cached_index.find_best_match('ic-microcontroller') == 'IC MICROCONTROLLER ARM'
+        assert cached_index.match_items(['UNKNOWN PART']) == {'UNKNOWN PART': None}
+
+        # 税率表新增项目后，旧的"没有匹配"不再生效
+        changed_rates = dict(duty_rates, **{'UNKNOWN PART NEW': {}})
+        changed_index = DutyRateIndex(changed_rates, match_cache=MatchCache(cache_path))
+        assert changed_index.fingerprint != duty_index.fingerprint
+        assert changed_index.find_best_match('UNKNOWN PART') == 'UNKNOWN PART NEW'
+
+
+if __name__ == "__main__":
+    test_cache_round_trip_and_no_match()
+    test_cache_evicts_least_recently_used()
+    test_single_lookups_share_one_connection()
+    test_shared_cache_per_file()
+    test_index_uses_cache_and_invalidates_on_change()
+    print("测试完成！")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试处理结果的输出类型、显示用文本转换，以及按列比较的差异报告
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from output_schema import TEXT_DTYPE, display_frame, to_output_schema
+
+COLUMNS = ['Item#', 'ID', 'P/N', 'Desc', 'Qty', 'Price', 'Item_Name', 'HSN', 'BCD', 'SWS', 'IGST']
+
+
+def text_frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS, dtype=object)
+
+
+def test_output_schema_types():
+    """数量和单价为float64（无法解析的文本保留原文），HSN去除多余的零，税率为category，"nan"/"none"文本视为空值"""
+    df = to_output_schema(text_frame([
+        ['1', 'CI_1', 'P1', 'RES', '10', '0.50', 'RES', '85423900.0', '10.0', '10', 'new item'],
+        ['2', 'CI_2', 'None', 'nan', '', 'N/A', '', '', '7.50', '', 'NaN'],
+        ['Invoice: 1', None, None, None, None, None, None, None, None, None, None],
+    ]))
+    assert df['ID'].dtype == TEXT_DTYPE and df['HSN'].dtype == TEXT_DTYPE
+    assert df['Qty'].dtype == 'float64' and df['Price'].dtype == object
+    assert all(isinstance(df[col].dtype, pd.CategoricalDtype) for col in ['BCD', 'SWS', 'IGST'])
+    assert df['Qty'].tolist()[0] == 10.0 and df['Price'].tolist()[:2] == [0.5, 'N/A'] and pd.isna(df['Price'][2])
+    assert to_output_schema(text_frame([['1'] * 11]))['Price'].dtype == 'float64'
+    assert df['HSN'].tolist() == ['85423900', '', '']
+    assert df['BCD'].tolist() == ['10', '7.5', ''] and df['IGST'].tolist() == ['new item', '', '']
+    assert df['P/N'].isna().tolist() == [False, True, True] and df['ID'].isna().tolist() == [False, False, True]
+
+    display = display_frame(df)
+    assert display.loc[0].tolist() == ['1', 'CI_1', 'P1', 'RES', '10', '0.5', 'RES', '85423900', '10', '10', 'new item']
+    assert display.loc[1, 'Price'] == 'N/A'
+    assert display.loc[2].tolist() == ['Invoice: 1'] + [''] * 10
+    assert display_frame(pd.DataFrame({'n': [1.25, np.nan, 3.0]}))['n'].tolist() == ['1.25', '', '3']
+
+
+def test_compare_typed_frames():
+    """按ID合并后逐列比较：单价按误差范围，数字和HSN忽略小数点后的零，空值显示为null"""
+    from streamlit_app import compare_excels
+
+    invoices = to_output_schema(text_frame([
+        ['1', 'CI_1', 'P1', 'RES', '10', '100', 'RES', '85423900', '10', '10', '18'],
+        ['2', 'CI_2', 'P2', 'CAP', '5', '100', 'CAP', '85322400', 'new item', 'new item', 'new item'],
+        ['3', 'CI_3', 'P3', 'LENS', '1', '', 'LENS', '90021900', '7.5', '10', '18'],
+        ['4', 'CI_4', 'P4', 'IC', '2', '1', 'IC', '85423100', '0', '0', '18'],
+    ]))
+    checklist = to_output_schema(text_frame([
+        ['Invoice: CI dt. 1', None, None, None, None, None, None, None, None, None, None],
+        ['4', 'CI_4', 'P4', 'IC', '2.0', '1.0', 'IC', '85423100.0', '0.0', '0.0', '18.0'],
+        ['1', 'CI_1', 'P1 ', 'RES', '10.0', '101', 'RES', '85423900.0', '10.0', '10.0', '18.0'],
+        ['2', 'CI_2', 'P2', 'CAP', '6', '102', 'CAP', '85322400', '10', '10', '18'],
+        ['3', 'CI_3', 'P3', '', '1.0', '50', 'LENS', '', '7.50', '10', '18'],
+    ]))
+
+    diff = compare_excels(invoices, checklist, 1.1)
+    assert diff.columns.tolist() == ['ID', 'P/N', 'Desc', 'HSN', 'BCD', 'SWS', 'IGST', 'Qty', 'Price']
+    assert diff['ID'].tolist() == ['CI_2', 'CI_3']
+    assert diff.loc[0].tolist() == ['CI_2', '', '', '', '10 -> new item', '10 -> new item', '18 -> new item',
+                                    '6 -> 5', '102 -> 100']
+    assert diff.loc[1].tolist() == ['CI_3', '', 'null -> LENS', 'null -> 90021900', '', '', '', '',
+                                    '50 -> null']
+    assert compare_excels(invoices, checklist, 2.5)['ID'].tolist() == ['CI_2', 'CI_3']
+    assert compare_excels(invoices.iloc[[0, 3]], checklist, 1.1).empty
+
+    # 无法解析为数字的数量按原文本比较，不会因为都不是数字而视为相同
+    invoices = to_output_schema(text_frame([
+        ['1', 'CI_1', 'P1', 'RES', 'N/A', '1', 'RES', '1', '1', '1', '1'],
+        ['2', 'CI_2', 'P2', 'CAP', 'abc', '1', 'CAP', '1', '1', '1', '1'],
+        ['3', 'CI_3', 'P3', 'IC', 'N/A', '1', 'IC', '1', '1', '1', '1'],
+        ['4', 'CI_4', 'P4', 'LED', '2', '1', 'LED', '1', '1', '1', '1'],
+    ]))
+    checklist = to_output_schema(text_frame([
+        ['1', 'CI_1', 'P1', 'RES', '', '1', 'RES', '1', '1', '1', '1'],
+        ['2', 'CI_2', 'P2', 'CAP', 'N/A', '1', 'CAP', '1', '1', '1', '1'],
+        ['3', 'CI_3', 'P3', 'IC', ' N/A', '1', 'IC', '1', '1', '1', '1'],
+        ['4', 'CI_4', 'P4', 'LED', '2.0', '1', 'LED', '1', '1', '1', '1'],
+    ]))
+    diff = compare_excels(invoices, checklist, 1.1)
+    assert diff['ID'].tolist() == ['CI_1', 'CI_2']
+    assert diff['Qty'].tolist() == ['null -> N/A', 'N/A -> abc']
+
+
+if __name__ == "__main__":
+    test_output_schema_types()
+    test_compare_typed_frames()
+    print("测试完成！")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据预览分页读取：各页只读取一页的行，拼接后与读取整个工作表相同
+"""
+
+import os
+import sys
+from unittest import mock
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_reader import read_excel
+from invoice_sheets import InvoiceWorkbook
+
+DUTY_RATE_PATH = "input/duty_rate.xlsx"
+INVOICE_PATH = "input/processing_invoices23.xlsx"
+CHECKLIST_PATH = "526input/Test1-Import_CheckList(SI_M_10911_24-25).CheckList.Data.xlsx"
+PAGE_ROWS = 40
+
+
+def read_pages(read_page, header_row=0):
+    from streamlit_app import preview_read_kwargs
+
+    pages = []
+    with mock.patch('streamlit_app.PREVIEW_PAGE_ROWS', PAGE_ROWS):
+        page = 1
+        while True:
+            page_df = read_page(preview_read_kwargs(page, header_row))
+            assert len(page_df) <= PAGE_ROWS
+            if page_df.empty:
+                break
+            pages.append(page_df)
+            page += 1
+    return pages
+
+
+def assert_pages_match(pages, expected):
+    """
+    各页的列推断类型可能与整个工作表不同（例如某一页全是空值），只比较值
+    """
+    actual = pd.concat(pages, ignore_index=True)
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    for col in range(expected.shape[1]):
+        for value, expected_value in zip(actual.iloc[:, col], expected.iloc[:, col]):
+            assert (pd.isna(value) and pd.isna(expected_value)) or value == expected_value, (value, expected_value)
+
+
+def test_preview_read_kwargs():
+    from streamlit_app import PREVIEW_PAGE_ROWS, preview_read_kwargs
+
+    assert preview_read_kwargs(1) == {'nrows': PREVIEW_PAGE_ROWS}
+    assert preview_read_kwargs(3) == {'nrows': PREVIEW_PAGE_ROWS, 'skiprows': range(1, 1 + 2 * PREVIEW_PAGE_ROWS)}
+    assert preview_read_kwargs(2, header_row=3) == {'nrows': PREVIEW_PAGE_ROWS, 'header': 3,
+                                                    'skiprows': range(4, 4 + PREVIEW_PAGE_ROWS)}
+
+
+def test_duty_rate_preview_pages():
+    """税率表分页读取与读取整个工作表相同"""
+    if not os.path.exists(DUTY_RATE_PATH):
+        print(f"⚠️ 税率文件不存在: {DUTY_RATE_PATH}")
+        return
+
+    pages = read_pages(lambda read_kwargs: read_excel(DUTY_RATE_PATH, **read_kwargs))
+    assert len(pages) > 1
+    assert_pages_match(pages, read_excel(DUTY_RATE_PATH))
+
+
+def test_invoice_preview_pages():
+    """发票工作表分页读取，只读取预览的页，不读取整个工作表"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    with InvoiceWorkbook(INVOICE_PATH) as workbook:
+        for sheet_name in workbook.sheet_names[1:4]:
+            pages = read_pages(lambda read_kwargs: workbook.sheet(sheet_name, **read_kwargs))
+            assert not workbook.is_loaded(sheet_name)
+            assert_pages_match(pages, read_excel(INVOICE_PATH, sheet_name=sheet_name))
+
+
+def test_checklist_preview_pages():
+    """核对清单分页读取（第4行是表头）与 read_excel(skiprows=3) 相同"""
+    if not os.path.exists(CHECKLIST_PATH):
+        print(f"⚠️ 核对清单不存在: {CHECKLIST_PATH}")
+        return
+
+    pages = read_pages(lambda read_kwargs: read_excel(CHECKLIST_PATH, **read_kwargs), header_row=3)
+    assert len(pages) > 1
+    assert_pages_match(pages, read_excel(CHECKLIST_PATH, skiprows=3))
+
+
+if __name__ == "__main__":
+    test_preview_read_kwargs()
+    test_duty_rate_preview_pages()
+    test_invoice_preview_pages()
+    test_checklist_preview_pages()
+    print("测试完成！")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试calamine和openpyxl读取引擎对所有示例文件读出完全相同的DataFrame，以及引擎的回退
+"""
+
+import glob
+import os
+import sys
+from unittest import mock
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import excel_reader
+from excel_reader import calamine_available, pop_engine_option, read_excel, resolve_engine
+from invoice_sheets import InvoiceWorkbook
+
+SAMPLE_DIRS = ["input", "526input", "test"]
+
+
+def sample_files():
+    return sorted(path for directory in SAMPLE_DIRS for path in glob.glob(os.path.join(directory, "*.xlsx")))
+
+
+def test_engines_read_identical_frames():
+    """input/、526input/、test/ 下每个文件的每个工作表，两种引擎的列、类型、索引和值都相同"""
+    if not calamine_available():
+        print("⚠️ 未安装 python-calamine，跳过")
+        return
+
+    files = sample_files()
+    assert files
+    for file_path in files:
+        for read_kwargs in [{}, {'skiprows': 3}]:
+            expected = pd.read_excel(file_path, sheet_name=None, engine='openpyxl', **read_kwargs)
+            actual = read_excel(file_path, engine='calamine', sheet_name=None, **read_kwargs)
+            assert list(actual) == list(expected), file_path
+            for sheet_name, expected_df in expected.items():
+                pd.testing.assert_frame_equal(actual[sheet_name], expected_df, obj=f"{file_path} [{sheet_name}]")
+
+
+def test_invoice_processing_identical_across_engines():
+    """process_invoice_file 用两种引擎的输出相同"""
+    invoice_path = "input/processing_invoices23.xlsx"
+    if not calamine_available() or not os.path.exists(invoice_path):
+        print("⚠️ 未安装 python-calamine 或发票文件不存在，跳过")
+        return
+
+    from streamlit_app import process_invoice_file, get_duty_rates
+
+    duty_rates, _, duty_index = get_duty_rates("input/duty_rate.xlsx")
+    results = [process_invoice_file(InvoiceWorkbook(invoice_path, engine=engine), duty_rates, duty_index)
+               for engine in ['openpyxl', 'calamine']]
+    pd.testing.assert_frame_equal(results[1][0], results[0][0])
+    pd.testing.assert_frame_equal(results[1][1], results[0][1])
+
+
+def test_engine_fallback():
+    """没有安装calamine或calamine读取失败时改用openpyxl"""
+    with mock.patch('excel_reader.calamine_available', return_value=False):
+        assert resolve_engine('auto') == 'openpyxl'
+        assert resolve_engine('calamine') == 'openpyxl'
+    assert resolve_engine('openpyxl') == 'openpyxl'
+
+    file_path = "input/processing_checklist.xlsx"
+    if calamine_available() and os.path.exists(file_path):
+        original_read_excel = pd.read_excel
+
+        def failing_calamine(source, engine=None, **kwargs):
+            if engine == 'calamine':
+                raise ValueError("unsupported workbook")
+            return original_read_excel(source, engine=engine, **kwargs)
+
+        with mock.patch.object(excel_reader.pd, 'read_excel', side_effect=failing_calamine):
+            df = read_excel(file_path, engine='calamine', skiprows=3)
+        pd.testing.assert_frame_equal(df, pd.read_excel(file_path, skiprows=3))
+
+
+def test_pop_engine_option():
+    assert pop_engine_option(['a.xlsx', '--engine=calamine', 'b.xlsx']) == ('calamine', ['a.xlsx', 'b.xlsx'])
+    assert pop_engine_option(['--engine', 'openpyxl', 'a.xlsx']) == ('openpyxl', ['a.xlsx'])
+    assert pop_engine_option(['a.xlsx']) == (None, ['a.xlsx'])
+
+
+if __name__ == "__main__":
+    test_engines_read_identical_frames()
+    test_invoice_processing_identical_across_engines()
+    test_engine_fallback()
+    test_pop_engine_option()
+    print("测试完成！")
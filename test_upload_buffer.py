@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试直接解析上传文件的内存数据：结果与从磁盘读取相同，留档在后台写入
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from checklist_reader import CHECKLIST_READ_KWARGS, ChecklistStream
+from excel_reader import read_excel
+from invoice_sheets import InvoiceWorkbook
+from upload_buffer import UploadBuffer
+from workbook_cache import ParsedWorkbookCache
+
+DUTY_RATE_PATH = "input/duty_rate.xlsx"
+CHECKLIST_PATH = "input/processing_checklist.xlsx"
+INVOICE_PATH = "input/processing_invoices23.xlsx"
+
+
+def read_bytes(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def test_upload_buffer_persists_in_background():
+    """留档写入与内存中的内容相同；getvalue() 与上传的BytesIO共用同一块内存"""
+    data = b'PK\x03\x04' + bytes(range(256)) * 64
+    uploaded = io.BytesIO(data)
+    assert uploaded.getvalue() is data
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'input', 'upload.xlsx')
+        upload = UploadBuffer('upload.xlsx', uploaded.getvalue(), path)
+        assert upload.data is data
+        assert upload.persist() is upload.persist()
+        assert upload.saved_path() == path
+        assert read_bytes(path) == data
+        assert not os.path.exists(path + '.tmp')
+
+    assert UploadBuffer('upload.xlsx', data).saved_path() is None
+    # 留档无法写入时不影响处理
+    with tempfile.NamedTemporaryFile() as not_a_dir:
+        upload = UploadBuffer('upload.xlsx', data, os.path.join(not_a_dir.name, 'upload.xlsx'))
+        upload.persist()
+        assert upload.saved_path() is None
+
+
+def test_read_from_memory_matches_file():
+    """bytes/memoryview 与文件路径读出的DataFrame相同，解析缓存按内容共用"""
+    if not os.path.exists(CHECKLIST_PATH):
+        print(f"⚠️ 核对清单不存在: {CHECKLIST_PATH}")
+        return
+
+    data = read_bytes(CHECKLIST_PATH)
+    expected = pd.read_excel(CHECKLIST_PATH, skiprows=3)
+    for source in [data, memoryview(data)]:
+        pd.testing.assert_frame_equal(read_excel(source, skiprows=3), expected)
+    pd.testing.assert_frame_equal(pd.concat(list(ChecklistStream(data, chunk_rows=5).iter_chunks())),
+                                  pd.read_excel(CHECKLIST_PATH, **CHECKLIST_READ_KWARGS))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ParsedWorkbookCache(tmp_dir)
+        assert cache.workbook_key(data) == cache.workbook_key(CHECKLIST_PATH)
+        cache.read_excel(CHECKLIST_PATH, skiprows=3)
+        assert cache.load_frame(cache.workbook_key(data), skiprows=3) is not None
+
+
+def test_pipeline_from_upload_matches_file():
+    """税率、核对清单和发票处理直接使用上传的数据，输出与从磁盘读取相同"""
+    if not all(os.path.exists(path) for path in [DUTY_RATE_PATH, CHECKLIST_PATH, INVOICE_PATH]):
+        print("⚠️ 输入文件不存在，跳过")
+        return
+
+    from streamlit_app import get_duty_rates, process_checklist, process_invoice_files
+
+    duty_rates, duty_df, duty_index = get_duty_rates(DUTY_RATE_PATH)
+    duty_upload = UploadBuffer('duty_rate.xlsx', read_bytes(DUTY_RATE_PATH))
+    upload_rates, upload_df, _ = get_duty_rates(duty_upload.data, duty_upload.digest)
+    assert upload_rates == duty_rates
+    pd.testing.assert_frame_equal(upload_df, duty_df)
+
+    checklist_upload = UploadBuffer('processing_checklist.xlsx', read_bytes(CHECKLIST_PATH))
+    expected_checklist = process_checklist(CHECKLIST_PATH)
+    for chunk_rows in [None, 5]:
+        pd.testing.assert_frame_equal(
+            process_checklist(checklist_upload.data, chunk_rows=chunk_rows, content_digest=checklist_upload.digest),
+            expected_checklist
+        )
+
+    invoice_upload = UploadBuffer('processing_invoices23.xlsx', read_bytes(INVOICE_PATH), INVOICE_PATH)
+    expected_invoices, expected_new_items = process_invoice_files([INVOICE_PATH], duty_rates, duty_index)
+    with InvoiceWorkbook(invoice_upload.data, digest=invoice_upload.digest, name=invoice_upload.path) as workbook:
+        invoices, new_items = process_invoice_files([workbook], duty_rates, duty_index)
+    pd.testing.assert_frame_equal(invoices, expected_invoices)
+    pd.testing.assert_frame_equal(new_items, expected_new_items)
+
+
+if __name__ == "__main__":
+    test_upload_buffer_persists_in_background()
+    test_read_from_memory_matches_file()
+    test_pipeline_from_upload_matches_file()
+    print("测试完成！")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Excel解析结果缓存
+"""
+
+import datetime
+import decimal
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from invoice_sheets import InvoiceWorkbook
+from workbook_cache import ParsedWorkbookCache, frame_to_table, frames_identical, table_to_frame
+
+INVOICE_PATH = "input/processing_invoices23.xlsx"
+CHECKLIST_PATH = "input/processing_checklist.xlsx"
+
+
+def test_frame_round_trip():
+    """混合类型的object列、非字符串列名和各种数据类型都能原样读回"""
+    df = pd.DataFrame({
+        'Jeeyoo International': ['Invoice No.', 1, 2.5, np.nan, datetime.datetime(2024, 12, 27)],
+        'Unnamed: 1': ['a', True, None, datetime.time(9, 30), pd.Timestamp('2025-01-02 08:00')],
+        2024: [1.0, 2.0, np.nan, 4.0, 5.0],
+        'Qty': [1, 2, 3, 4, 5],
+        'Date': pd.to_datetime(['2024-12-27', None, '2025-01-02', '2025-01-03', None]),
+        'Flag': [True, False, True, True, False],
+    })
+    back = table_to_frame(frame_to_table(df))
+    assert frames_identical(back, df)
+    pd.testing.assert_frame_equal(back, df)
+    assert back.iloc[1, 0] == 1 and type(back.iloc[1, 0]) is int
+    assert [type(value) for value in back['Unnamed: 1']] == [str, bool, type(None), datetime.time, pd.Timestamp]
+
+    # 元数据为JSON，object列存为文本列和类型标记列
+    table = frame_to_table(df)
+    assert json.loads(table.schema.metadata[b'parsed_workbook'])['text_columns'] == ['c0', 'c1']
+    assert str(table.schema.field('c0').type) == 'large_string'
+
+
+def test_unsupported_cells_are_parsed_again():
+    """object列中有不能按类型标记保存的值时不缓存，每次重新解析"""
+    df = pd.DataFrame({'Desc': ['RESISTOR', decimal.Decimal('1.5')]})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ParsedWorkbookCache(os.path.join(tmp_dir, 'cache'))
+        with mock.patch('workbook_cache.read_excel', return_value=df) as read_excel:
+            assert cache.read_excel(b'workbook', content_digest='digest') is df
+            assert cache.read_excel(b'workbook', content_digest='digest') is df
+        assert read_excel.call_count == 2
+        assert cache.load_frame(cache.workbook_key(b'workbook', 'digest')) is None
+        assert not os.path.exists(os.path.join(tmp_dir, 'cache'))
+
+
+def test_read_excel_uses_cache():
+    """同一内容的文件第二次读取时不再解析Excel，结果与 pd.read_excel 相同"""
+    if not os.path.exists(CHECKLIST_PATH):
+        print(f"⚠️ 核对清单不存在: {CHECKLIST_PATH}")
+        return
+
+    expected = pd.read_excel(CHECKLIST_PATH, skiprows=3)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ParsedWorkbookCache(os.path.join(tmp_dir, 'cache'))
+        pd.testing.assert_frame_equal(cache.read_excel(CHECKLIST_PATH, skiprows=3), expected)
+
+        # 重新上传的相同文件（路径不同、内容相同）也命中缓存
+        uploaded_path = os.path.join(tmp_dir, 'uploaded.xlsx')
+        shutil.copyfile(CHECKLIST_PATH, uploaded_path)
+        with mock.patch('workbook_cache.pd.read_excel') as read_excel:
+            cached = cache.read_excel(uploaded_path, skiprows=3)
+        assert read_excel.call_count == 0
+        pd.testing.assert_frame_equal(cached, expected)
+
+        # 读取参数不同时分别缓存
+        pd.testing.assert_frame_equal(cache.read_excel(uploaded_path), pd.read_excel(CHECKLIST_PATH))
+
+
+def test_invoice_workbook_reads_through_cache():
+    """工作表全部缓存后，新的会话不打开Excel文件"""
+    if not os.path.exists(INVOICE_PATH):
+        print(f"⚠️ 发票文件不存在: {INVOICE_PATH}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ParsedWorkbookCache(os.path.join(tmp_dir, 'cache'))
+        with InvoiceWorkbook(INVOICE_PATH, cache=cache) as workbook:
+            sheet_names = workbook.sheet_names[1:4]
+            parsed = [workbook.sheet(sheet_name) for sheet_name in sheet_names]
+
+        with mock.patch('invoice_sheets.pd.ExcelFile') as excel_file:
+            with InvoiceWorkbook(INVOICE_PATH, cache=cache) as workbook:
+                assert workbook.sheet_names[1:4] == sheet_names
+                cached = [workbook.sheet(sheet_name) for sheet_name in sheet_names]
+        assert excel_file.call_count == 0
+
+    for sheet_name, parsed_df, cached_df in zip(sheet_names, parsed, cached):
+        pd.testing.assert_frame_equal(cached_df, parsed_df)
+        pd.testing.assert_frame_equal(cached_df, pd.read_excel(INVOICE_PATH, sheet_name=sheet_name))
+
+
+def test_cache_evicts_least_recently_used():
+    """缓存总大小超过上限时删除最久未使用的文件"""
+    df = pd.DataFrame({'Item Name': ['A' * 100] * 200})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ParsedWorkbookCache(tmp_dir)
+        cache.save_frame('k1', 0, df)
+        cache.save_frame('k2', 0, df)
+        size = os.path.getsize(cache._frame_path('k1', 0, {}))
+        os.utime(cache._frame_path('k1', 0, {}), (100, 100))
+        os.utime(cache._frame_path('k2', 0, {}), (200, 200))
+
+        cache.max_bytes = size * 2
+        cache.save_frame('k3', 0, df)
+
+        assert cache.load_frame('k1', 0) is None
+        pd.testing.assert_frame_equal(cache.load_frame('k2', 0), df)
+        pd.testing.assert_frame_equal(cache.load_frame('k3', 0), df)
+
+
+if __name__ == "__main__":
+    test_frame_round_trip()
+    test_unsupported_cells_are_parsed_again()
+    test_read_excel_uses_cache()
+    test_invoice_workbook_reads_through_cache()
+    test_cache_evicts_least_recently_used()
+    print("测试完成！")
@@ -0,0 +1,63 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# 上传文件的留档在后台线程中依次写入，不阻塞解析
+_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-persist')
+
+
+def write_file(path, data):
+    """
+    把内存中的文件内容写入path（先写临时文件再替换，不会留下写了一半的文件）
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    logging.info(f"File saved successfully: {path}")
+
+
+class UploadBuffer:
+    """
+    上传文件的内存缓冲区：数据预览和处理都直接解析这份数据，不再保存后从磁盘重新读取
+
+    data为文件内容（bytes或memoryview）。UploadedFile.getvalue() 返回的bytes与上传控件共用同一块内存，
+    不会复制；getbuffer() 会使上传的BytesIO复制一份。
+    path为留档位置，persist() 在后台线程中写入；digest为内容的sha256，用作解析缓存和快照的key。
+    upload_id为上传控件的文件ID，页面刷新时用来复用同一次上传的缓冲区。
+    """
+
+    def __init__(self, name, data, path=None, upload_id=None):
+        self.name = name
+        self.data = data
+        self.path = path
+        self.upload_id = upload_id
+        self.digest = hashlib.sha256(data).hexdigest()
+        self._saved = None
+
+    def __repr__(self):
+        return f"UploadBuffer({self.name}, {memoryview(self.data).nbytes} bytes)"
+
+    def persist(self):
+        """
+        在后台保存留档（只保存一次），没有留档位置时不保存
+        """
+        if self.path is not None and self._saved is None:
+            self._saved = _persist_executor.submit(write_file, self.path, self.data)
+        return self._saved
+
+    def saved_path(self):
+        """
+        等待留档写完并返回文件路径；没有留档或写入失败时返回None
+        """
+        if self._saved is None:
+            return None
+        try:
+            self._saved.result()
+        except OSError as e:
+            logging.warning(f"Could not save uploaded file {self.path}: {str(e)}")
+            return None
+        return self.path
@@ -0,0 +1,272 @@
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from duty_snapshot import content_sha256
+from excel_reader import engine_version, read_excel, source_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow随streamlit一起安装，缺失时只是不使用缓存
+    pa = None
+    feather = None
+
+# 解析缓存默认位置及大小上限
+DEFAULT_PARSE_CACHE_DIR = os.path.join("cache", "parsed_workbooks")
+DEFAULT_PARSE_CACHE_BYTES = 512 * 1024 * 1024
+
+# 缓存格式变化时修改此版本号；pandas或读取引擎（calamine/openpyxl）的版本变化时解析结果可能不同，
+# 也会使旧缓存失效
+PARSE_CACHE_VERSION = "2"
+PARSER_VERSION = f"{PARSE_CACHE_VERSION}:pandas-{pd.__version__}"
+
+_METADATA_KEY = b'parsed_workbook'
+
+# object列中可以保存的单元格类型：类型标记、编码为文本和从文本还原的函数。
+# 按类型精确匹配（bool不会被当作int），列中有其它类型的值时不缓存该工作表，每次重新解析
+CELL_TYPES = {
+    str: ('str', str, str),
+    int: ('int', str, int),
+    float: ('float', repr, float),
+    bool: ('bool', str, lambda text: text == 'True'),
+    datetime.datetime: ('datetime', datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    pd.Timestamp: ('timestamp', pd.Timestamp.isoformat, pd.Timestamp),
+    datetime.time: ('time', datetime.time.isoformat, datetime.time.fromisoformat),
+    type(None): ('none', lambda value: None, lambda text: None),
+}
+CELL_DECODERS = {tag: decode for tag, _, decode in CELL_TYPES.values()}
+CELL_TAGS = list(CELL_DECODERS)
+
+
+def encode_cell(value):
+    """
+    单元格值编码为 (类型标记, 文本)，不支持的类型抛出ValueError
+    """
+    if type(value) not in CELL_TYPES:
+        raise ValueError(f"cell type {type(value).__name__} is not cached")
+    tag, encode, _ = CELL_TYPES[type(value)]
+    return tag, encode(value)
+
+
+def decode_cell(tag, text):
+    return CELL_DECODERS[tag](text)
+
+
+def frame_to_table(df):
+    """
+    把 read_excel 的结果编码为Arrow表
+
+    数值、字符串、日期列直接存为Arrow列；混有不同类型的object列（发票表头和数据在同一列时很常见）
+    存为文本列（large_string）加上每个单元格的类型标记列（int8），读回时按标记还原原来的类型。
+    列名和行索引以JSON保存在表的元数据中。
+    """
+    if not isinstance(df.index, pd.RangeIndex):
+        raise ValueError("only frames with a RangeIndex are cached")
+
+    arrays = {}
+    text_columns = []
+    for position in range(df.shape[1]):
+        name = f"c{position}"
+        series = df.iloc[:, position]
+        if series.dtype == object:
+            tags, texts = zip(*map(encode_cell, series)) if len(series) else ((), ())
+            arrays[name] = pa.array(texts, type=pa.large_string())
+            arrays[f"{name}.type"] = pa.array([CELL_TAGS.index(tag) for tag in tags], type=pa.int8())
+            text_columns.append(name)
+        else:
+            arrays[name] = pa.Array.from_pandas(series.reset_index(drop=True))
+
+    table = pa.table(arrays) if arrays else pa.table({})
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps({
+        'columns': [encode_cell(label) for label in df.columns],
+        'columns_dtype': str(df.columns.dtype),
+        'index': [df.index.start, df.index.stop, df.index.step],
+        'text_columns': text_columns,
+    }, ensure_ascii=False).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+
+def table_to_frame(table):
+    """
+    frame_to_table 的逆过程
+    """
+    layout = json.loads(table.schema.metadata[_METADATA_KEY])
+    index = pd.RangeIndex(*layout['index'])
+    text_columns = set(layout['text_columns'])
+
+    columns = []
+    for position in range(len(layout['columns'])):
+        name = f"c{position}"
+        if name in text_columns:
+            tags = table.column(f"{name}.type").to_pylist()
+            texts = table.column(name).to_pylist()
+            values = [decode_cell(CELL_TAGS[tag], text) for tag, text in zip(tags, texts)]
+            columns.append(pd.Series(values, dtype=object, index=index))
+        else:
+            columns.append(table.select([name]).to_pandas().iloc[:, 0].set_axis(index))
+
+    df = pd.concat(columns, axis=1) if columns else pd.DataFrame(index=index)
+    df.columns = pd.Index([decode_cell(tag, text) for tag, text in layout['columns']],
+                          dtype=layout['columns_dtype'])
+    return df
+
+
+def frames_identical(df, other):
+    return (df.columns.equals(other.columns) and df.columns.dtype == other.columns.dtype
+            and df.index.equals(other.index)
+            and df.dtypes.equals(other.dtypes) and df.equals(other))
+
+
+class ParsedWorkbookCache:
+    """
+    Excel解析结果缓存（Arrow IPC / Feather，不压缩）
+
+    key 由文件内容的sha256、读取引擎和解析器版本决定，同一文件（例如重新上传的相同文件）只解析一次。
+    每个工作表按读取参数（sheet_name、skiprows等）单独保存为 <key>.arrow，
+    工作表名称列表保存为 <workbook key>.sheets.json。
+    只缓存读回后与原结果完全相同的DataFrame；总大小超过上限时删除最久未使用的文件。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PARSE_CACHE_DIR, max_bytes=DEFAULT_PARSE_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = pa is not None
+
+    def workbook_key(self, file_path, content_digest=None, engine=None):
+        """
+        根据文件内容计算工作簿key，文件无法读取或缓存不可用时返回None
+        file_path也可以是内存中的文件内容（bytes/memoryview）
+        """
+        if not self.enabled:
+            return None
+
+        if content_digest is None:
+            try:
+                content_digest = content_sha256(file_path)
+            except OSError as e:
+                logging.warning(f"Could not hash workbook {source_name(file_path)}: {str(e)}")
+                return None
+        return hashlib.sha256(
+            f"{PARSER_VERSION}:{engine_version(engine)}:{content_digest}".encode('utf-8')
+        ).hexdigest()
+
+    def _frame_path(self, key, sheet_name, read_kwargs):
+        frame_key = hashlib.sha256(
+            f"{key}:{sheet_name!r}:{sorted(read_kwargs.items())!r}".encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.cache_dir, f"{frame_key}.arrow")
+
+    def _sheet_names_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.sheets.json")
+
+    def load_sheet_names(self, key):
+        if key is None:
+            return None
+
+        path = self._sheet_names_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                sheet_names = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return sheet_names
+
+    def save_sheet_names(self, key, sheet_names):
+        if key is None:
+            return
+
+        path = self._sheet_names_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(list(sheet_names), f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logging.warning(f"Sheet names not cached: {str(e)}")
+
+    def load_frame(self, key, sheet_name=0, **read_kwargs):
+        """
+        读取缓存的工作表，没有缓存时返回None
+        """
+        if key is None:
+            return None
+
+        path = self._frame_path(key, sheet_name, read_kwargs)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            df = table_to_frame(feather.read_table(path, memory_map=True))
+            # 记录使用时间，淘汰时保留最近使用的缓存
+            os.utime(path)
+        except (OSError, KeyError, IndexError, ValueError, pa.ArrowException) as e:
+            logging.warning(f"Could not load parsed sheet {sheet_name!r} from cache: {str(e)}")
+            return None
+
+        logging.info(f"Loaded parsed sheet {sheet_name!r} from cache {path}: {df.shape}")
+        return df
+
+    def save_frame(self, key, sheet_name, df, **read_kwargs):
+        """
+        写入缓存；无法原样读回的DataFrame不缓存，不影响处理
+        """
+        if key is None:
+            return
+
+        path = self._frame_path(key, sheet_name, read_kwargs)
+        try:
+            table = frame_to_table(df)
+            if not frames_identical(table_to_frame(table), df):
+                raise ValueError("frame does not round-trip exactly")
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写临时文件再替换，避免读到写了一半的缓存
+            feather.write_feather(table, path + '.tmp', compression='uncompressed')
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError, pa.ArrowException) as e:
+            logging.warning(f"Parsed sheet {sheet_name!r} not cached: {str(e)}")
+            return
+
+        self._evict()
+
+    def read_excel(self, file_path, sheet_name=0, content_digest=None, **read_kwargs):
+        """
+        带缓存的 pd.read_excel(file_path, sheet_name=sheet_name, **read_kwargs)，使用当前设置的读取引擎
+        file_path也可以是内存中的文件内容，例如上传的文件（不需要先保存到磁盘）
+        """
+        key = self.workbook_key(file_path, content_digest)
+        df = self.load_frame(key, sheet_name, **read_kwargs)
+        if df is None:
+            df = read_excel(file_path, sheet_name=sheet_name, **read_kwargs)
+            self.save_frame(key, sheet_name, df, **read_kwargs)
+        return df
+
+    def _evict(self):
+        paths = glob.glob(os.path.join(self.cache_dir, "*.arrow")) + \
+            glob.glob(os.path.join(self.cache_dir, "*.sheets.json"))
+        entries = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            logging.info(f"Removed least recently used parsed sheet cache {path}")